@@ -0,0 +1,89 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Compare looking up one extracted function among many when they are stored as a sequence of
+pickled blobs in one file, which is unpickled in order until the function is found, and when
+they are stored in a PayloadArchive.
+
+Run with ``python benchmarks/bench_archive.py``.
+"""
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from code_extractor import PayloadArchive, load_code  # noqa: E402
+from code_extractor.extracted_code import _ExtractedCode  # noqa: E402
+
+ENTRIES = 20000
+LOOKUPS = 200
+
+
+def make_payload(index: int) -> bytes:
+    extracted_code = _ExtractedCode(get_requirements=False)
+    extracted_code.name = f"function_{index}"
+    extracted_code.code = (
+        f"def function_{index}(value):\n    return helper(value) + {index}\n"
+    )
+    extracted_code.imports = {"import json"}
+    extracted_code.dependencies = {
+        "def helper(value):\n    return len(json.dumps(value))\n"
+    }
+    return extracted_code.to_bytes()
+
+
+def main() -> None:
+    directory = tempfile.mkdtemp()
+    payloads = [make_payload(index) for index in range(ENTRIES)]
+    blobs_path = os.path.join(directory, "blobs.pickle")
+    with open(blobs_path, "wb") as file:
+        for index, payload in enumerate(payloads):
+            pickle.dump((f"function_{index}", payload), file)
+    archive = PayloadArchive(os.path.join(directory, "archive"))
+    start = time.perf_counter()
+    archive.put_many(
+        (f"function_{index}", payload) for index, payload in enumerate(payloads)
+    )
+    print(
+        f"archive of {ENTRIES} entries written in {time.perf_counter() - start:.2f} s"
+    )
+    targets = [random.randrange(ENTRIES) for _ in range(LOOKUPS)]
+
+    start = time.perf_counter()
+    for target in targets:
+        with open(blobs_path, "rb") as file:
+            while True:
+                name, payload = pickle.load(file)
+                if name == f"function_{target}":
+                    break
+        assert load_code(payload)([]) == 2 + target
+    sequential = (time.perf_counter() - start) / LOOKUPS
+
+    start = time.perf_counter()
+    for target in targets:
+        assert archive.load(f"function_{target}")([]) == 2 + target
+    indexed = (time.perf_counter() - start) / LOOKUPS
+
+    print(f"{'sequential blobs':>18} {sequential * 1e3:>9.3f} ms per lookup")
+    print(f"{'archive':>18} {indexed * 1e3:>9.3f} ms per lookup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Measure extract_code throughput as the number of extracting threads grows.
+
+Run with ``python benchmarks/bench_concurrent_extraction.py``.
+"""
+import os
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from code_extractor import extract_code  # noqa: E402
+
+EXTRACTIONS = 400
+THREAD_COUNTS = [1, 2, 4, 8, 16]
+
+
+class Base:
+    def base_method(self):
+        return 1
+
+
+class Derived(Base):
+    def derived_method(self):
+        return helper(self.base_method())
+
+
+def helper(value):
+    return value + 1
+
+
+def target():
+    return Derived().derived_method()
+
+
+def run(threads: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for _ in executor.map(lambda _: extract_code(target), range(EXTRACTIONS)):
+            pass
+    return EXTRACTIONS / (time.perf_counter() - start)
+
+
+def main() -> None:
+    extract_code(target)
+    print(f"{'threads':>8} {'extractions/s':>14}")
+    for threads in THREAD_COUNTS:
+        print(f"{threads:>8} {run(threads):>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Compare eager and lazy load_code latency as the number of captured dependencies grows
+while the loaded function only uses one of them.
+
+Run with ``python benchmarks/bench_lazy_loading.py``.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from code_extractor import load_code  # noqa: E402
+from code_extractor.extracted_code import _ExtractedCode  # noqa: E402
+
+REPEATS = 20
+SIZES = [10, 100, 1000]
+
+
+def make_payload(size: int) -> str:
+    extracted_code = _ExtractedCode(get_requirements=False)
+    extracted_code.name = "target"
+    extracted_code.code = "def target():\n    return helper_0(1)\n"
+    extracted_code.imports = {"import decimal", "import email.mime.text"}
+    extracted_code.dependencies = {
+        f"def helper_{i}(value):\n" f"    return [value * {i}, decimal.Decimal({i})]\n"
+        for i in range(size)
+    }
+    return extracted_code.to_string(freeze_code=False)
+
+
+def main() -> None:
+    print(f"{'size':>6} {'eager ms':>10} {'lazy ms':>10}")
+    for size in SIZES:
+        payload = make_payload(size)
+        timings = [
+            min(
+                timeit.repeat(
+                    lambda: load_code(payload, lazy=lazy)(), number=REPEATS, repeat=3
+                )
+            )
+            / REPEATS
+            * 1e3
+            for lazy in [False, True]
+        ]
+        print(f"{size:>6} {timings[0]:>10.3f} {timings[1]:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
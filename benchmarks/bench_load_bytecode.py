@@ -0,0 +1,66 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Compare load_code with and without embedded bytecode on large dependency bundles.
+
+Run with ``python benchmarks/bench_load_bytecode.py``.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from code_extractor import load_code  # noqa: E402
+from code_extractor.extracted_code import _ExtractedCode  # noqa: E402
+
+REPEATS = 20
+SIZES = [10, 100, 1000]
+
+
+def make_payload(size: int, embed_bytecode: bool) -> bytes:
+    extracted_code = _ExtractedCode(get_requirements=False)
+    extracted_code.name = "target"
+    extracted_code.code = "def target():\n    return helper_0(1)\n"
+    extracted_code.dependencies = {
+        f"def helper_{i}(value):\n"
+        f"    total = 0\n"
+        f"    for index in range(value):\n"
+        f"        total += index * {i}\n"
+        f"    return [total, {{'index': {i}}}]\n"
+        for i in range(size)
+    }
+    if embed_bytecode:
+        extracted_code.embed_bytecode()
+    return extracted_code.to_bytes()
+
+
+def main() -> None:
+    print(f"{'size':>6} {'source ms':>10} {'bytecode ms':>12}")
+    for size in SIZES:
+        timings = []
+        for embed_bytecode in [False, True]:
+            payload = make_payload(size, embed_bytecode)
+            timings.append(
+                min(timeit.repeat(lambda: load_code(payload), number=REPEATS))
+                / REPEATS
+                * 1e3
+            )
+        print(f"{size:>6} {timings[0]:>10.3f} {timings[1]:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Measure sending a function defined in a module created at runtime, which worker processes
+cannot import by name, to a process pool: the first round trip extracts and loads its code,
+later ones reuse the payload extracted by the sender and the object loaded by the worker.
+
+Run with ``python benchmarks/bench_multiprocessing_reduction.py``.
+"""
+import multiprocessing
+import os
+import pickle
+import sys
+import tempfile
+import time
+import types
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.reduction import ForkingPickler
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from code_extractor import (  # noqa: E402
+    disable_multiprocessing_reduction,
+    enable_multiprocessing_reduction,
+)
+
+MODULE = """
+import json
+import math
+
+WEIGHTS = [i / 7 for i in range(64)]
+
+
+def score(values):
+    return json.dumps(sum(math.sqrt(abs(v)) * w for v, w in zip(values, WEIGHTS)))
+"""
+SUBMISSIONS = 2000
+
+
+def _runtime_module(directory: str) -> types.ModuleType:
+    path = os.path.join(directory, "runtime_module.py")
+    with open(path, "w") as file:
+        file.write(MODULE)
+    module = types.ModuleType("runtime_module")
+    module.__file__ = path
+    sys.modules[module.__name__] = module
+    exec(compile(MODULE, path, "exec"), module.__dict__)
+    return module
+
+
+def main() -> None:
+    enable_multiprocessing_reduction()
+    with tempfile.TemporaryDirectory() as directory:
+        score = _runtime_module(directory).score
+        start = time.perf_counter()
+        payload = ForkingPickler.dumps(score)
+        pickle.loads(payload)
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(SUBMISSIONS):
+            pickle.loads(ForkingPickler.dumps(score))
+        repeated = (time.perf_counter() - start) / SUBMISSIONS
+        print(f"payload: {len(payload)} bytes")
+        print(f"first round trip:    {first * 1e3:8.3f} ms")
+        print(f"repeated round trip: {repeated * 1e3:8.3f} ms")
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(2, mp_context=context) as executor:
+            list(executor.map(score, [[1.0]] * 4))
+            start = time.perf_counter()
+            list(executor.map(score, [[float(i)] * 64 for i in range(SUBMISSIONS)]))
+            elapsed = time.perf_counter() - start
+        print(f"pool submissions:    {elapsed / SUBMISSIONS * 1e3:8.3f} ms each")
+    disable_multiprocessing_reduction()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Compare the size and the encoding/decoding speed of the JSON and binary payload formats,
+with and without compression.
+
+Run with ``python benchmarks/bench_payload_format.py``.
+"""
+import os
+import pickle
+import sys
+import timeit
+
+from typing import Callable, Dict, Union
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from code_extractor.compression import _compress  # noqa: E402
+from code_extractor.extracted_code import _ExtractedCode  # noqa: E402
+
+REPEATS = 50
+ROUNDS = 5
+SIZES = [10, 100, 1000]
+
+
+def make_payload(size: int) -> _ExtractedCode:
+    extracted_code = _ExtractedCode(get_requirements=True)
+    extracted_code.name = "target"
+    extracted_code.code = "def target():\n    return helper_0()\n"
+    extracted_code.imports = {f"import package_{i} as alias_{i}" for i in range(size)}
+    extracted_code.dependencies = {
+        f'def helper_{i}():\n    """Return "{i}"."""\n    return alias_{i}.value\n'
+        for i in range(size)
+    }
+    return extracted_code
+
+
+def timed(function: Callable[[], object]) -> float:
+    return min(timeit.repeat(function, number=REPEATS, repeat=ROUNDS)) / REPEATS * 1e3
+
+
+def encoders(
+    extracted_code: _ExtractedCode,
+) -> Dict[str, Callable[[], Union[str, bytes]]]:
+    return {
+        "json": extracted_code.to_string,
+        "binary": extracted_code.to_bytes,
+        "json+zlib": lambda: _compress(
+            extracted_code.to_string().encode("utf-8"), "zlib"
+        ),
+        "bin+zlib": lambda: _compress(extracted_code.to_bytes(), "zlib"),
+        "bin+lzma": lambda: _compress(extracted_code.to_bytes(), "lzma"),
+    }
+
+
+def main() -> None:
+    print(
+        f"{'size':>6} {'format':>10} {'bytes':>10} {'pickled':>10} "
+        f"{'encode ms':>10} {'decode ms':>10}"
+    )
+    for size in SIZES:
+        extracted_code = make_payload(size)
+        for name, encode in encoders(extracted_code).items():
+            payload = encode()
+            length = len(
+                payload.encode("utf-8") if isinstance(payload, str) else payload
+            )
+            print(
+                f"{size:>6} {name:>10} {length:>10} {len(pickle.dumps(payload)):>10} "
+                f"{timed(encode):>10.3f} "
+                f"{timed(lambda: _ExtractedCode.from_string(payload)):>10.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
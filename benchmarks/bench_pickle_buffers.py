@@ -0,0 +1,60 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Compare pickling a function whose globals hold a large lookup table as source code
+(protocol 4), as an in-band pickle buffer and as an out-of-band pickle buffer (protocol 5).
+
+Run with ``python benchmarks/bench_pickle_buffers.py``.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from code_extractor.pickle import dumps, loads  # noqa: E402
+
+TABLE = os.urandom(16 * 1024 * 1024)
+
+
+def lookup(index: int) -> int:
+    return TABLE[index]
+
+
+def main() -> None:
+    print(f"{'mode':>12} {'pickle MiB':>11} {'dumps ms':>9} {'loads ms':>9}")
+    for mode in ["source", "in-band", "out-of-band"]:
+        buffers: list = []
+        start = time.perf_counter()
+        if mode == "source":
+            string = dumps(lookup, protocol=4)
+        elif mode == "in-band":
+            string = dumps(lookup, protocol=5)
+        else:
+            string = dumps(lookup, protocol=5, buffer_callback=buffers.append)
+        dumps_time = time.perf_counter() - start
+        start = time.perf_counter()
+        loaded = loads(string, buffers=buffers if mode == "out-of-band" else None)
+        loads_time = time.perf_counter() - start
+        assert loaded(12345) == TABLE[12345]
+        print(
+            f"{mode:>12} {len(string) / 2 ** 20:>11.2f}"
+            f" {dumps_time * 1e3:>9.1f} {loads_time * 1e3:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
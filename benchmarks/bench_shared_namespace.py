@@ -0,0 +1,74 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Compare the memory retained by many loaded functions with identical imports and dependencies
+when each load gets its own namespace and when they share one.
+
+Run with ``python benchmarks/bench_shared_namespace.py``.
+"""
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from code_extractor import load_code  # noqa: E402
+from code_extractor.extracted_code import _ExtractedCode  # noqa: E402
+
+LOADS = 200
+DEPENDENCIES = 50
+
+
+def make_payload(index: int) -> str:
+    extracted_code = _ExtractedCode(get_requirements=False)
+    extracted_code.name = f"target_{index}"
+    extracted_code.code = f"def target_{index}():\n    return helper_0({index})\n"
+    extracted_code.imports = {"import decimal", "import json"}
+    extracted_code.dependencies = {
+        f"def helper_{i}(value):\n"
+        f"    return json.dumps([value * {i}, str(decimal.Decimal({i}))])\n"
+        for i in range(DEPENDENCIES)
+    }
+    extracted_code.dependencies.add(
+        "TABLE = {str(key): list(range(key)) for key in range(64)}\n"
+    )
+    return extracted_code.to_string(freeze_code=False)
+
+
+def measure(payloads: list, shared: bool) -> int:
+    gc.collect()
+    tracemalloc.start()
+    loaded = [load_code(payload, shared=shared) for payload in payloads]
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    for function in loaded:
+        function()
+    return retained
+
+
+def main() -> None:
+    payloads = [make_payload(index) for index in range(LOADS)]
+    print(f"{'mode':>8} {'retained KiB':>14} {'per load KiB':>14}")
+    for shared in [False, True]:
+        retained = measure(payloads, shared)
+        mode = "shared" if shared else "default"
+        print(f"{mode:>8} {retained / 1024:>14.1f} {retained / 1024 / LOADS:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Compare the size and write time of a stream of objects pickled one by one with dumps and
+written with repeated StreamPickler.dump calls, as the number of objects grows while the
+shared helpers stay the same.
+
+Run with ``python benchmarks/bench_stream_pickler.py``.
+"""
+import importlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from code_extractor.pickle import StreamPickler, dumps  # noqa: E402
+
+HELPERS = 30
+SIZES = [10, 100, 1000]
+
+
+def make_module(directory: str, size: int) -> list:
+    lines = ["import decimal", "import json", ""]
+    for index in range(HELPERS):
+        lines.append(f"def helper_{index}(value):")
+        lines.append(f"    return json.dumps(str(decimal.Decimal(value) * {index}))")
+        lines.append("")
+    calls = " + ".join(f"helper_{index}(value)" for index in range(HELPERS))
+    for index in range(size):
+        lines.append(f"def task_{index}(value):")
+        lines.append(f"    return [{index}, {calls}]")
+        lines.append("")
+    name = f"bench_stream_tasks_{size}"
+    with open(os.path.join(directory, f"{name}.py"), "w") as file:
+        file.write("\n".join(lines))
+    module = importlib.import_module(name)
+    return [getattr(module, f"task_{index}") for index in range(size)]
+
+
+def main() -> None:
+    directory = tempfile.mkdtemp()
+    sys.path.insert(0, directory)
+    print(
+        f"{'objects':>8} {'dumps KiB':>10} {'stream KiB':>11}"
+        f" {'dumps ms':>9} {'stream ms':>10}"
+    )
+    for size in SIZES:
+        tasks = make_module(directory, size)
+        start = time.perf_counter()
+        separate = sum(len(dumps(task)) for task in tasks)
+        separate_time = time.perf_counter() - start
+        start = time.perf_counter()
+        file = io.BytesIO()
+        pickler = StreamPickler(file)
+        for task in tasks:
+            pickler.dump(task)
+        stream_time = time.perf_counter() - start
+        streamed = len(file.getvalue())
+        print(
+            f"{size:>8} {separate / 1024:>10.1f} {streamed / 1024:>11.1f}"
+            f" {separate_time * 1e3:>9.1f} {stream_time * 1e3:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
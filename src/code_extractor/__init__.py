@@ -18,11 +18,49 @@ Allows to save python functions and classes and load them without knowing the co
 
 This exports:
     - extract_code: to extract code to a string
+    - extract_many: to extract code from many objects sharing their dependencies
     - load_code: to load code from a string extracted by this package
+    - load_many: to load a bundle extracted by this package
+    - DiskCodeCache: a persistent cache of the code compiled by load_code
+    - PayloadArchive: an indexed archive of extracted code with random access to its entries
+    - enable_object_cache, disable_object_cache, object_cache_info, object_cache_clear: to
+      manage the opt-in cache of loaded objects
+    - ExtractionCache: a persistent cache that extract_code can look extracted code up in
+    - DependencyStore, DictStore, DirectoryStore, SQLiteStore: content-addressed stores
+      the sources of dependencies can be shared through instead of being embedded
+    - train_dictionary, register_dictionary: to build and use a preset dictionary for
+      zlib compression of extracted code
+    - warm_requirements: to compute the requirements of the interpreter ahead of time
+    - register_third_party_path, unregister_third_party_path: to treat modules under a
+      directory as third-party dependencies
     - dump, dumps, load, loads: familiar API from the pickle and marshal modules
+    - enable_multiprocessing_reduction, disable_multiprocessing_reduction: to extract the
+      functions and classes sent to multiprocessing and concurrent.futures worker processes
 """
 __version__ = "0.4.1"
 
-from .extractor.extract import extract_code
-from .loader.load import load_code
-from .pickle import dump, dumps, load, loads
+from .extractor.classify import register_third_party_path, unregister_third_party_path
+from .archive import PayloadArchive
+from .compression import register_dictionary, train_dictionary
+from .environment import warm_requirements
+from .extractor.cache import ExtractionCache
+from .extractor.extract import extract_code, extract_many
+from .loader.code_cache import DiskCodeCache
+from .loader.load import load_code, load_many
+from .loader.object_cache import (
+    disable_object_cache,
+    enable_object_cache,
+    object_cache_clear,
+    object_cache_info,
+)
+from .store import DependencyStore, DictStore, DirectoryStore, SQLiteStore
+from .pickle import (
+    disable_multiprocessing_reduction,
+    dump,
+    dumps,
+    dumps_many,
+    enable_multiprocessing_reduction,
+    load,
+    loads,
+    loads_many,
+)
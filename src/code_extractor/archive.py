@@ -0,0 +1,445 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Module containing an archive of extracted code supporting random access to its entries.
+
+The archive is a directory holding an append-only data file with the payloads, an index
+sorting their names, each with the offset and length of its payload in the data file, and a
+journal the index records of recent puts are appended to until they are merged in the index.
+Readers memory-map the data file and the index and binary search the index, so looking an
+entry up only reads the pages of the index it visits and of the requested payload.
+"""
+import mmap
+import os
+import struct
+import tempfile
+
+from threading import Lock
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
+
+from .extracted_code import _ExtractedCode
+from .loader.load import load_code
+
+_INDEX_MAGIC: bytes = b"CEXI"
+_JOURNAL_MAGIC: bytes = b"CEXJ"
+_DATA_MAGIC: bytes = b"CEXA"
+_VERSION: int = 1
+# Magic, version, generation of the data file, number of the journal and number of entries.
+_HEADER: struct.Struct = struct.Struct("<4sBQQI")
+# Magic and number of the journal, which is the number of the index it belongs to.
+_JOURNAL_HEADER: struct.Struct = struct.Struct("<4sQ")
+_OFFSET: struct.Struct = struct.Struct("<Q")
+# Name length, followed by the utf-8 name, then the payload offset and length.
+_KEY: struct.Struct = struct.Struct("<H")
+_LOCATION: struct.Struct = struct.Struct("<QQ")
+# The journal is merged in the index once it is larger than a quarter of the index, so the
+# index is rewritten a logarithmic number of times while the archive grows.
+_JOURNAL_SIZE: int = 64 * 1024
+
+_Payload = Union[str, bytes, bytearray, "memoryview[int]"]
+_Location = Tuple[int, int]
+_Signature = Tuple[int, int, int]
+# Signature of the index, generation of the data file, number of the journal, size of the
+# index and end of the last complete record of the journal, or 0 if it must be recreated.
+_Position = Tuple[Optional[_Signature], int, int, int, int]
+
+
+class PayloadArchive:
+    """
+    Archive of extracted code, written by a single writer at a time and read concurrently
+    by any number of threads and processes. Putting a payload under an existing name
+    supersedes the previous one, whose space is reclaimed by compact.
+
+    :param path: The directory the archive is stored in.
+    :type path: str
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path: str = os.path.abspath(path)
+        os.makedirs(self.path, exist_ok=True)
+        self._write_lock: Lock = Lock()
+        self._read_lock: Lock = Lock()
+        self._reader: Optional[_Reader] = None
+        # Where the writer appends to the journal, so puts do not read back what they wrote.
+        self._position: Optional[_Position] = None
+
+    def put(self, payload: _Payload, name: Optional[str] = None) -> str:
+        """
+        Append the payload to the archive.
+
+        :param payload: The code extracted by this package.
+        :type payload: str, bytes, bytearray, memoryview
+        :param name: The name the payload is stored under, its digest if not specified.
+        :type name: Optional[str]
+        :return: The name the payload was stored under.
+        :rtype: str
+        """
+        return self.put_many([(name, payload)])[0]
+
+    def put_many(self, entries: Iterable[Tuple[Optional[str], _Payload]]) -> List[str]:
+        """
+        Append the payloads to the archive, appending their index records to the journal
+        at once.
+
+        :param entries: The pairs of name, or None to store the payload under its digest,
+            and payload.
+        :type entries: Iterable[Tuple[Optional[str], str, bytes, bytearray, memoryview]]
+        :return: The names the payloads were stored under.
+        :rtype: List[str]
+        """
+        with self._write_lock:
+            signature, generation, journal, index_size, end = self._journal_position()
+            records = []
+            names = []
+            with open(self._data_path(generation), "ab") as file:
+                if file.tell() == 0:
+                    file.write(_DATA_MAGIC)
+                for name, payload in entries:
+                    if isinstance(payload, str):
+                        payload = payload.encode("utf-8")
+                    if name is None:
+                        name = _ExtractedCode.from_string(payload).digest
+                    records.append(
+                        _record(name.encode("utf-8"), (file.tell(), len(payload)))
+                    )
+                    file.write(payload)
+                    names.append(name)
+                file.flush()
+                os.fsync(file.fileno())
+            end = self._append_journal(journal, end, records)
+            self._position = (signature, generation, journal, index_size, end)
+            if end > max(_JOURNAL_SIZE, index_size // 4):
+                reader = self._current_reader()
+                self._write_index(
+                    reader.generation, reader.journal + 1, dict(reader.locations())
+                )
+            return names
+
+    def get(self, name: str) -> Optional["memoryview[int]"]:
+        """
+        Return the payload stored under the name, without copying it.
+
+        :param name: The name the payload was stored under.
+        :type name: str
+        :return: A read-only view of the payload, or None if there is no payload with that name.
+        :rtype: Optional[memoryview]
+        """
+        return self._current_reader().find(name)
+
+    def load(
+        self, name: str, **options: Any
+    ) -> Union[Type[object], Callable[..., object]]:
+        """
+        Load the object stored under the name. Only its payload is decoded.
+
+        :param name: The name the payload was stored under.
+        :type name: str
+        :param options: The keyword arguments passed to load_code.
+        :type options: Any
+        :return: The loaded class or function.
+        :rtype: type(object), Callable[..., object]
+        """
+        payload = self.get(name)
+        if payload is None:
+            raise KeyError(name)
+        return load_code(payload, **options)
+
+    def names(self) -> List[str]:
+        """
+        Return the names of the payloads in the archive, sorted.
+
+        :return: The sorted names.
+        :rtype: List[str]
+        """
+        return [name for name, _ in self._current_reader().locations()]
+
+    def compact(self) -> None:
+        """
+        Rewrite the data file with only the payloads of the index, reclaiming the space
+        of superseded payloads. Readers keep reading the previous data file until they
+        notice the new index.
+        """
+        with self._write_lock:
+            reader = self._current_reader()
+            generation = reader.generation + 1
+            locations = {}
+            with open(self._data_path(generation), "wb") as file:
+                file.write(_DATA_MAGIC)
+                for name, _ in reader.locations():
+                    payload = reader.find(name)
+                    assert payload is not None
+                    locations[name] = (file.tell(), len(payload))
+                    file.write(payload)
+                file.flush()
+                os.fsync(file.fileno())
+            self._write_index(generation, reader.journal + 1, locations)
+            try:
+                os.unlink(self._data_path(reader.generation))
+            except OSError:
+                pass
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and self.get(name) is not None
+
+    def __len__(self) -> int:
+        return self._current_reader().count
+
+    def _index_path(self) -> str:
+        return os.path.join(self.path, "index")
+
+    def _journal_path(self) -> str:
+        return os.path.join(self.path, "journal")
+
+    def _data_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"data.{generation}")
+
+    def _current_reader(self) -> "_Reader":
+        while True:
+            signature = (
+                _signature(self._index_path()),
+                _signature(self._journal_path()),
+            )
+            with self._read_lock:
+                reader = self._reader
+                if reader is not None and reader.signature == signature:
+                    return reader
+                try:
+                    reader = self._reader = _Reader(self.path)
+                except (FileNotFoundError, _SupersededJournal):
+                    # A compaction removed the data file referenced by the index that was
+                    # read, or a merge replaced its journal, the new index is read instead.
+                    if _signature(self._index_path()) == signature[0]:
+                        raise
+                    continue
+                return reader
+
+    def _journal_position(self) -> _Position:
+        # Only this writer appends to the journal, so the position it last appended at
+        # stays valid until the index is replaced.
+        position = self._position
+        if position is None or position[0] != _signature(self._index_path()):
+            reader = self._current_reader()
+            position = self._position = (
+                reader.signature[0],
+                reader.generation,
+                reader.journal,
+                reader.index_size,
+                reader.journal_end,
+            )
+        return position
+
+    def _append_journal(self, journal: int, end: int, records: List[bytes]) -> int:
+        if end == 0:
+            header = _JOURNAL_HEADER.pack(_JOURNAL_MAGIC, journal)
+            self._replace(self._journal_path(), [header] + records)
+            return len(header) + sum(len(record) for record in records)
+        with open(self._journal_path(), "r+b") as file:
+            # Drops the partial record an interrupted put may have left.
+            file.seek(end)
+            file.truncate()
+            file.write(b"".join(records))
+            file.flush()
+            os.fsync(file.fileno())
+            return file.tell()
+
+    def _write_index(
+        self, generation: int, journal: int, locations: Dict[str, _Location]
+    ) -> None:
+        # Sorted by encoded name, which is the order readers compare names in.
+        keys = sorted(name.encode("utf-8") for name in locations.keys())
+        offset = _HEADER.size + _OFFSET.size * len(keys)
+        offsets = []
+        entries = []
+        for key in keys:
+            offsets.append(_OFFSET.pack(offset))
+            entry = _record(key, locations[key.decode("utf-8")])
+            entries.append(entry)
+            offset += len(entry)
+        header = _HEADER.pack(_INDEX_MAGIC, _VERSION, generation, journal, len(keys))
+        self._replace(self._index_path(), [header] + offsets + entries)
+        # Replaced after the index, so readers of the previous index either see its journal
+        # or notice the new index.
+        self._replace(
+            self._journal_path(), [_JOURNAL_HEADER.pack(_JOURNAL_MAGIC, journal)]
+        )
+        self._position = None
+
+    def _replace(self, path: str, chunks: List[bytes]) -> None:
+        descriptor, temporary = tempfile.mkstemp(dir=self.path)
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(b"".join(chunks))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+
+# Raised when the journal belongs to an index newer than the one that was read.
+class _SupersededJournal(ValueError):
+    pass
+
+
+# Snapshot of the archive as of one version of the index and its journal. The data file they
+# reference is append-only until compaction replaces it, so the snapshot stays consistent
+# while mapped.
+class _Reader:
+    def __init__(self, path: str) -> None:
+        self.signature: Tuple[Optional[_Signature], Optional[_Signature]] = (None, None)
+        self.generation: int = 0
+        self.journal: int = 0
+        self.journal_end: int = 0
+        self.index_size: int = 0
+        self.count: int = 0
+        self._indexed: int = 0
+        self._index: Optional[mmap.mmap] = None
+        self._journaled: Dict[bytes, _Location] = {}
+        self._data: Optional["memoryview[int]"] = None
+        index_signature = None
+        try:
+            file = open(os.path.join(path, "index"), "rb")
+        except FileNotFoundError:
+            file = None
+        if file is not None:
+            with file:
+                index_signature = _fstat_signature(file.fileno())
+                index = self._index = mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+            (
+                magic,
+                version,
+                self.generation,
+                self.journal,
+                self._indexed,
+            ) = _HEADER.unpack_from(index, 0)
+            if magic != _INDEX_MAGIC or version > _VERSION:
+                raise ValueError(f"Invalid archive index in {path}")
+            self.index_size = len(index)
+        self.signature = (index_signature, self._read_journal(path))
+        self.count = self._indexed + sum(
+            1 for key in self._journaled if self._find_indexed(key) is None
+        )
+        if self._index is None and len(self._journaled) == 0:
+            return
+        with open(os.path.join(path, f"data.{self.generation}"), "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if data[: len(_DATA_MAGIC)] != _DATA_MAGIC:
+            raise ValueError(f"Invalid archive data in {path}")
+        self._data = memoryview(data)
+
+    def find(self, name: str) -> Optional["memoryview[int]"]:
+        data = self._data
+        if data is None:
+            return None
+        key = name.encode("utf-8")
+        location = self._journaled.get(key, None)
+        if location is None:
+            location = self._find_indexed(key)
+        if location is None:
+            return None
+        offset, length = location
+        return data[offset : offset + length]
+
+    def locations(self) -> Iterator[Tuple[str, _Location]]:
+        locations = dict(self._entry(position) for position in range(self._indexed))
+        locations.update(self._journaled)
+        for key in sorted(locations.keys()):
+            yield key.decode("utf-8"), locations[key]
+
+    def _read_journal(self, path: str) -> Optional[_Signature]:
+        try:
+            file = open(os.path.join(path, "journal"), "rb")
+        except FileNotFoundError:
+            return None
+        with file:
+            # Only the records written when the signature was taken are read, the ones
+            # appended since change the signature and are read by the next snapshot.
+            signature = _fstat_signature(file.fileno())
+            contents = file.read(signature[2])
+        magic, journal = _JOURNAL_HEADER.unpack_from(contents, 0)
+        if magic != _JOURNAL_MAGIC:
+            raise ValueError(f"Invalid archive journal in {path}")
+        if journal > self.journal:
+            raise _SupersededJournal(f"Invalid archive journal in {path}")
+        if journal < self.journal:
+            # Left by a merge that was interrupted after replacing the index.
+            return signature
+        offset = _JOURNAL_HEADER.size
+        while offset + _KEY.size <= len(contents):
+            length = _KEY.unpack_from(contents, offset)[0]
+            start = offset + _KEY.size
+            end = start + length + _LOCATION.size
+            if end > len(contents):
+                break
+            key = contents[start : start + length]
+            self._journaled[key] = _LOCATION.unpack_from(contents, start + length)
+            offset = end
+        self.journal_end = offset
+        return signature
+
+    def _find_indexed(self, key: bytes) -> Optional[_Location]:
+        low = 0
+        high = self._indexed
+        while low < high:
+            middle = (low + high) // 2
+            entry_key, location = self._entry(middle)
+            if entry_key < key:
+                low = middle + 1
+            elif entry_key > key:
+                high = middle
+            else:
+                return location
+        return None
+
+    def _entry(self, position: int) -> Tuple[bytes, _Location]:
+        index = self._index
+        assert index is not None
+        offset = _OFFSET.unpack_from(index, _HEADER.size + position * _OFFSET.size)[0]
+        length = _KEY.unpack_from(index, offset)[0]
+        start = offset + _KEY.size
+        key = index[start : start + length]
+        return key, _LOCATION.unpack_from(index, start + length)
+
+
+def _record(key: bytes, location: _Location) -> bytes:
+    return _KEY.pack(len(key)) + key + _LOCATION.pack(*location)
+
+
+def _signature(path: str) -> Optional[_Signature]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _fstat_signature(descriptor: int) -> _Signature:
+    stat = os.fstat(descriptor)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
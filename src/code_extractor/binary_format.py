@@ -0,0 +1,156 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Module containing code for the compact binary representation of extracted code.
+
+The layout is a magic header followed by a version byte, a section count and a table of
+(section id, offset, length) entries pointing into the rest of the buffer.
+Every string is stored once in a string table and sections refer to it by index.
+The string table holds the length of every string followed by their concatenated utf-8
+encoding, so that it is decoded with a single call.
+Unknown sections are skipped so that newer writers stay readable.
+"""
+import struct
+
+from itertools import accumulate
+from typing import Dict, List, Tuple, Union
+
+_MAGIC: bytes = b"CEXB"
+_VERSION: int = 1
+_HEADER: struct.Struct = struct.Struct("<4sBB")
+_SECTION: struct.Struct = struct.Struct("<BII")
+_UINT: struct.Struct = struct.Struct("<I")
+
+_STRING = "string"
+_STRING_LIST = "string_list"
+_BYTES = "bytes"
+
+_STRING_TABLE_ID: int = 0
+_FIELDS: Dict[str, Tuple[int, str]] = {
+    "name": (1, _STRING),
+    "code": (2, _STRING),
+    "dependencies": (3, _STRING_LIST),
+    "imports": (4, _STRING_LIST),
+    "requirements": (5, _STRING_LIST),
+    "names": (6, _STRING_LIST),
+    "frozen_code": (7, _STRING),
+    "frozen_parts": (8, _STRING_LIST),
+    "dependency_hashes": (9, _STRING_LIST),
+    "digest": (10, _STRING),
+    "bytecode": (11, _BYTES),
+    "bytecode_tag": (12, _STRING),
+}
+_FIELD_NAMES: Dict[int, str] = {
+    section_id: name for name, (section_id, _) in _FIELDS.items()
+}
+
+_Value = Union[str, List[str], bytes]
+
+
+def _is_binary(data: object) -> bool:
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        return False
+    return bytes(data[: len(_MAGIC)]) == _MAGIC
+
+
+def _encode(dictionary: Dict[str, _Value]) -> bytes:
+    strings: List[str] = []
+    interned: Dict[str, int] = {}
+
+    def intern(string: str) -> int:
+        index = interned.get(string, None)
+        if index is None:
+            index = len(strings)
+            interned[string] = index
+            strings.append(string)
+        return index
+
+    sections: List[Tuple[int, bytes]] = []
+    for name, value in dictionary.items():
+        section_id, kind = _FIELDS[name]
+        if kind == _STRING:
+            assert isinstance(value, str)
+            sections.append((section_id, _UINT.pack(intern(value))))
+        elif kind == _BYTES:
+            assert isinstance(value, bytes)
+            sections.append((section_id, value))
+        else:
+            assert isinstance(value, list)
+            indices = [intern(string) for string in value]
+            sections.append(
+                (
+                    section_id,
+                    struct.pack(f"<I{len(indices)}I", len(indices), *indices),
+                )
+            )
+    string_table = struct.pack(
+        f"<I{len(strings)}I", len(strings), *[len(string) for string in strings]
+    ) + "".join(strings).encode("utf-8")
+    sections.insert(0, (_STRING_TABLE_ID, string_table))
+    offset = _HEADER.size + _SECTION.size * len(sections)
+    table = []
+    for section_id, data in sections:
+        table.append(_SECTION.pack(section_id, offset, len(data)))
+        offset += len(data)
+    return b"".join(
+        [_HEADER.pack(_MAGIC, _VERSION, len(sections))]
+        + table
+        + [data for _, data in sections]
+    )
+
+
+def _decode(data: Union[bytes, bytearray, "memoryview[int]"]) -> Dict[str, _Value]:
+    buffer = memoryview(data)
+    try:
+        magic, version, section_count = _HEADER.unpack_from(buffer, 0)
+        if magic != _MAGIC or version > _VERSION:
+            raise ValueError("Invalid binary code")
+        sections: Dict[int, "memoryview[int]"] = {}
+        for index in range(section_count):
+            section_id, offset, length = _SECTION.unpack_from(
+                buffer, _HEADER.size + index * _SECTION.size
+            )
+            if offset + length > len(buffer):
+                raise ValueError("Invalid binary code")
+            sections[section_id] = buffer[offset : offset + length]
+        strings = _decode_string_table(sections[_STRING_TABLE_ID])
+        dictionary: Dict[str, _Value] = {}
+        for section_id, section in sections.items():
+            name = _FIELD_NAMES.get(section_id, None)
+            if name is None:
+                continue
+            kind = _FIELDS[name][1]
+            if kind == _STRING:
+                dictionary[name] = strings[_UINT.unpack_from(section, 0)[0]]
+            elif kind == _BYTES:
+                dictionary[name] = bytes(section)
+            else:
+                count = _UINT.unpack_from(section, 0)[0]
+                indices = struct.unpack_from(f"<{count}I", section, _UINT.size)
+                dictionary[name] = [strings[index] for index in indices]
+    except (struct.error, KeyError, IndexError, UnicodeDecodeError):
+        raise ValueError("Invalid binary code")
+    return dictionary
+
+
+def _decode_string_table(section: "memoryview[int]") -> List[str]:
+    count = _UINT.unpack_from(section, 0)[0]
+    lengths = struct.unpack_from(f"<{count}I", section, _UINT.size)
+    text = str(section[_UINT.size * (count + 1) :], "utf-8")
+    ends = list(accumulate(lengths))
+    if len(ends) > 0 and ends[-1] != len(text):
+        raise ValueError("Invalid binary code")
+    return [text[end - length : end] for end, length in zip(ends, lengths)]
@@ -0,0 +1,254 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Module containing code to compress extracted code payloads.
+
+Compressed payloads start with a magic header followed by the compression method and the id
+of the preset dictionary they were compressed with, so that they are detected and
+decompressed automatically on load.
+"""
+import json
+import lzma
+import struct
+import zlib
+
+from collections import Counter
+from threading import Lock
+from typing import Dict, FrozenSet, Iterable, List, Optional, Union
+
+from .binary_format import _decode, _is_binary
+
+_MAGIC: bytes = b"CEXZ"
+_HEADER: struct.Struct = struct.Struct("<4sBI")
+
+_ZLIB: int = 0
+_LZMA: int = 1
+_METHODS: Dict[str, int] = {"zlib": _ZLIB, "lzma": _LZMA}
+
+_NO_DICTIONARY: int = 0
+# Payload fields left out when training dictionaries.
+_UNSHARED_FIELDS: FrozenSet[str] = frozenset({"bytecode", "bytecode_tag", "digest"})
+
+# zlib favours the end of the preset dictionary, so the most common fragments come last.
+# Source fragments appear as is in binary payloads and JSON-escaped in JSON payloads.
+_SOURCE_FRAGMENTS: List[str] = [
+    "import pickle\n",
+    "import collections\n",
+    "import functools\n",
+    "import itertools\n",
+    "import datetime\n",
+    "import logging\n",
+    "import pathlib\n",
+    "import random\n",
+    "import string\n",
+    "import time\n",
+    "import math\n",
+    "import re\n",
+    "import json\n",
+    "import sys\n",
+    "import os\n",
+    "import typing\n",
+    "import enum\n",
+    "from typing import ",
+    "import numpy as np\n",
+    "import pandas as pd\n",
+    " = enum.Enum(value='",
+    "', names=",
+    " = pickle.loads(b'",
+    "    @staticmethod\n",
+    "    @classmethod\n",
+    "    @property\n",
+    "    def __init__(self",
+    "        return ",
+    "    return ",
+    "self.",
+    "\n\ndef ",
+    "\n\nclass ",
+    "def ",
+    "class ",
+]
+# The keys of the JSON payloads, in the sorted order to_string writes them in.
+_JSON_FRAGMENTS: List[str] = [
+    '", "requirements": ["',
+    '", "requirements": []}',
+    '"], "name": "',
+    '", "imports": ["',
+    '", "imports": [], "name": "',
+    '"], "digest": "',
+    '", "frozen_code": "',
+    '{"code": "',
+    '", "dependencies": ["',
+    '", "dependencies": [], "digest": "',
+    '", "',
+]
+_PRESET_DICTIONARY: bytes = (
+    "".join(_SOURCE_FRAGMENTS)
+    + "".join(json.dumps(fragment)[1:-1] for fragment in _SOURCE_FRAGMENTS)
+    + "".join(_JSON_FRAGMENTS)
+).encode("utf-8")
+
+
+class _DictionaryRegistry:
+    def __init__(self, dictionary: bytes) -> None:
+        self._lock: Lock = Lock()
+        self._dictionaries: Dict[int, bytes] = {}
+        self.default: int = self.register(dictionary)
+
+    def register(self, dictionary: bytes) -> int:
+        dictionary_id = zlib.crc32(dictionary) or 1
+        with self._lock:
+            self._dictionaries[dictionary_id] = dictionary
+        return dictionary_id
+
+    def get(self, dictionary_id: int) -> bytes:
+        with self._lock:
+            dictionary = self._dictionaries.get(dictionary_id, None)
+        if dictionary is None:
+            raise ValueError(
+                f"Compressed code uses the unknown dictionary {dictionary_id}; "
+                "register it with register_dictionary first."
+            )
+        return dictionary
+
+
+_DICTIONARIES: _DictionaryRegistry = _DictionaryRegistry(_PRESET_DICTIONARY)
+
+
+def register_dictionary(dictionary: bytes, make_default: bool = True) -> int:
+    """
+    Register a preset dictionary (for example one returned by train_dictionary) for zlib
+    compression. Payloads compressed with it can only be loaded in processes where it is
+    registered as well.
+
+    :param dictionary: The preset dictionary.
+    :type dictionary: bytes
+    :param make_default: If True the dictionary is used for every following zlib compression.
+    :type make_default: bool
+    :return: The id stored in the payloads compressed with the dictionary.
+    :rtype: int
+    """
+    dictionary_id = _DICTIONARIES.register(dictionary)
+    if make_default:
+        _DICTIONARIES.default = dictionary_id
+    return dictionary_id
+
+
+def train_dictionary(
+    payloads: Iterable[Union[str, bytes]], size: int = 32 * 1024
+) -> bytes:
+    """
+    Build a preset dictionary from a corpus of extracted payloads. The lines that save the most
+    bytes across the corpus (import lines, requirement pins, shared dependencies...) are kept.
+
+    :param payloads: The extracted payloads, in any format.
+    :type payloads: Iterable[str, bytes]
+    :param size: The maximum size of the dictionary in bytes.
+    :type size: int
+    :return: The dictionary, to be passed to register_dictionary.
+    :rtype: bytes
+    """
+    counter: "Counter[bytes]" = Counter()
+    for payload in payloads:
+        counter.update(set(_iter_fragments(payload)))
+    scored = sorted(
+        (
+            (count * len(fragment), fragment)
+            for fragment, count in counter.items()
+            if count > 1
+        ),
+        reverse=True,
+    )
+    chosen: List[bytes] = []
+    total = 0
+    for _, fragment in scored:
+        if total + len(fragment) > size:
+            continue
+        chosen.append(fragment)
+        total += len(fragment)
+    return b"".join(reversed(chosen))
+
+
+def _iter_fragments(payload: Union[str, bytes]) -> Iterable[bytes]:
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    if _is_compressed(payload):
+        payload = _decompress(payload)
+    binary = _is_binary(payload)
+    if binary:
+        dictionary: object = _decode(payload)
+    else:
+        dictionary = json.loads(payload)
+    if not isinstance(dictionary, dict):
+        raise ValueError("Invalid code string")
+    for field, value in dictionary.items():
+        # Digests and bytecode are specific to each payload, and bytecode is not text.
+        if field in _UNSHARED_FIELDS:
+            continue
+        strings = [value] if isinstance(value, str) else value
+        if not isinstance(strings, list):
+            continue
+        for string in strings:
+            if not isinstance(string, str):
+                continue
+            for line in string.splitlines(keepends=True):
+                if not binary:
+                    line = json.dumps(line)[1:-1]
+                yield line.encode("utf-8")
+
+
+def _is_compressed(data: object) -> bool:
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        return False
+    return bytes(data[: len(_MAGIC)]) == _MAGIC
+
+
+def _compress(data: bytes, method: str, level: Optional[int] = None) -> bytes:
+    method_id = _METHODS.get(method, None)
+    if method_id is None:
+        raise ValueError(
+            f"Unknown compression method {method}, expected one of {list(_METHODS)}"
+        )
+    if method_id == _ZLIB:
+        dictionary_id = _DICTIONARIES.default
+        compressor = zlib.compressobj(
+            level=zlib.Z_DEFAULT_COMPRESSION if level is None else level,
+            zdict=_DICTIONARIES.get(dictionary_id),
+        )
+        body = compressor.compress(data) + compressor.flush()
+    else:
+        dictionary_id = _NO_DICTIONARY
+        body = lzma.compress(data, preset=level)
+    return _HEADER.pack(_MAGIC, method_id, dictionary_id) + body
+
+
+def _decompress(data: Union[bytes, bytearray, "memoryview[int]"]) -> bytes:
+    buffer = memoryview(data)
+    try:
+        _, method_id, dictionary_id = _HEADER.unpack_from(buffer, 0)
+        body = buffer[_HEADER.size :].tobytes()
+        if method_id == _ZLIB:
+            if dictionary_id == _NO_DICTIONARY:
+                decompressor = zlib.decompressobj()
+            else:
+                decompressor = zlib.decompressobj(
+                    zdict=_DICTIONARIES.get(dictionary_id)
+                )
+            return decompressor.decompress(body) + decompressor.flush()
+        if method_id == _LZMA:
+            return lzma.decompress(body)
+    except (struct.error, zlib.error, lzma.LZMAError):
+        raise ValueError("Invalid compressed code")
+    raise ValueError(f"Unknown compression method id {method_id}")
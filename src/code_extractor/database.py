@@ -0,0 +1,49 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Module containing the SQLite helpers shared by the persistent caches and stores.
+"""
+import sqlite3
+
+
+class AutoClosingConnection:
+    """
+    Context manager opening a SQLite connection in autocommit mode, committing the transaction
+    still open on exit (or rolling it back on error) and closing the connection.
+
+    :param path: The path of the SQLite database file.
+    :type path: str
+    :param timeout: How many seconds to wait for another process holding the database lock.
+    :type timeout: float
+    """
+
+    def __init__(self, path: str, timeout: float) -> None:
+        self._connection: sqlite3.Connection = sqlite3.connect(
+            path, timeout=timeout, isolation_level=None
+        )
+
+    def __enter__(self) -> sqlite3.Connection:
+        return self._connection
+
+    def __exit__(self, exc_type: object, exc_value: object, traceback: object) -> None:
+        try:
+            if self._connection.in_transaction:
+                if exc_type is None:
+                    self._connection.execute("COMMIT")
+                else:
+                    self._connection.execute("ROLLBACK")
+        finally:
+            self._connection.close()
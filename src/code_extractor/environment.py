@@ -0,0 +1,240 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Module containing code to snapshot the packages installed in the running interpreter.
+"""
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+
+from threading import Lock, Thread
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+from warnings import warn
+
+if sys.version_info >= (3, 8):
+    import importlib.metadata as _metadata
+else:  # pragma: no cover
+    # The backport of importlib.metadata, if installed.
+    try:
+        import importlib_metadata as _metadata
+    except ImportError:
+        _metadata = None
+
+_FREEZE_SKIP: FrozenSet[str] = frozenset({"pip", "setuptools", "wheel", "distribute"})
+_WARM_ENVIRONMENT_VARIABLE: str = "CODE_EXTRACTOR_WARM_REQUIREMENTS"
+
+_Key = Tuple[Tuple[str, ...], Tuple[Optional[int], ...]]
+
+
+class _EnvironmentSnapshot:
+    def __init__(self) -> None:
+        self._lock: Lock = Lock()
+        self._key: Optional[_Key] = None
+        self._requirements: Optional[FrozenSet[str]] = None
+        self._versions: Optional[Dict[str, str]] = None
+        self._modules: Optional[Dict[str, FrozenSet[str]]] = None
+
+    def requirements(self) -> FrozenSet[str]:
+        with self._lock:
+            self._refresh()
+            if self._requirements is None:
+                self._requirements = _freeze()
+            return self._requirements
+
+    def versions(self) -> Dict[str, str]:
+        with self._lock:
+            self._refresh()
+            if self._versions is None:
+                self._versions = _installed_versions()
+            return self._versions
+
+    def module_requirements(self) -> Dict[str, FrozenSet[str]]:
+        with self._lock:
+            self._refresh()
+            if self._modules is None:
+                self._modules = _index_top_level_modules()
+            return self._modules
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._key = None
+
+    def _refresh(self) -> None:
+        key = _environment_key()
+        if key != self._key:
+            self._requirements = None
+            self._versions = None
+            self._modules = None
+            self._key = key
+
+
+def _environment_key() -> _Key:
+    paths = tuple(sys.path)
+    mtimes: List[Optional[int]] = []
+    for path in paths:
+        try:
+            mtimes.append(os.stat(path or os.curdir).st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return paths, tuple(mtimes)
+
+
+def _environment_fingerprint() -> str:
+    paths, mtimes = _environment_key()
+    return hashlib.sha256(json.dumps([paths, mtimes]).encode("utf-8")).hexdigest()
+
+
+def _canonicalize_name(name: str) -> str:
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def _freeze() -> FrozenSet[str]:
+    if _metadata is None:  # pragma: no cover
+        return frozenset(
+            subprocess.run(
+                [sys.executable, "-m", "pip", "freeze"], stdout=subprocess.PIPE
+            )
+            .stdout.decode(encoding="utf-8")
+            .splitlines(keepends=False)
+        )
+    return frozenset(
+        requirement
+        for canonical_name, requirement, _ in _iter_distributions()
+        if canonical_name not in _FREEZE_SKIP
+    )
+
+
+def _installed_versions() -> Dict[str, str]:
+    versions = {}
+    if _metadata is None:  # pragma: no cover
+        for requirement in _freeze():
+            name, separator, version = requirement.partition("==")
+            if separator:
+                versions[_canonicalize_name(name)] = version
+    for canonical_name, requirement, _ in _iter_distributions():
+        versions[canonical_name] = requirement.partition("==")[2]
+    return versions
+
+
+def _index_top_level_modules() -> Dict[str, FrozenSet[str]]:
+    index: Dict[str, Set[str]] = {}
+    for _, requirement, distribution in _iter_distributions():
+        for module in _top_level_modules(distribution):
+            index.setdefault(module, set()).add(requirement)
+    return {module: frozenset(requirements) for module, requirements in index.items()}
+
+
+def _iter_distributions() -> Iterator[Tuple[str, str, "_metadata.Distribution"]]:
+    if _metadata is None:  # pragma: no cover
+        return
+    seen = set()
+    for distribution in _metadata.distributions():
+        name = distribution.metadata["Name"]
+        if name is None:
+            continue
+        canonical_name = _canonicalize_name(name)
+        if canonical_name in seen:
+            continue
+        seen.add(canonical_name)
+        yield canonical_name, f"{name}=={distribution.version}", distribution
+
+
+def _top_level_modules(distribution: "_metadata.Distribution") -> Set[str]:
+    top_level = distribution.read_text("top_level.txt")
+    if top_level is not None:
+        return {line.strip() for line in top_level.splitlines() if line.strip()}
+    modules = set()
+    for file in distribution.files or []:
+        parts = file.parts
+        if len(parts) == 0 or parts[0] in ("..", "__pycache__"):
+            continue
+        top = parts[0]
+        if top.endswith((".dist-info", ".egg-info", ".data", ".pth")):
+            continue
+        if len(parts) > 1:
+            modules.add(top)
+        elif top.endswith((".py", ".so", ".pyd")):
+            modules.add(top.split(".")[0])
+    return modules
+
+
+def _imported_module(import_line: str) -> Optional[str]:
+    tokens = import_line.split()
+    if len(tokens) < 2 or tokens[0] not in ("import", "from"):
+        return None
+    return tokens[1].split(".")[0]
+
+
+_SNAPSHOT: _EnvironmentSnapshot = _EnvironmentSnapshot()
+
+
+def _get_requirements() -> FrozenSet[str]:
+    return _SNAPSHOT.requirements()
+
+
+def _get_minimal_requirements(imports: Iterable[str]) -> FrozenSet[str]:
+    if _metadata is None:
+        warn(
+            "Minimal requirements need importlib.metadata or the importlib_metadata "
+            "backport, falling back to every installed requirement."
+        )
+        return _SNAPSHOT.requirements()
+    index = _SNAPSHOT.module_requirements()
+    requirements = set()
+    for import_line in imports:
+        module = _imported_module(import_line)
+        if module is not None:
+            requirements.update(index.get(module, frozenset()))
+    return frozenset(requirements)
+
+
+def _check_requirements(requirements: Iterable[str]) -> List[str]:
+    versions = _SNAPSHOT.versions()
+    mismatches = []
+    for requirement in sorted(requirements):
+        name, separator, version = requirement.partition("==")
+        if not separator:
+            continue
+        installed = versions.get(_canonicalize_name(name), None)
+        if installed is None:
+            mismatches.append(f"{requirement} (not installed)")
+        elif installed != version:
+            mismatches.append(f"{requirement} (installed {installed})")
+    return mismatches
+
+
+def warm_requirements(background: bool = True) -> None:
+    """
+    Compute the requirements of the running interpreter ahead of the first extraction
+    that asks for them. The result is cached until sys.path or the content of its
+    directories change.
+
+    :param background: If True the requirements are computed on a daemon thread.
+    :type background: bool
+    """
+    if background:
+        Thread(
+            target=_SNAPSHOT.requirements, name="code_extractor-warm", daemon=True
+        ).start()
+    else:
+        _SNAPSHOT.requirements()
+
+
+if os.environ.get(_WARM_ENVIRONMENT_VARIABLE, "") not in ("", "0"):
+    warm_requirements(background=True)
@@ -13,85 +13,268 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import base64
+import hashlib
 import json
-import subprocess
+import marshal
+import pickle
+import re
 import sys
 
-from typing import List, Optional, Set
+from threading import Lock
+from types import CodeType
+from typing import Dict, Iterable, List, Optional, Pattern, Set, Union
+
+from .binary_format import _decode, _encode, _is_binary
+from .compression import _decompress, _is_compressed
+from .environment import _get_requirements
+from .ordering import _order_dependencies
+from .store import DependencyStore, _resolve_sources, _store_sources
+
+# Name of the global the out-of-band buffers are bound to, keyed by their type and the digest
+# of their content, and of the global they were taken from for writable memoryviews.
+_BUFFERS: str = "__code_extractor_buffers__"
+_BUFFER_REFERENCE: Pattern[str] = re.compile(
+    _BUFFERS + r"\['((?:bytes|bytearray|memoryview)-[0-9a-f]+)'\]"
+)
+
+# Quoted since pickle buffers only exist from Python 3.8.
+_Buffer = Union[bytes, bytearray, "memoryview[int]", "pickle.PickleBuffer"]
+
+_VERIFIED_LOCK: Lock = Lock()
+_VERIFIED_BYTECODE: Set[bytes] = set()
 
 
 class _ExtractedCode:
     def __init__(self, get_requirements: bool = True) -> None:
         self.name: str = ""
+        self.names: List[str] = []
         self.code: str = ""
         self.dependencies: Set[str] = set()
+        self.dependency_hashes: Set[str] = set()
         self.imports: Set[str] = set()
         self.requirements: Set[str] = set()
         if get_requirements:
-            req = (
-                subprocess.run(
-                    [sys.executable, "-m", "pip", "freeze"], stdout=subprocess.PIPE
-                )
-                .stdout.decode(encoding="utf-8")
-                .splitlines(keepends=False)
-            )
-            self.requirements = set(req)
+            self.requirements = set(_get_requirements())
         self.frozen_code: Optional[str] = None
+        self._frozen_parts: Optional[List[str]] = None
+        self._digest: Optional[str] = None
+        self.bytecode: Optional[bytes] = None
+        self.bytecode_tag: Optional[str] = None
+        # Never serialized, the pickle API carries them out-of-band.
+        self.buffers: Dict[str, _Buffer] = {}
+
+    @property
+    def digest(self) -> str:
+        # Requirements are left out since they do not change the loaded code.
+        if self._digest is None:
+            digest = hashlib.sha256()
+            for strings in [
+                [self.name],
+                self.names,
+                [self.code],
+                sorted(self.imports),
+                sorted(self.dependencies),
+                sorted(self.dependency_hashes),
+            ]:
+                _update_digest(digest, strings)
+            self._digest = digest.hexdigest()
+        return self._digest
+
+    @property
+    def filename(self) -> str:
+        return f"<code_extractor {self.digest}>"
+
+    @staticmethod
+    def from_string(
+        string: Union[str, bytes, bytearray, "memoryview[int]"]
+    ) -> "_ExtractedCode":
+        if isinstance(string, str):
+            text = string
+        elif isinstance(string, (bytes, bytearray, memoryview)):
+            data = _decompress(string) if _is_compressed(string) else string
+            if _is_binary(data):
+                return _ExtractedCode.from_bytes(data)
+            try:
+                text = str(data, "utf-8")
+            except UnicodeDecodeError:
+                raise ValueError("Invalid code string")
+        else:
+            raise ValueError("Invalid code string")
+        try:
+            json_dict = json.loads(text)
+        except json.JSONDecodeError:
+            raise ValueError("Invalid code string")
+        return _ExtractedCode._from_dict(json_dict)
 
     @staticmethod
-    def from_string(string: str) -> "_ExtractedCode":
-        json_dict = json.loads(string)
-        assert isinstance(json_dict, dict)
+    def from_bytes(
+        buffer: Union[bytes, bytearray, "memoryview[int]"]
+    ) -> "_ExtractedCode":
+        return _ExtractedCode._from_dict(_decode(buffer))
+
+    @staticmethod
+    def _from_dict(dictionary: object) -> "_ExtractedCode":
+        if not isinstance(dictionary, dict):
+            raise ValueError("Invalid code string")
         ret = _ExtractedCode(get_requirements=False)
-        if "frozen_code" in json_dict.keys():
-            ret.frozen_code = json_dict["frozen_code"]
+        if "frozen_code" in dictionary.keys():
+            ret.frozen_code = dictionary["frozen_code"]
+        if "frozen_parts" in dictionary.keys():
+            ret._frozen_parts = list(dictionary["frozen_parts"])
+            ret.frozen_code = "\n".join(ret._frozen_parts)
+        if "names" in dictionary.keys():
+            ret.names = list(dictionary["names"])
+        if "dependency_hashes" in dictionary.keys():
+            ret.dependency_hashes = set(dictionary["dependency_hashes"])
+        if "digest" in dictionary.keys():
+            ret._digest = dictionary["digest"]
+        if "bytecode" in dictionary.keys():
+            bytecode = dictionary["bytecode"]
+            if isinstance(bytecode, str):
+                bytecode = base64.b64decode(bytecode)
+            ret.bytecode = bytecode
+            ret.bytecode_tag = dictionary.get("bytecode_tag", None)
         try:
-            ret.name = json_dict["name"]
-            ret.code = json_dict["code"]
-            ret.dependencies = set(json_dict["dependencies"])
-            ret.imports = set(json_dict["imports"])
-            ret.requirements = set(json_dict["requirements"])
-        except AttributeError:
+            ret.name = dictionary["name"]
+            ret.code = dictionary["code"]
+            ret.dependencies = set(dictionary["dependencies"])
+            ret.imports = set(dictionary["imports"])
+            ret.requirements = set(dictionary["requirements"])
+        except (AttributeError, KeyError, TypeError):
             raise ValueError("Invalid code string")
         return ret
 
     def to_string(self, freeze_code: bool = True) -> str:
-        dictionary = {
+        dictionary = self._to_dict(freeze_code)
+        if self.bytecode is not None:
+            dictionary["bytecode"] = base64.b64encode(self.bytecode).decode("ascii")
+        return json.dumps(dictionary, sort_keys=True)
+
+    def to_bytes(self, freeze_code: bool = True) -> bytes:
+        return _encode(self._to_dict(freeze_code, split_frozen_code=True))
+
+    def _to_dict(
+        self, freeze_code: bool, split_frozen_code: bool = False
+    ) -> Dict[str, Union[str, List[str], bytes]]:
+        dictionary: Dict[str, Union[str, List[str], bytes]] = {
             "name": self.name,
             "code": self.code,
-            "dependencies": list(self.dependencies),
-            "imports": list(self.imports),
-            "requirements": list(self.requirements),
+            "dependencies": sorted(self.dependencies),
+            "imports": sorted(self.imports),
+            "requirements": sorted(self.requirements),
+            "digest": self.digest,
         }
-        if freeze_code:
+        if len(self.names) > 0:
+            dictionary["names"] = self.names
+        if len(self.dependency_hashes) > 0:
+            dictionary["dependency_hashes"] = sorted(self.dependency_hashes)
+        if self.bytecode is not None and self.bytecode_tag is not None:
+            dictionary["bytecode"] = self.bytecode
+            dictionary["bytecode_tag"] = self.bytecode_tag
+        # The frozen code would embed the sources of the stored dependencies.
+        if freeze_code and len(self.dependency_hashes) == 0:
             if self.frozen_code is None:
-                self.frozen_code = self.to_code()
-            dictionary["frozen_code"] = self.frozen_code
-        return json.dumps(dictionary)
+                self._frozen_parts = self._code_parts()
+                self.frozen_code = "\n".join(self._frozen_parts)
+            if split_frozen_code and self._frozen_parts is not None:
+                dictionary["frozen_parts"] = self._frozen_parts
+            else:
+                dictionary["frozen_code"] = self.frozen_code
+        return dictionary
+
+    def store_dependencies(self, store: DependencyStore) -> None:
+        self.dependency_hashes |= _store_sources(self.dependencies, store)
+        self.dependencies = set()
+        self.frozen_code = None
+        self._frozen_parts = None
+        self._digest = None
+
+    def resolve_dependencies(self, store: Optional[DependencyStore]) -> None:
+        if len(self.dependency_hashes) == 0:
+            return
+        if store is None:
+            raise ValueError(
+                f"The code of {self.name or self.names} references stored dependencies, "
+                "a dependency store is required to load it."
+            )
+        self.dependencies |= _resolve_sources(self.dependency_hashes, store)
+        self.dependency_hashes = set()
+
+    def buffer_digests(self) -> Set[str]:
+        digests = set()
+        for source in self.dependencies:
+            if _BUFFERS in source:
+                digests.update(_BUFFER_REFERENCE.findall(source))
+        return digests
+
+    def bind_buffers(self, namespace: Dict[str, object]) -> None:
+        missing = self.buffer_digests() - self.buffers.keys()
+        if len(missing) > 0:
+            raise ValueError(
+                f"The code of {self.name or self.names} references out-of-band buffers "
+                f"that were not provided: {sorted(missing)}"
+            )
+        if len(self.buffers) == 0:
+            return
+        bound = namespace.get(_BUFFERS, None)
+        if not isinstance(bound, dict):
+            bound = namespace[_BUFFERS] = {}
+        for key, buffer in self.buffers.items():
+            bound[key] = _rebuild_buffer(key, buffer)
+
+    def embed_bytecode(self) -> None:
+        tag = sys.implementation.cache_tag
+        if tag is None:
+            return
+        self.bytecode = marshal.dumps(compile(self.to_code(), self.filename, "exec"))
+        self.bytecode_tag = tag
+
+    def compile(self, verify_bytecode: bool = False) -> CodeType:
+        code = self._load_bytecode()
+        if code is None:
+            return compile(self.to_code(), self.filename, "exec")
+        if verify_bytecode:
+            assert self.bytecode is not None
+            key = hashlib.sha256(self.bytecode).digest()
+            with _VERIFIED_LOCK:
+                verified = key in _VERIFIED_BYTECODE
+            if not verified:
+                if compile(self.to_code(), self.filename, "exec") != code:
+                    raise ValueError(
+                        f"The bytecode embedded for {self.name or self.names} "
+                        "does not match its source code"
+                    )
+                with _VERIFIED_LOCK:
+                    _VERIFIED_BYTECODE.add(key)
+        return code
+
+    def _load_bytecode(self) -> Optional[CodeType]:
+        if (
+            self.bytecode is None
+            or self.bytecode_tag is None
+            or self.bytecode_tag != sys.implementation.cache_tag
+        ):
+            return None
+        try:
+            code = marshal.loads(self.bytecode)
+        except (EOFError, ValueError, TypeError):
+            return None
+        return code if isinstance(code, CodeType) else None
 
     def to_code(self) -> str:
         if self.frozen_code is not None:
             return self.frozen_code
-        code = ""
-        for imp in self.imports:
-            code += imp + "\n"
-        deps = []
-        to_order = self.dependencies.copy()
-        while len(to_order) > 0:
-            for remaining_dep in to_order:
-                tmp_deps = deps + [remaining_dep]
-                if _test_dep_order(code, tmp_deps):
-                    deps = tmp_deps
-                    to_order.remove(remaining_dep)
-                    break
-        if len(deps) != len(self.dependencies):
-            raise RuntimeError(
-                f"Cannot find dependency order with dependencies {self.dependencies}"
-            )
-        for dep in deps:
-            code += dep + "\n"
-        code += self.code
-        return code
+        if len(self.dependency_hashes) > 0:
+            raise ValueError("Stored dependencies must be resolved before loading")
+        return "\n".join(self._code_parts())
+
+    def _code_parts(self) -> List[str]:
+        # Imports and dependencies are kept as separate parts so that the binary format can
+        # store the frozen code as references to the strings it already contains.
+        return (
+            sorted(self.imports) + _order_dependencies(self.dependencies) + [self.code]
+        )
 
     def __str__(self) -> str:
         if self.frozen_code is not None:
@@ -121,20 +304,35 @@ class _ExtractedCode:
             return False
         return (
             other.name == self.name
+            and other.names == self.names
             and other.code == self.code
             and other.dependencies == self.dependencies
+            and other.dependency_hashes == self.dependency_hashes
             and other.imports == self.imports
             and other.requirements == self.requirements
             and other.frozen_code == self.frozen_code
         )
 
 
-def _test_dep_order(code: str, deps: List[str]) -> bool:
-    tmp_code = code
-    for dep in deps:
-        tmp_code += dep + "\n"
-    try:
-        exec(tmp_code, {})
-    except NameError:
-        return False
-    return True
+def _update_digest(digest: "hashlib._Hash", strings: Iterable[str]) -> None:
+    strings = list(strings)
+    digest.update(len(strings).to_bytes(8, "little"))
+    for string in strings:
+        encoded = string.encode("utf-8")
+        digest.update(len(encoded).to_bytes(8, "little"))
+        digest.update(encoded)
+
+
+# Buffers are rebuilt as the type of the global they were taken from, memoryviews as flat
+# unsigned bytes that typed globals are cast from and bytearrays as a view that each global
+# copies, only memoryview globals are exposed without copying the pickle buffer.
+def _rebuild_buffer(
+    key: str, buffer: _Buffer
+) -> Union[bytes, bytearray, "memoryview[int]"]:
+    kind = key.split("-", 1)[0]
+    if kind == "memoryview":
+        view = memoryview(buffer)
+        return view if view.ndim == 1 and view.format == "B" else view.cast("B")
+    if kind == "bytearray":
+        return buffer if isinstance(buffer, (bytes, bytearray)) else memoryview(buffer)
+    return buffer if isinstance(buffer, bytes) else bytes(buffer)
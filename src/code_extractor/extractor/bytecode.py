@@ -0,0 +1,94 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Module containing code to inspect the bytecode of live python functions.
+"""
+import dis
+import inspect
+
+from types import CodeType
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+_GLOBAL_LOAD_OPNAMES: Set[str] = {"LOAD_GLOBAL", "LOAD_NAME"}
+_ATTRIBUTE_LOAD_OPNAMES: Set[str] = {"LOAD_ATTR", "LOAD_METHOD"}
+_TRANSPARENT_OPNAMES: Set[str] = {"CACHE", "EXTENDED_ARG", "NOP"}
+_STORE_OPNAMES: Set[str] = {"STORE_NAME", "STORE_GLOBAL"}
+
+
+def _iter_nested_code(code: CodeType) -> Iterator[CodeType]:
+    to_visit = [const for const in code.co_consts if isinstance(const, CodeType)]
+    while len(to_visit) > 0:
+        nested = to_visit.pop()
+        yield nested
+        to_visit.extend(
+            const for const in nested.co_consts if isinstance(const, CodeType)
+        )
+
+
+def _get_nested_global_names(code: CodeType) -> Set[str]:
+    names = set()
+    for nested in _iter_nested_code(code):
+        for instruction in dis.get_instructions(nested):
+            if instruction.opname in _GLOBAL_LOAD_OPNAMES:
+                names.add(instruction.argval)
+    return names
+
+
+def _get_class_global_names(code: CodeType) -> Set[str]:
+    # The code of a compiled class statement loads its bases and decorators, then its body
+    # loads the decorators and default values of the methods and the class attributes.
+    # Function bodies are left out, they are resolved from the live methods.
+    # Every class body loads __name__ to set __module__.
+    names = set()
+    for current_code in [code, *_iter_nested_code(code)]:
+        if current_code.co_flags & inspect.CO_OPTIMIZED:
+            continue
+        stored = set()
+        for instruction in dis.get_instructions(current_code):
+            if instruction.opname in _STORE_OPNAMES:
+                stored.add(instruction.argval)
+            elif (
+                instruction.opname in _GLOBAL_LOAD_OPNAMES
+                and instruction.argval not in stored
+            ):
+                names.add(instruction.argval)
+    names.discard("__name__")
+    return names
+
+
+def _get_attribute_chains(code: CodeType) -> Dict[str, Set[Tuple[str, ...]]]:
+    chains: Dict[str, Set[Tuple[str, ...]]] = {}
+    for current_code in [code, *_iter_nested_code(code)]:
+        chain: Optional[List[str]] = None
+        for instruction in dis.get_instructions(current_code):
+            if instruction.opname in _TRANSPARENT_OPNAMES:
+                continue
+            if chain is not None and instruction.opname in _ATTRIBUTE_LOAD_OPNAMES:
+                chain.append(instruction.argval)
+                continue
+            _add_chain(chains, chain)
+            chain = None
+            if instruction.opname in _GLOBAL_LOAD_OPNAMES:
+                chain = [instruction.argval]
+        _add_chain(chains, chain)
+    return chains
+
+
+def _add_chain(
+    chains: Dict[str, Set[Tuple[str, ...]]], chain: Optional[List[str]]
+) -> None:
+    if chain is not None and len(chain) > 1:
+        chains.setdefault(chain[0], set()).add(tuple(chain[1:]))
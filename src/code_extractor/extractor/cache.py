@@ -0,0 +1,216 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Module containing code for a persistent cache of extracted code.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from threading import Lock
+from typing import Iterable, List, Optional, Tuple, Union
+
+from ..database import AutoClosingConnection
+
+_FileRecord = Tuple[str, int, int, str]
+# Hits only record their access time if the stored one is older than this many seconds,
+# so that most reads do not write to the database.
+_TOUCH_INTERVAL: float = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    payload BLOB NOT NULL,
+    files TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+
+class ExtractionCache:
+    """
+    Persistent cache of extracted code stored in a SQLite database.
+
+    Entries are keyed by the qualified name of the extracted object, the Python version and the
+    version of this package, and are only returned while every source file in the dependency
+    closure still has the hash it had when the entry was stored. Entries holding requirements are
+    also keyed by the installed packages, so installing or upgrading one misses them.
+    Values computed at runtime
+    (for example globals mutated after import) are not tracked.
+    The database can be shared by several processes.
+
+    :param path: The path of the SQLite database file.
+    :type path: str
+    :param max_bytes: The maximum total size of the stored payloads.
+        Least recently used entries are evicted when it is exceeded.
+    :type max_bytes: int
+    :param max_entries: The maximum number of stored entries, or None for no limit.
+    :type max_entries: Optional[int]
+    :param timeout: How many seconds to wait for another process holding the database lock.
+    :type timeout: float
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_entries: Optional[int] = None,
+        timeout: float = 30.0,
+    ) -> None:
+        self.path: str = os.path.abspath(path)
+        self.max_bytes: int = max_bytes
+        self.max_entries: Optional[int] = max_entries
+        self.timeout: float = timeout
+        self.hits: int = 0
+        self.misses: int = 0
+        self._lock: Lock = Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(_SCHEMA)
+
+    def get(self, key: str) -> Optional[Union[str, bytes]]:
+        """
+        Return the payload stored for key if every tracked source file is unchanged.
+
+        :param key: The cache key.
+        :type key: str
+        :return: The stored payload or None.
+        :rtype: Optional[Union[str, bytes]]
+        """
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT payload, files, last_used FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._count(hit=False)
+                return None
+            payload, files, last_used = row
+            if not _files_unchanged(json.loads(files)):
+                connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._count(hit=False)
+                return None
+            now = time.time()
+            if now - last_used >= _TOUCH_INTERVAL:
+                connection.execute(
+                    "UPDATE entries SET last_used = ? WHERE key = ?", (now, key)
+                )
+        self._count(hit=True)
+        return payload
+
+    def put(self, key: str, payload: Union[str, bytes], files: Iterable[str]) -> None:
+        """
+        Store payload for key together with the hashes of the given source files.
+
+        :param key: The cache key.
+        :type key: str
+        :param payload: The extracted code.
+        :type payload: Union[str, bytes]
+        :param files: The source files the payload was extracted from.
+        :type files: Iterable[str]
+        """
+        records = _hash_files(files)
+        if records is None:
+            return
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, payload, json.dumps(records), size, time.time()),
+            )
+            self._evict(connection)
+
+    def clear(self) -> None:
+        """
+        Remove every entry from the cache.
+        """
+        with self._connect() as connection:
+            connection.execute("DELETE FROM entries")
+
+    def __len__(self) -> int:
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        count, total = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        if total <= self.max_bytes and (
+            self.max_entries is None or count <= self.max_entries
+        ):
+            return
+        to_delete = []
+        for key, size in connection.execute(
+            "SELECT key, size FROM entries ORDER BY last_used ASC"
+        ):
+            if total <= self.max_bytes and (
+                self.max_entries is None or count <= self.max_entries
+            ):
+                break
+            to_delete.append((key,))
+            total -= size
+            count -= 1
+        connection.executemany("DELETE FROM entries WHERE key = ?", to_delete)
+
+    def _connect(self) -> AutoClosingConnection:
+        return AutoClosingConnection(self.path, self.timeout)
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _hash_files(files: Iterable[str]) -> Optional[List[_FileRecord]]:
+    records = []
+    for path in sorted(set(files)):
+        try:
+            stat = os.stat(path)
+            records.append((path, stat.st_mtime_ns, stat.st_size, _hash_file(path)))
+        except OSError:
+            return None
+    return records
+
+
+def _files_unchanged(records: List[_FileRecord]) -> bool:
+    for path, mtime, size, digest in records:
+        try:
+            stat = os.stat(path)
+            if stat.st_mtime_ns == mtime and stat.st_size == size:
+                continue
+            if _hash_file(path) != digest:
+                return False
+        except OSError:
+            return False
+    return True
@@ -0,0 +1,156 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Module containing code to classify modules as user-defined or third-party.
+"""
+import bisect
+import os
+import site
+import sys
+
+from threading import Lock
+from types import ModuleType
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+_ADDITIONAL_PATH_KEYWORDS: Set[str] = {os.path.dirname(os.__file__)}
+_USER_BASE: Optional[str] = None
+try:
+    _USER_BASE = site.getuserbase()
+except AttributeError:
+    _USER_BASE = None
+_USER_SITE_PACKAGES: Optional[str] = None
+try:
+    _USER_SITE_PACKAGES = site.getusersitepackages()
+except AttributeError:
+    _USER_SITE_PACKAGES = None
+_SITE_PACKAGES: List[str] = []
+try:
+    _SITE_PACKAGES = site.getsitepackages()
+except AttributeError:
+    _SITE_PACKAGES = []
+_POSSIBLE_SITE_PATHS: Set[str] = set()
+if _USER_BASE is not None:
+    _POSSIBLE_SITE_PATHS.add(_USER_BASE)
+if _USER_SITE_PACKAGES is not None:
+    _POSSIBLE_SITE_PATHS.add(_USER_SITE_PACKAGES)
+if len(_SITE_PACKAGES) > 0:
+    _POSSIBLE_SITE_PATHS.update(_SITE_PACKAGES)
+for sys_path in sys.path:
+    for keyword in _ADDITIONAL_PATH_KEYWORDS:
+        if keyword in sys_path:
+            _POSSIBLE_SITE_PATHS.add(sys_path)
+
+
+class _ModuleClassifier:
+    def __init__(self, site_paths: Set[str]) -> None:
+        self._site_paths: Set[str] = site_paths
+        self._lock: Lock = Lock()
+        self._snapshot: Optional[Tuple[Tuple[str, ...], FrozenSet[str]]] = None
+        self._prefixes: List[str] = []
+        self._verdicts: Dict[str, bool] = {}
+
+    def is_user_defined(self, module: ModuleType) -> bool:
+        self._refresh()
+        name = module.__name__
+        verdict = self._verdicts.get(name, None)
+        if verdict is None:
+            module_path = getattr(module, "__file__", None)
+            if module_path is not None:
+                verdict = not self._is_third_party_path(module_path)
+            else:
+                verdict = False
+            self._verdicts[name] = verdict
+        return verdict
+
+    def is_user_defined_path(self, path: str) -> bool:
+        self._refresh()
+        return not self._is_third_party_path(path)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._snapshot = None
+
+    def _refresh(self) -> None:
+        snapshot = (tuple(sys.path), frozenset(self._site_paths))
+        if snapshot == self._snapshot:
+            return
+        with self._lock:
+            if snapshot == self._snapshot:
+                return
+            roots = set(snapshot[1])
+            for sys_path in snapshot[0]:
+                for keyword in _ADDITIONAL_PATH_KEYWORDS:
+                    if keyword in sys_path:
+                        roots.add(sys_path)
+            prefixes = sorted(_normalize_root(root) for root in roots if root)
+            prefix_free: List[str] = []
+            for prefix in prefixes:
+                if len(prefix_free) == 0 or not prefix.startswith(prefix_free[-1]):
+                    prefix_free.append(prefix)
+            self._prefixes = prefix_free
+            self._verdicts = {}
+            self._snapshot = snapshot
+
+    def _is_third_party_path(self, path: str) -> bool:
+        path = _normalize_path(path)
+        prefixes = self._prefixes
+        index = bisect.bisect_right(prefixes, path) - 1
+        return index >= 0 and path.startswith(prefixes[index])
+
+
+def _normalize_path(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _normalize_root(root: str) -> str:
+    root = _normalize_path(root)
+    if not root.endswith(os.sep):
+        root += os.sep
+    return root
+
+
+_CLASSIFIER: _ModuleClassifier = _ModuleClassifier(_POSSIBLE_SITE_PATHS)
+
+
+def _is_user_defined_module(module: ModuleType) -> bool:
+    return _CLASSIFIER.is_user_defined(module)
+
+
+def _is_user_defined_path(path: str) -> bool:
+    return _CLASSIFIER.is_user_defined_path(path)
+
+
+def register_third_party_path(path: str) -> None:
+    """
+    Register a directory whose modules are treated as third-party dependencies
+    (imported on load) instead of being extracted as user-defined source code.
+
+    :param path: The root directory of the third-party modules.
+    :type path: str
+    """
+    _POSSIBLE_SITE_PATHS.add(path)
+    _CLASSIFIER.invalidate()
+
+
+def unregister_third_party_path(path: str) -> None:
+    """
+    Remove a directory previously registered with register_third_party_path.
+
+    :param path: The root directory of the third-party modules.
+    :type path: str
+    """
+    _POSSIBLE_SITE_PATHS.discard(path)
+    _CLASSIFIER.invalidate()
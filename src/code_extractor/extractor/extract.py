@@ -16,75 +16,157 @@
 """
 Module containing code for extracting source code from live python objects.
 """
+import __future__
 import importlib
+import importlib.util
 import inspect
+import json
 import enum
 import pickle
-import os
-import re
-import site
 import sys
-import textwrap
 
-from threading import Lock
-from types import ModuleType
+from types import CodeType, ModuleType
 from typing import (
+    TYPE_CHECKING,
     Callable,
     Dict,
     Iterable,
     List,
+    Mapping,
     Optional,
-    Pattern,
     Set,
     Tuple,
     Type,
     Union,
+    overload,
 )
 from warnings import warn
 
-from ..extracted_code import _ExtractedCode
-from .literals import _save_literal, _BUILTINS_TYPES
+from .. import __version__
+from ..compression import _compress
+from ..environment import _environment_fingerprint, _get_minimal_requirements
+from ..extracted_code import _Buffer, _ExtractedCode
+from ..ordering import _conflicting_names
+from ..store import DependencyStore
+from .cache import ExtractionCache
+from .classify import (
+    _POSSIBLE_SITE_PATHS,
+    _is_user_defined_module,
+    _is_user_defined_path,
+)
+from .bytecode import (
+    _get_attribute_chains,
+    _get_class_global_names,
+    _get_nested_global_names,
+)
+from .literals import _is_large_buffer, _save_buffer, _save_literal, _BUILTINS_TYPES
+from .source import _get_source, _source_path
+
+# Literal types only exist from Python 3.8.
+if TYPE_CHECKING:
+    from typing import Literal
 
-_MODULE_LOCK: Lock = Lock()
-_SAVED_CODE: Set[str] = set()
 _BUILTINS_MODULE_NAMES: Set[str] = {"__builtin__", "__builtins__", "builtins"}
-_NESTED_DETECTOR: Pattern[str] = re.compile(
-    r"(\A|\n)[\t ]+(async def |def )[a-zA-Z_-]+\([a-zA-Z0-9,:_.-\[\] ]*\)"
-)
-_ADDITIONAL_PATH_KEYWORDS: Set[str] = {os.path.dirname(os.__file__)}
-_USER_BASE: Optional[str] = None
-try:
-    _USER_BASE = site.getuserbase()
-except AttributeError:
-    _USER_BASE = None
-_USER_SITE_PACKAGES: Optional[str] = None
-try:
-    _USER_SITE_PACKAGES = site.getusersitepackages()
-except AttributeError:
-    _USER_SITE_PACKAGES = None
-_SITE_PACKAGES: List[str] = []
-try:
-    _SITE_PACKAGES = site.getsitepackages()
-except AttributeError:
-    _SITE_PACKAGES = []
-_POSSIBLE_SITE_PATHS: Set[str] = set()
-if _USER_BASE is not None:
-    _POSSIBLE_SITE_PATHS.add(_USER_BASE)
-if _USER_SITE_PACKAGES is not None:
-    _POSSIBLE_SITE_PATHS.add(_USER_SITE_PACKAGES)
-if len(_SITE_PACKAGES) > 0:
-    _POSSIBLE_SITE_PATHS.update(_SITE_PACKAGES)
-for sys_path in sys.path:
-    for keyword in _ADDITIONAL_PATH_KEYWORDS:
-        if keyword in sys_path:
-            _POSSIBLE_SITE_PATHS.add(sys_path)
+_SUBMODULE_CACHE: Dict[str, bool] = {}
+
+
+_DependencyNode = Tuple[
+    Set[str], Set[str], List[Union[Type[object], Callable[..., object]]]
+]
+
+
+class _ExtractionContext:
+    def __init__(self, buffer_threshold: Optional[int] = None) -> None:
+        self.functions: Dict[
+            Union[Type[object], Callable[..., object]], List[Callable[..., object]]
+        ] = {}
+        self.function_nodes: Dict[Callable[..., object], _DependencyNode] = {}
+        self.class_nodes: Dict[Type[object], _DependencyNode] = {}
+        self.dependencies: Dict[
+            Union[Type[object], Callable[..., object]], Tuple[Set[str], Set[str]]
+        ] = {}
+        # Bytes-like globals of at least this size are carried out-of-band, by type and digest.
+        self.buffer_threshold: Optional[int] = buffer_threshold
+        self.buffers: Dict[str, _Buffer] = {}
+
+
+# Payloads in the binary format or compressed are bytes, JSON payloads are strings.
+@overload
+def extract_code(
+    obj: Union[object, Type[object], Callable[..., object]],
+    get_requirements: bool = ...,
+    freeze_code: bool = ...,
+    cache: Optional[ExtractionCache] = ...,
+    minimal_requirements: bool = ...,
+    binary: "Literal[False]" = ...,
+    compression: None = ...,
+    compression_level: Optional[int] = ...,
+    store: Optional[DependencyStore] = ...,
+    embed_bytecode: bool = ...,
+) -> str:
+    ...  # pragma: no cover
+
+
+@overload
+def extract_code(
+    obj: Union[object, Type[object], Callable[..., object]],
+    get_requirements: bool = ...,
+    freeze_code: bool = ...,
+    cache: Optional[ExtractionCache] = ...,
+    minimal_requirements: bool = ...,
+    binary: "Literal[True]" = ...,
+    compression: Optional[str] = ...,
+    compression_level: Optional[int] = ...,
+    store: Optional[DependencyStore] = ...,
+    embed_bytecode: bool = ...,
+) -> bytes:
+    ...  # pragma: no cover
+
+
+@overload
+def extract_code(
+    obj: Union[object, Type[object], Callable[..., object]],
+    get_requirements: bool = ...,
+    freeze_code: bool = ...,
+    cache: Optional[ExtractionCache] = ...,
+    minimal_requirements: bool = ...,
+    binary: bool = ...,
+    compression: str = ...,
+    compression_level: Optional[int] = ...,
+    store: Optional[DependencyStore] = ...,
+    embed_bytecode: bool = ...,
+) -> bytes:
+    ...  # pragma: no cover
+
+
+@overload
+def extract_code(
+    obj: Union[object, Type[object], Callable[..., object]],
+    get_requirements: bool = ...,
+    freeze_code: bool = ...,
+    cache: Optional[ExtractionCache] = ...,
+    minimal_requirements: bool = ...,
+    binary: bool = ...,
+    compression: Optional[str] = ...,
+    compression_level: Optional[int] = ...,
+    store: Optional[DependencyStore] = ...,
+    embed_bytecode: bool = ...,
+) -> Union[str, bytes]:
+    ...  # pragma: no cover
 
 
 def extract_code(
     obj: Union[object, Type[object], Callable[..., object]],
     get_requirements: bool = False,
     freeze_code: bool = True,
-) -> str:
+    cache: Optional[ExtractionCache] = None,
+    minimal_requirements: bool = False,
+    binary: bool = False,
+    compression: Optional[str] = None,
+    compression_level: Optional[int] = None,
+    store: Optional[DependencyStore] = None,
+    embed_bytecode: bool = False,
+) -> Union[str, bytes]:
     """
     Extract the source code from the specified object. If it is an instance, the code for the class is
     extracted, if it is a function, the code for the function is extracted. Dependencies and imports are
@@ -98,9 +180,180 @@ def extract_code(
     :param freeze_code: If True the code to recreate obj is calculated and included in the
         string.
     :type freeze_code: bool
+    :param cache: If specified, the persistent cache the string is looked up in before
+        extracting and stored in after extracting.
+    :type cache: Optional[ExtractionCache]
+    :param minimal_requirements: If True and get_requirements is True, only the pinned
+        distributions providing the extracted imports are included instead of the whole pip freeze.
+    :type minimal_requirements: bool
+    :param binary: If True the compact binary format is returned instead of a JSON string.
+    :type binary: bool
+    :param compression: If specified, the compression method ("zlib" or "lzma") the returned
+        bytes are compressed with. Compressed code is detected automatically on load.
+    :type compression: Optional[str]
+    :param compression_level: The compression level, the method default if not specified.
+    :type compression_level: Optional[int]
+    :param store: If specified, the sources of the dependencies are put in the store and only
+        their digests are included, and freeze_code is ignored. The same store must be passed
+        when loading.
+    :type store: Optional[DependencyStore]
+    :param embed_bytecode: If True the compiled code is included as well, so that loading it
+        with the same Python implementation and version skips compilation.
+    :type embed_bytecode: bool
     :return: The string with the extracted information.
-    :rtype: str
+    :rtype: str, bytes
     """
+    obj = _get_extractable(obj)
+    cache_key = None
+    if cache is not None:
+        cache_key = _get_cache_key(
+            obj,
+            get_requirements,
+            freeze_code,
+            minimal_requirements,
+            binary,
+            compression,
+            compression_level,
+            store is not None,
+            embed_bytecode,
+        )
+        cached = cache.get(cache_key)
+        if cached is not None and _is_stored(cached, store):
+            return cached
+    context = _ExtractionContext()
+    to_return = _serialize(
+        _extract_code(
+            obj,
+            context,
+            get_requirements=get_requirements,
+            minimal_requirements=minimal_requirements,
+        ),
+        freeze_code,
+        binary,
+        compression,
+        compression_level,
+        store,
+        embed_bytecode,
+    )
+    if cache is not None and cache_key is not None:
+        files = [_source_path(visited) for visited in context.functions.keys()]
+        if None not in files:
+            cache.put(cache_key, to_return, files)
+    return to_return
+
+
+def extract_many(
+    objs: Iterable[Union[object, Type[object], Callable[..., object]]],
+    get_requirements: bool = False,
+    freeze_code: bool = True,
+    bundle: bool = False,
+    minimal_requirements: bool = False,
+    binary: bool = False,
+    compression: Optional[str] = None,
+    compression_level: Optional[int] = None,
+    store: Optional[DependencyStore] = None,
+    embed_bytecode: bool = False,
+) -> Union[List[Union[str, bytes]], str, bytes]:
+    """
+    Extract the source code from each of the specified objects as extract_code would.
+    The dependency graph is resolved once for all the objects, so dependencies shared
+    between them are only analyzed once.
+
+    :param objs: The objects to extract the source code from.
+    :type objs: Iterable[type(object), Callable[..., object]]
+    :param get_requirements: If True will include a pip freeze in the strings.
+        Useful to ensure the environment is compatible.
+    :type get_requirements: bool
+    :param freeze_code: If True the code to recreate the objects is calculated and included
+        in the strings.
+    :type freeze_code: bool
+    :param bundle: If True a single string containing all the objects and their shared
+        dependencies is returned (to be loaded with load_many) instead of one string per object.
+        Objects whose code defines different values for the same names raise ValueError.
+    :type bundle: bool
+    :param minimal_requirements: If True and get_requirements is True, only the pinned
+        distributions providing the extracted imports are included instead of the whole pip freeze.
+    :type minimal_requirements: bool
+    :param binary: If True the compact binary format is returned instead of JSON strings.
+    :type binary: bool
+    :param compression: If specified, the compression method ("zlib" or "lzma") the returned
+        bytes are compressed with. Compressed code is detected automatically on load.
+    :type compression: Optional[str]
+    :param compression_level: The compression level, the method default if not specified.
+    :type compression_level: Optional[int]
+    :param store: If specified, the sources of the dependencies are put in the store and only
+        their digests are included, and freeze_code is ignored. The same store must be passed
+        when loading.
+    :type store: Optional[DependencyStore]
+    :param embed_bytecode: If True the compiled code is included as well, so that loading it
+        with the same Python implementation and version skips compilation.
+    :type embed_bytecode: bool
+    :return: The list of strings with the extracted information or the bundle string.
+    :rtype: List[str], List[bytes], str, bytes
+    """
+    context = _ExtractionContext()
+    extractable = [_get_extractable(obj) for obj in objs]
+    if bundle:
+        return _serialize(
+            _extract_bundle(
+                extractable,
+                context,
+                get_requirements=get_requirements,
+                minimal_requirements=minimal_requirements,
+            ),
+            freeze_code,
+            binary,
+            compression,
+            compression_level,
+            store,
+            embed_bytecode,
+        )
+    return [
+        _serialize(
+            _extract_code(
+                obj,
+                context,
+                get_requirements=get_requirements,
+                minimal_requirements=minimal_requirements,
+            ),
+            freeze_code,
+            binary,
+            compression,
+            compression_level,
+            store,
+            embed_bytecode,
+        )
+        for obj in extractable
+    ]
+
+
+def _serialize(
+    extracted_code: _ExtractedCode,
+    freeze_code: bool,
+    binary: bool,
+    compression: Optional[str],
+    compression_level: Optional[int],
+    store: Optional[DependencyStore],
+    embed_bytecode: bool,
+) -> Union[str, bytes]:
+    if embed_bytecode:
+        extracted_code.embed_bytecode()
+    if store is not None:
+        extracted_code.store_dependencies(store)
+    if binary:
+        data = extracted_code.to_bytes(freeze_code=freeze_code)
+    else:
+        data = extracted_code.to_string(freeze_code=freeze_code)
+    if compression is None:
+        return data
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return _compress(data, compression, compression_level)
+
+
+def _get_extractable(
+    obj: Union[object, Type[object], Callable[..., object]]
+) -> Union[Type[object], Callable[..., object]]:
     if inspect.isbuiltin(obj):
         raise ValueError("Cannot extract code from builtins.")
     if inspect.isroutine(obj):
@@ -108,81 +361,240 @@ def extract_code(
             obj = obj.__getattribute__("__func__")
     elif not inspect.isclass(obj):
         obj = obj.__class__
-    global _MODULE_LOCK
-    global _SAVED_CODE
-    with _MODULE_LOCK:
-        to_return = _extract_code(obj, get_requirements=get_requirements).to_string(
-            freeze_code=freeze_code
-        )
-        _SAVED_CODE = set()
-    return to_return
+    return obj
+
+
+def _is_stored(payload: Union[str, bytes], store: Optional[DependencyStore]) -> bool:
+    if store is None:
+        return True
+    digests = _ExtractedCode.from_string(payload).dependency_hashes
+    return len(store.get_many(digests)) == len(digests)
+
+
+def _get_cache_key(
+    obj: Union[Type[object], Callable[..., object]],
+    get_requirements: bool,
+    freeze_code: bool,
+    minimal_requirements: bool,
+    binary: bool,
+    compression: Optional[str],
+    compression_level: Optional[int],
+    store: bool,
+    embed_bytecode: bool,
+) -> str:
+    return json.dumps(
+        [
+            getattr(obj, "__module__", None),
+            getattr(obj, "__qualname__", None),
+            _source_path(obj),
+            sys.version,
+            __version__,
+            get_requirements,
+            freeze_code,
+            minimal_requirements,
+            binary,
+            compression,
+            compression_level,
+            store,
+            embed_bytecode,
+            # Requirements are read from the installed packages.
+            _environment_fingerprint() if get_requirements else None,
+        ]
+    )
 
 
 def _extract_code(
-    obj: Union[Type[object], Callable[..., object]], get_requirements: bool = False
+    obj: Union[Type[object], Callable[..., object]],
+    context: _ExtractionContext,
+    get_requirements: bool = False,
+    minimal_requirements: bool = False,
 ) -> _ExtractedCode:
-    extracted_code = _ExtractedCode(get_requirements=get_requirements)
+    extracted_code = _ExtractedCode(
+        get_requirements=get_requirements and not minimal_requirements
+    )
     object_name = getattr(obj, "__name__", None)
     if object_name is None:
         raise RuntimeError(f"Expected {obj} to have attribute __name__")
     extracted_code.name = object_name
-    source_code = textwrap.dedent(inspect.getsource(obj))
-    _SAVED_CODE.add(source_code)
+    source_code = _get_source(obj)
+    extracted_code.code = _strip_decorators(obj, source_code)
+    dependencies, imports = _get_dependencies(obj, context)
+    extracted_code.dependencies = dependencies - {source_code}
+    extracted_code.imports = set(imports)
+    if context.buffer_threshold is not None:
+        extracted_code.buffers = {
+            digest: context.buffers[digest]
+            for digest in extracted_code.buffer_digests()
+        }
+    if get_requirements and minimal_requirements:
+        extracted_code.requirements = set(_get_minimal_requirements(imports))
+    return extracted_code
+
+
+def _extract_bundle(
+    objs: List[Union[Type[object], Callable[..., object]]],
+    context: _ExtractionContext,
+    get_requirements: bool = False,
+    minimal_requirements: bool = False,
+) -> _ExtractedCode:
+    extracted_code = _ExtractedCode(
+        get_requirements=get_requirements and not minimal_requirements
+    )
+    dependencies, imports = _collect_dependencies(objs, context)
+    sources = set()
+    codes = set()
+    for obj in objs:
+        object_name = getattr(obj, "__name__", None)
+        if object_name is None:
+            raise RuntimeError(f"Expected {obj} to have attribute __name__")
+        extracted_code.names.append(object_name)
+        source_code = _get_source(obj)
+        sources.add(source_code)
+        codes.add(_strip_decorators(obj, source_code))
+    extracted_code.dependencies = (dependencies - sources) | codes
+    extracted_code.imports = imports
+    # Every object and dependency of a bundle is loaded in one namespace.
+    conflicts = _conflicting_names(imports | extracted_code.dependencies)
+    if len(conflicts) > 0:
+        raise ValueError(
+            f"Cannot bundle objects whose code defines different values for the same names: "
+            f"{conflicts}, extract them without bundle instead"
+        )
+    if context.buffer_threshold is not None:
+        extracted_code.buffers = {
+            digest: context.buffers[digest]
+            for digest in extracted_code.buffer_digests()
+        }
+    if get_requirements and minimal_requirements:
+        extracted_code.requirements = set(_get_minimal_requirements(imports))
+    return extracted_code
+
+
+def _strip_decorators(
+    obj: Union[Type[object], Callable[..., object]], source_code: str
+) -> str:
     if inspect.isroutine(obj):
         if source_code.startswith("@") and "@staticmethod\n" in source_code:
             source_code = source_code.replace("@staticmethod\n", "")
         if source_code.startswith("@") and "@property\n" in source_code:
             source_code = source_code.replace("@property\n", "")
-    extracted_code.code = source_code
-    dependencies, imports = _get_dependencies(obj)
-    extracted_code.dependencies = dependencies
-    extracted_code.imports = imports
-    return extracted_code
+    return source_code
 
 
 def _get_dependencies(
-    obj: Union[Type[object], Callable[..., object]]
+    obj: Union[Type[object], Callable[..., object]], context: _ExtractionContext
 ) -> Tuple[Set[str], Set[str]]:
-    if inspect.isroutine(obj):
-        dependencies, imports = _get_function_dependencies(obj)
-    else:
-        assert inspect.isclass(obj)
-        imports = set()
-        dependencies = set()
-        functions = dir(obj)
-        for function_name in functions:
-            func = getattr(obj, function_name)
-            if inspect.isfunction(func):
-                new_dep, new_imp = _get_function_dependencies(func)
-                dependencies.update(new_dep)
-                imports.update(new_imp)
-    return dependencies, imports
+    cached = context.dependencies.get(obj, None)
+    if cached is None:
+        cached = _collect_dependencies([obj], context)
+        context.dependencies[obj] = cached
+    return cached
 
 
-def _get_function_dependencies(obj: Callable[..., object]) -> Tuple[Set[str], Set[str]]:
+def _collect_dependencies(
+    objs: List[Union[Type[object], Callable[..., object]]],
+    context: _ExtractionContext,
+) -> Tuple[Set[str], Set[str]]:
     imports = set()
     dependencies = set()
+    visited = set(objs)
+    to_visit = list(objs)
+    while len(to_visit) > 0:
+        current = to_visit.pop()
+        nodes = [
+            _get_function_dependencies(func, context)
+            for func in _get_functions(current, context)
+        ]
+        if inspect.isclass(current):
+            nodes.append(_get_class_dependencies(current, context))
+        for new_dep, new_imp, children in nodes:
+            dependencies.update(new_dep)
+            imports.update(new_imp)
+            for child in children:
+                if child not in visited:
+                    visited.add(child)
+                    to_visit.append(child)
+    return dependencies, imports
+
+
+def _get_functions(
+    obj: Union[Type[object], Callable[..., object]], context: _ExtractionContext
+) -> List[Callable[..., object]]:
+    functions = context.functions.get(obj, None)
+    if functions is None:
+        if inspect.isroutine(obj):
+            functions = [obj]
+        else:
+            assert inspect.isclass(obj)
+            functions = []
+            for function_name in dir(obj):
+                func = getattr(obj, function_name)
+                if inspect.isfunction(func):
+                    functions.append(func)
+        context.functions[obj] = functions
+    return functions
+
+
+def _get_function_dependencies(
+    obj: Callable[..., object], context: _ExtractionContext
+) -> _DependencyNode:
+    node = context.function_nodes.get(obj, None)
+    if node is None:
+        node = _resolve_function_dependencies(obj, context)
+        context.function_nodes[obj] = node
+    return node
+
+
+def _resolve_function_dependencies(
+    obj: Callable[..., object], context: Optional[_ExtractionContext] = None
+) -> _DependencyNode:
     closure_vars = inspect.getclosurevars(obj)
     builtins_closure_vars = closure_vars.builtins
     global_closure_vars = closure_vars.globals
     non_local_closure_vars = closure_vars.nonlocals
     unbound_closure_vars = closure_vars.unbound
-    if _NESTED_DETECTOR.search(inspect.getsource(obj)) is not None:
+    nested_global_vars = _get_nested_globals(obj)
+    attribute_chains = _get_function_attribute_chains(obj)
+    if len(nested_global_vars) > 0:
         global_closure_vars = dict(global_closure_vars)
-        global_closure_vars.update(_get_nested_globals(obj))
+        global_closure_vars.update(nested_global_vars)
     for name, closure_var in builtins_closure_vars.items():
         pass
+    node = _resolve_globals(global_closure_vars, attribute_chains, context)
+    for name, closure_var in non_local_closure_vars.items():
+        pass
+    for name in unbound_closure_vars:
+        pass
+    return node
+
+
+def _get_class_dependencies(
+    cls: Type[object], context: _ExtractionContext
+) -> _DependencyNode:
+    node = context.class_nodes.get(cls, None)
+    if node is None:
+        code = _compile_class(cls)
+        if code is None:
+            node = (set(), set(), [])
+        else:
+            node = _resolve_globals(
+                _get_class_globals(cls, code), _get_attribute_chains(code), context
+            )
+        context.class_nodes[cls] = node
+    return node
+
+
+def _resolve_globals(
+    global_closure_vars: Mapping[str, object],
+    attribute_chains: Dict[str, Set[Tuple[str, ...]]],
+    context: Optional[_ExtractionContext],
+) -> _DependencyNode:
+    imports = set()
+    dependencies = set()
+    children = []
     for name, closure_var in global_closure_vars.items():
         if inspect.ismodule(closure_var):
-            module_path = getattr(closure_var, "__file__", None)
-            if module_path is not None:
-                user_defined = True
-                for possible_path in _POSSIBLE_SITE_PATHS:
-                    if possible_path in module_path:
-                        user_defined = False
-            else:
-                user_defined = False
-            if user_defined:
+            if _is_user_defined_module(closure_var):
                 raise NotImplementedError(
                     f"Error with dependency {closure_var}: "
                     f"Not found in possible paths: {_POSSIBLE_SITE_PATHS}"
@@ -194,51 +606,10 @@ def _get_function_dependencies(obj: Callable[..., object]) -> Tuple[Set[str], Se
                 else:
                     assert "." not in name
                     imports.add(f"import {closure_var.__name__} as {name}")
-                possible_other_vars = list(unbound_closure_vars)
-                possible_other_vars.extend(global_closure_vars.keys())
-                modules = [closure_var.__name__]
-                for module in modules:
-                    for possible_other_var in possible_other_vars:
-                        possible_module = f"{module}.{possible_other_var}"
-                        try:
-                            imported_submodule = importlib.import_module(
-                                possible_module
-                            )
-                            assert inspect.ismodule(imported_submodule)
-                            imports.add(f"import {possible_module}")
-                            modules.append(possible_module)
-                        except ModuleNotFoundError:
-                            pass
-                variables = [(closure_var.__name__, closure_var)]
-                for variable_name, variable in variables:
-                    for possible_other_var in possible_other_vars:
-                        try:
-                            possible_variable = getattr(variable, possible_other_var)
-                        except AttributeError:
-                            continue
-                        if inspect.ismodule(possible_variable):
-                            variables.append(
-                                (
-                                    f"{variable_name}.{possible_other_var}",
-                                    possible_variable,
-                                )
-                            )
-                        elif type(possible_variable) in _BUILTINS_TYPES:
-                            new_dep, new_imp = _save_literal(
-                                f"{variable_name}.{possible_other_var}",
-                                possible_variable,
-                            )
-                            dependencies.update(new_dep)
-                            imports.update(new_imp)
-                        elif isinstance(possible_variable, enum.EnumMeta):
-                            imports.add("import enum")
-                            value = possible_other_var
-                            names = [
-                                (data.name, data.value) for data in possible_variable
-                            ]
-                            dependencies.add(
-                                f"{variable_name}.{value} = enum.Enum(value='{value}', names={names})\n"
-                            )
+                for chain in attribute_chains.get(name, set()):
+                    new_dep, new_imp = _resolve_attribute_chain(closure_var, chain)
+                    dependencies.update(new_dep)
+                    imports.update(new_imp)
         elif isinstance(closure_var, enum.EnumMeta):
             imports.add("import enum")
             value = name
@@ -246,49 +617,20 @@ def _get_function_dependencies(obj: Callable[..., object]) -> Tuple[Set[str], Se
             dependencies.add(f"{value} = enum.Enum(value='{value}', names={names})\n")
         elif inspect.isroutine(closure_var) or inspect.isclass(closure_var):
             module = _guess_module(closure_var)
-            module_path = getattr(module, "__file__", None)
-            if module_path is not None:
-                user_defined = True
-                for possible_path in _POSSIBLE_SITE_PATHS:
-                    if possible_path in module_path:
-                        user_defined = False
-            else:
-                user_defined = False
-            if user_defined:
+            if _is_user_defined_object(module, closure_var):
                 if inspect.isbuiltin(closure_var):
                     raise ValueError(
                         f"Cannot save user-defined built-in function {closure_var}"
                     )
                 else:
                     if _has_source(closure_var):
-                        if (
-                            textwrap.dedent(inspect.getsource(closure_var))
-                            not in _SAVED_CODE
-                        ):
-                            dependencies.add(
-                                textwrap.dedent(inspect.getsource(closure_var))
-                            )
-                            _SAVED_CODE.add(
-                                textwrap.dedent(inspect.getsource(closure_var))
-                            )
-                            new_dep, new_imp = _get_dependencies(closure_var)
-                            dependencies.update(new_dep)
-                            imports.update(new_imp)
-                            if inspect.isclass(closure_var):
-                                for parent in inspect.getmro(closure_var):
-                                    if parent.__module__ not in _BUILTINS_MODULE_NAMES:
-                                        source = textwrap.dedent(
-                                            inspect.getsource(parent)
-                                        )
-                                        if (
-                                            source not in dependencies
-                                            and source not in _SAVED_CODE
-                                        ):
-                                            dependencies.add(source)
-                                            _SAVED_CODE.add(source)
-                                            new_dep, new_imp = _get_dependencies(parent)
-                                            dependencies.update(new_dep)
-                                            imports.update(new_imp)
+                        dependencies.add(_get_source(closure_var))
+                        children.append(closure_var)
+                        if inspect.isclass(closure_var):
+                            for parent in inspect.getmro(closure_var):
+                                if parent.__module__ not in _BUILTINS_MODULE_NAMES:
+                                    dependencies.add(_get_source(parent))
+                                    children.append(parent)
                     else:
                         new_dep, new_imp = _pickle(name, closure_var)
                         dependencies.update(new_dep)
@@ -301,6 +643,12 @@ def _get_function_dependencies(obj: Callable[..., object]) -> Tuple[Set[str], Se
                     imports.add(
                         f"from {module.__name__} import {closure_var.__name__} as {name}"
                     )
+        elif (
+            context is not None
+            and isinstance(closure_var, (bytes, bytearray, memoryview))
+            and _is_large_buffer(closure_var, context.buffer_threshold)
+        ):
+            dependencies.add(_save_buffer(name, closure_var, context.buffers))
         elif type(closure_var) in _BUILTINS_TYPES:
             new_dep, new_imp = _save_literal(name, closure_var)
             dependencies.update(new_dep)
@@ -309,11 +657,7 @@ def _get_function_dependencies(obj: Callable[..., object]) -> Tuple[Set[str], Se
             new_dep, new_imp = _pickle(name, closure_var)
             dependencies.update(new_dep)
             imports.update(new_imp)
-    for name, closure_var in non_local_closure_vars.items():
-        pass
-    for name in unbound_closure_vars:
-        pass
-    return dependencies, imports
+    return dependencies, imports, children
 
 
 def _guess_module(obj: Union[Type[object], Callable[..., object]]) -> ModuleType:
@@ -337,18 +681,113 @@ def _guess_module(obj: Union[Type[object], Callable[..., object]]) -> ModuleType
 def _get_nested_globals(obj: Callable[..., object]) -> Dict[str, object]:
     glob = {}
     obj_name = getattr(obj, "__name__", None)
-    if obj_name is not None:
-        source = inspect.getsource(obj)
-        declared = vars(inspect.getmodule(obj))
-        for name, o in declared.items():
-            if name != obj_name and name in source:
-                glob[name] = o
+    code = getattr(obj, "__code__", None)
+    declared = getattr(obj, "__globals__", None)
+    if obj_name is not None and code is not None and declared is not None:
+        for name in _get_nested_global_names(code):
+            if name != obj_name and name in declared:
+                glob[name] = declared[name]
     return glob
 
 
+def _compile_class(cls: Type[object]) -> Optional[CodeType]:
+    module = inspect.getmodule(cls)
+    flags = 0
+    # Annotations in the class body are only evaluated if the module evaluates them.
+    if getattr(module, "annotations", None) is __future__.annotations:
+        flags = __future__.annotations.compiler_flag
+    try:
+        return compile(
+            _get_source(cls), _source_path(cls) or "<class>", "exec", flags, True
+        )
+    except (OSError, SyntaxError):
+        return None
+
+
+def _get_class_globals(cls: Type[object], code: CodeType) -> Dict[str, object]:
+    module = inspect.getmodule(cls)
+    if module is None:
+        return {}
+    declared = vars(module)
+    return {
+        name: declared[name]
+        for name in _get_class_global_names(code)
+        if name != cls.__name__ and name in declared
+    }
+
+
+def _get_function_attribute_chains(
+    obj: Callable[..., object]
+) -> Dict[str, Set[Tuple[str, ...]]]:
+    code = getattr(obj, "__code__", None)
+    if code is None:
+        return {}
+    return _get_attribute_chains(code)
+
+
+def _resolve_attribute_chain(
+    module: ModuleType, chain: Tuple[str, ...]
+) -> Tuple[Set[str], Set[str]]:
+    imports = set()
+    dependencies = set()
+    variable_name = module.__name__
+    variable: object = module
+    for attribute in chain:
+        if not inspect.ismodule(variable):
+            break
+        attribute_name = f"{variable_name}.{attribute}"
+        if _is_submodule(attribute_name):
+            imports.add(f"import {attribute_name}")
+        try:
+            variable = getattr(variable, attribute)
+        except AttributeError:
+            break
+        if inspect.ismodule(variable):
+            variable_name = attribute_name
+        elif type(variable) in _BUILTINS_TYPES:
+            new_dep, new_imp = _save_literal(attribute_name, variable)
+            dependencies.update(new_dep)
+            imports.update(new_imp)
+        elif isinstance(variable, enum.EnumMeta):
+            imports.add("import enum")
+            names = [(data.name, data.value) for data in variable]
+            dependencies.add(
+                f"{attribute_name} = enum.Enum(value='{attribute}', names={names})\n"
+            )
+    return dependencies, imports
+
+
+def _is_submodule(name: str) -> bool:
+    found = _SUBMODULE_CACHE.get(name, None)
+    if found is None:
+        if name in sys.modules:
+            found = True
+        else:
+            try:
+                found = importlib.util.find_spec(name) is not None
+            except (ImportError, AttributeError, ValueError):
+                found = False
+        _SUBMODULE_CACHE[name] = found
+    return found
+
+
+def _is_user_defined_object(
+    module: ModuleType, obj: Union[Type[object], Callable[..., object]]
+) -> bool:
+    if getattr(module, "__file__", None) is not None:
+        return _is_user_defined_module(module)
+    # Modules without a file, such as the main module of a notebook or modules created at
+    # runtime, are user-defined when the source of the object is, as found in linecache.
+    try:
+        path = inspect.getsourcefile(obj)
+    except TypeError:
+        return False
+    return path is not None and _is_user_defined_path(path) and _has_source(obj)
+
+
 def _has_source(obj: Union[Type[object], Callable[..., object]]) -> bool:
     try:
-        inspect.getsource(obj)
+        _get_source(obj)
     except OSError:
         return False
     return True
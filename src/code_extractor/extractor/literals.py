@@ -17,9 +17,16 @@
 Module containing code to save values as literals
 """
 import enum
+import hashlib
 import pickle
 
-from typing import Tuple, Set, Type, Dict, List
+from typing import FrozenSet, Tuple, Set, Type, Dict, List, Optional, Union
+
+from ..extracted_code import _BUFFERS, _Buffer
+
+
+# Formats memoryview.cast accepts.
+_CASTABLE_FORMATS: FrozenSet[str] = frozenset("cbBhHiIlLqQnNfd?P")
 
 
 _BUILTINS_TYPES: Set[Type[object]] = {
@@ -95,7 +102,9 @@ def _save_tuple(t: Tuple[object, ...]) -> Tuple[str, Set[str], Set[str]]:
         imports.update(new_imp)
         dependencies.update(new_dep)
         to_write += f"{element}, "
-    if to_write.endswith(", "):
+    if len(t) == 1:
+        to_write = to_write[:-1]
+    elif to_write.endswith(", "):
         to_write = to_write[:-2]
     to_write += ")"
     return to_write, dependencies, imports
@@ -104,15 +113,17 @@ def _save_tuple(t: Tuple[object, ...]) -> Tuple[str, Set[str], Set[str]]:
 def _save_set(s: Set[object]) -> Tuple[str, Set[str], Set[str]]:
     imports = set()
     dependencies = set()
-    to_write = "{"
+    if len(s) == 0:
+        return "set()", dependencies, imports
+    elements = []
     for element in s:
         element, new_dep, new_imp = _save_value(element)
         imports.update(new_imp)
         dependencies.update(new_dep)
-        to_write += f"{element}, "
-    if to_write.endswith(", "):
-        to_write = to_write[:-2]
-    to_write += "}"
+        elements.append(element)
+    # The iteration order of a set depends on hash randomization, sorting the generated
+    # elements keeps the code identical across processes.
+    to_write = "{" + ", ".join(sorted(elements)) + "}"
     return to_write, dependencies, imports
 
 
@@ -137,8 +148,23 @@ def _save_dict(d: Dict[object, object]) -> Tuple[str, Set[str], Set[str]]:
 def _save_value(obj: object) -> Tuple[str, Set[str], Set[str]]:
     imports = set()
     dependencies = set()
+    if type(obj) is list:
+        return _save_list(obj)
+    if type(obj) is tuple:
+        return _save_tuple(obj)
+    if type(obj) is dict:
+        return _save_dict(obj)
+    if type(obj) is set:
+        return _save_set(obj)
+    if type(obj) is frozenset:
+        if len(obj) == 0:
+            return "frozenset()", dependencies, imports
+        value, dependencies, imports = _save_set(set(obj))
+        return f"frozenset({value})", dependencies, imports
     if isinstance(obj, str):
-        obj = f"'{obj}'"
+        obj = repr(obj)
+    if isinstance(obj, memoryview):
+        obj = f"memoryview({obj.tobytes()!r})"
     if isinstance(obj, enum.Enum):
         module = obj.__module__
         if module == "__main__":
@@ -170,3 +196,46 @@ def _save_enum(e: enum.EnumMeta, module: str, name: str) -> Tuple[Set[str], Set[
     else:
         dependencies.add(f"{name} = enum.Enum(value='{name}', names={names})\n")
     return dependencies, imports
+
+
+def _is_large_buffer(
+    buffer: Union[bytes, bytearray, "memoryview[int]"], threshold: Optional[int]
+) -> bool:
+    # Subclasses are left to pickle, which keeps their type.
+    if threshold is None or type(buffer) not in (bytes, bytearray, memoryview):
+        return False
+    view = memoryview(buffer)
+    return view.c_contiguous and view.nbytes >= threshold and _is_castable(view)
+
+
+def _is_castable(view: "memoryview[int]") -> bool:
+    # Buffers are carried as bytes, typed memoryviews are cast back to their format and shape
+    # when loaded, which only native single character formats and non empty shapes allow.
+    return view.format.lstrip("@") in _CASTABLE_FORMATS and 0 not in (view.shape or ())
+
+
+def _save_buffer(
+    name: str,
+    buffer: Union[bytes, bytearray, "memoryview[int]"],
+    buffers: Dict[str, _Buffer],
+) -> str:
+    # Referenced by type and content, so that identical buffers are carried once, they are
+    # rebuilt as their type when loaded and the source, unlike the buffer, can be hashed,
+    # stored and shared as any other dependency.
+    kind = type(buffer).__name__
+    view = memoryview(buffer)
+    typed = view.ndim != 1 or view.format != "B"
+    digest = hashlib.blake2b(kind.encode("ascii"), digest_size=16)
+    if isinstance(buffer, memoryview) and not buffer.readonly:
+        # Writable views are not copied when loaded, equal ones must not become one.
+        digest.update(name.encode("utf-8"))
+    digest.update(view.cast("B"))
+    key = f"{kind}-{digest.hexdigest()}"
+    buffers[key] = buffer
+    reference = f"{_BUFFERS}['{key}']"
+    if isinstance(buffer, bytearray):
+        # Each global gets its own copy, equal bytearrays are distinct objects.
+        return f"{name} = bytearray({reference})\n"
+    if typed:
+        return f"{name} = {reference}.cast({view.format!r}, {view.shape!r})\n"
+    return f"{name} = {reference}\n"
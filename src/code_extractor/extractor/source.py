@@ -0,0 +1,167 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Module containing code to resolve and cache the source code of live python objects.
+"""
+import hashlib
+import inspect
+import os
+import sys
+import textwrap
+import weakref
+
+from threading import Lock
+from types import CodeType
+from typing import (
+    Callable,
+    MutableMapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
+
+# Mtime of the source file, dedented source and its digest.
+_Entry = Tuple[Optional[int], Optional[str], Optional[str]]
+
+
+class SourceCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    currsize: int
+
+
+class _SourceCache:
+    def __init__(self) -> None:
+        self.hits: int = 0
+        self.misses: int = 0
+        self._lock: Lock = Lock()
+        # Code objects and classes are held weakly, so the sources of the functions and
+        # classes that are garbage collected are evicted with them.
+        self._code_entries: MutableMapping[object, _Entry] = weakref.WeakKeyDictionary()
+        self._class_entries: MutableMapping[
+            object, _Entry
+        ] = weakref.WeakKeyDictionary()
+        self._other_entries: MutableMapping[object, _Entry] = {}
+
+    def get(self, obj: Union[Type[object], Callable[..., object]]) -> Tuple[str, str]:
+        entries, key = self._entries_for(obj)
+        mtime = _source_mtime(obj)
+        with self._lock:
+            entry = entries.get(key, None)
+            if entry is not None and entry[0] == mtime:
+                self.hits += 1
+            else:
+                entry = None
+                self.misses += 1
+        if entry is None:
+            try:
+                source = textwrap.dedent(inspect.getsource(obj))
+            except OSError:
+                entry = (mtime, None, None)
+            else:
+                digest = hashlib.sha256(source.encode("utf-8")).hexdigest()
+                entry = (mtime, source, digest)
+            with self._lock:
+                entries[key] = entry
+        _, source, digest = entry
+        if source is None or digest is None:
+            raise OSError(f"Could not find source code for {obj}")
+        return source, digest
+
+    def info(self) -> SourceCacheInfo:
+        with self._lock:
+            return SourceCacheInfo(
+                self.hits,
+                self.misses,
+                len(self._code_entries)
+                + len(self._class_entries)
+                + len(self._other_entries),
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self._code_entries.clear()
+            self._class_entries.clear()
+            self._other_entries.clear()
+
+    def _entries_for(
+        self, obj: Union[Type[object], Callable[..., object]]
+    ) -> Tuple[MutableMapping[object, _Entry], object]:
+        # Keyed by the code of the function inspect reads the source of, as functions
+        # wrapped by the same decorator share the code of its wrapper.
+        code = getattr(_unwrap(obj), "__code__", None)
+        if isinstance(code, CodeType):
+            return self._code_entries, code
+        if inspect.isclass(obj):
+            return self._class_entries, obj
+        return self._other_entries, obj
+
+
+def _unwrap(obj: Union[Type[object], Callable[..., object]]) -> object:
+    try:
+        return inspect.unwrap(obj)
+    except ValueError:
+        return obj
+
+
+def _source_path(obj: Union[Type[object], Callable[..., object]]) -> Optional[str]:
+    code = getattr(_unwrap(obj), "__code__", None)
+    if isinstance(code, CodeType):
+        return code.co_filename
+    module = sys.modules.get(getattr(obj, "__module__", None) or "", None)
+    return getattr(module, "__file__", None)
+
+
+def _source_mtime(obj: Union[Type[object], Callable[..., object]]) -> Optional[int]:
+    path = _source_path(obj)
+    if path is None:
+        return None
+    try:
+        return os.stat(path).st_mtime_ns
+    except (OSError, ValueError):
+        return None
+
+
+_SOURCE_CACHE: _SourceCache = _SourceCache()
+
+
+def _get_source(obj: Union[Type[object], Callable[..., object]]) -> str:
+    return _SOURCE_CACHE.get(obj)[0]
+
+
+def _get_source_hash(obj: Union[Type[object], Callable[..., object]]) -> str:
+    return _SOURCE_CACHE.get(obj)[1]
+
+
+def source_cache_info() -> SourceCacheInfo:
+    """
+    Return the statistics of the source cache shared by every extraction.
+
+    :return: The number of hits, misses and cached objects.
+    :rtype: SourceCacheInfo
+    """
+    return _SOURCE_CACHE.info()
+
+
+def source_cache_clear() -> None:
+    """
+    Clear the source cache shared by every extraction and reset its statistics.
+    """
+    _SOURCE_CACHE.clear()
@@ -0,0 +1,145 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Module containing code for the persistent cache of compiled code.
+"""
+import marshal
+import os
+import sys
+import tempfile
+
+from types import CodeType
+from typing import List, Optional, Tuple
+
+_SUFFIX: str = ".code"
+
+
+class DiskCodeCache:
+    """
+    Persistent cache of the code objects compiled when loading extracted code, similar to
+    __pycache__ for modules. Entries are keyed by the digest of the extracted code and the
+    cache tag of the interpreter, so a restarted process loading the same code skips compilation.
+    Files are written atomically and missing files are treated as misses, so the directory can be
+    shared by several processes.
+
+    :param directory: The directory the compiled code is stored in.
+    :type directory: str
+    :param max_bytes: The maximum total size of the stored files.
+        Least recently used files are removed when it is exceeded.
+    :type max_bytes: int
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024) -> None:
+        self.directory: str = os.path.abspath(directory)
+        self.max_bytes: int = max_bytes
+        self.hits: int = 0
+        self.misses: int = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, digest: str) -> Optional[CodeType]:
+        """
+        Return the code compiled for digest by this interpreter.
+
+        :param digest: The digest of the extracted code.
+        :type digest: str
+        :return: The compiled code or None.
+        :rtype: Optional[CodeType]
+        """
+        path = self._path(digest)
+        if path is None:
+            self.misses += 1
+            return None
+        try:
+            with open(path, "rb") as file:
+                code = marshal.load(file)
+            os.utime(path)
+        except (OSError, EOFError, ValueError, TypeError):
+            self.misses += 1
+            return None
+        if not isinstance(code, CodeType):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return code
+
+    def put(self, digest: str, code: CodeType) -> None:
+        """
+        Store the code compiled for digest.
+
+        :param digest: The digest of the extracted code.
+        :type digest: str
+        :param code: The compiled code.
+        :type code: CodeType
+        """
+        path = self._path(digest)
+        if path is None:
+            return
+        data = marshal.dumps(code)
+        if len(data) > self.max_bytes:
+            return
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self._evict()
+
+    def clear(self) -> None:
+        """
+        Remove every file from the cache.
+        """
+        for _, _, path in self._entries():
+            _remove(path)
+
+    def _path(self, digest: str) -> Optional[str]:
+        tag = sys.implementation.cache_tag
+        if tag is None:
+            return None
+        if not digest.isalnum():
+            raise ValueError(f"Invalid digest {digest}")
+        return os.path.join(self.directory, f"{digest}.{tag}{_SUFFIX}")
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        with os.scandir(self.directory) as iterator:
+            for entry in iterator:
+                if not entry.name.endswith(_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self) -> None:
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            _remove(path)
+            total -= size
+
+
+def _remove(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
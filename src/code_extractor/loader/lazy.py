@@ -0,0 +1,79 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Module containing code to materialize the imports and dependencies of extracted code lazily.
+"""
+from threading import RLock
+from typing import Dict, Iterable, List, Set
+
+from ..ordering import _analyze_dependency, _order_dependencies
+
+
+# Global namespace executing the imports and dependencies defining a name the first time the
+# name is looked up, in dependency order; the names they need are looked up the same way.
+# Names that no dependency defines raise a KeyError, so that builtins keep working.
+class _LazyGlobals(Dict[str, object]):
+    def __init__(self, sources: Iterable[str], filename: str) -> None:
+        super().__init__()
+        self._lock: RLock = RLock()
+        self._filename: str = filename
+        self._pending: Set[str] = set()
+        self._providers: Dict[str, List[str]] = {}
+        orphans = []
+        for source in sources:
+            defines, _ = _analyze_dependency(source)
+            self._pending.add(source)
+            if len(defines) == 0:
+                orphans.append(source)
+            # Attribute assignments (module.Enum = ...) are provided along with their root.
+            for root in {name.split(".")[0] for name in defines}:
+                self._providers.setdefault(root, []).append(source)
+        self._materialize(orphans)
+
+    def __missing__(self, key: str) -> object:
+        with self._lock:
+            self._provide(key)
+            if dict.__contains__(self, key):
+                return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def prepare(self, source: str) -> None:
+        # Class bodies look names up in the globals without going through __missing__, so
+        # the names a source needs when it is executed are materialized beforehand.
+        with self._lock:
+            for name in _analyze_dependency(source)[1]:
+                root = name.split(".")[0]
+                if not dict.__contains__(self, root):
+                    self._provide(root)
+
+    def _provide(self, key: str) -> None:
+        self._materialize(self._providers.get(key, []))
+        self._providers.pop(key, None)
+
+    def _materialize(self, sources: List[str]) -> None:
+        sources = [source for source in sources if source in self._pending]
+        # Sources are no longer pending while they execute, so that the lookups they make
+        # do not execute them again.
+        self._pending.difference_update(sources)
+        ordered = _order_dependencies(sources)
+        for index, source in enumerate(ordered):
+            try:
+                self.prepare(source)
+                exec(compile(source, self._filename, "exec"), self)
+            except BaseException:
+                # The failed source and the following ones are executed again next time.
+                self._pending.update(ordered[index:])
+                raise
@@ -18,38 +18,291 @@ Module containing code for loading the source code extracted from live python ob
 """
 import inspect
 
-from typing import Callable, Type, Union
+from types import CodeType
+from typing import Callable, Dict, List, Optional, Type, Union
+from warnings import warn
 
+from ..environment import _check_requirements
 from ..extracted_code import _ExtractedCode
+from ..store import DependencyStore
+from .code_cache import DiskCodeCache
+from .lazy import _LazyGlobals
+from .module_loader import _PAYLOAD_FINDER
+from .object_cache import _OBJECT_CACHE
+from .shared import _SHARED_NAMESPACES
 
 
-def load_code(code: str) -> Union[Type[object], Callable[..., object]]:
+def load_code(
+    code: Union[str, bytes, bytearray, "memoryview[int]"],
+    check_requirements: bool = False,
+    store: Optional[DependencyStore] = None,
+    verify_bytecode: bool = False,
+    code_cache: Optional[DiskCodeCache] = None,
+    as_module: bool = False,
+    lazy: bool = False,
+    shared: bool = False,
+) -> Union[Type[object], Callable[..., object]]:
     """
     Load the provided source code and return the previously extracted class or function.
     Note that only strings extracted with this package are guaranteed to be restored.
     No guarantees are given with arbitrary strings (this package makes use of exec,
     only use strings whose origin you trust).
 
-    :param code: The extracted code.
-    :type code: str
+    :param code: The extracted code, either as a JSON string or in the binary format.
+    :type code: str, bytes, bytearray, memoryview
+    :param check_requirements: If True a warning is issued when the requirements included in the
+        code are not installed with the same version.
+    :type check_requirements: bool
+    :param store: The store the dependencies were put in when extracting, if any.
+        Their sources are kept in an in-memory LRU cache shared by every store.
+    :type store: Optional[DependencyStore]
+    :param verify_bytecode: If True embedded bytecode is compared with the compiled source code
+        the first time it is used in the process, and a ValueError is raised if they differ.
+    :type verify_bytecode: bool
+    :param code_cache: If specified, the persistent cache compiled code is looked up in before
+        compiling and stored in after compiling.
+    :type code_cache: Optional[DiskCodeCache]
+    :param as_module: If True the code is executed in a module named after its digest, which is
+        kept in sys.modules (so loading the same code again returns the same objects) and whose
+        source is registered with linecache for tracebacks and profilers.
+    :type as_module: bool
+    :param lazy: If True each import and dependency is only executed the first time a name it
+        defines is looked up, so loading scales with what is used rather than with what was
+        extracted. Embedded bytecode and code_cache are not used, and it cannot be combined
+        with as_module.
+    :type lazy: bool
+    :param shared: If True the imports and dependencies are executed once in a namespace shared by
+        every load with the same imports and dependencies, and only the loaded object itself is
+        executed in a lightweight namespace of its own. The shared namespace is released once no
+        loaded object uses it. Embedded bytecode and code_cache are not used, and it cannot be
+        combined with as_module.
+    :type shared: bool
     :return: The extracted class or function.
     :rtype: type(object), Callable[..., object]
     """
-    extracted_code = _ExtractedCode.from_string(code)
+    return _OBJECT_CACHE.load(
+        code,
+        ("code", check_requirements, verify_bytecode, as_module, lazy, shared),
+        lambda: _load_extracted_code(
+            _ExtractedCode.from_string(code),
+            check_requirements,
+            store,
+            verify_bytecode,
+            code_cache,
+            as_module,
+            lazy,
+            shared,
+        ),
+    )
+
+
+def load_many(
+    code: Union[str, bytes, bytearray, "memoryview[int]"],
+    check_requirements: bool = False,
+    store: Optional[DependencyStore] = None,
+    verify_bytecode: bool = False,
+    code_cache: Optional[DiskCodeCache] = None,
+    as_module: bool = False,
+    lazy: bool = False,
+    shared: bool = False,
+) -> List[Union[Type[object], Callable[..., object]]]:
+    """
+    Load the provided source code and return the previously extracted classes or functions.
+    The code can be either a bundle or a single object extracted with this package.
+    Note that only strings extracted with this package are guaranteed to be restored.
+    No guarantees are given with arbitrary strings (this package makes use of exec,
+    only use strings whose origin you trust).
+
+    :param code: The extracted code, either as a JSON string or in the binary format.
+    :type code: str, bytes, bytearray, memoryview
+    :param check_requirements: If True a warning is issued when the requirements included in the
+        code are not installed with the same version.
+    :type check_requirements: bool
+    :param store: The store the dependencies were put in when extracting, if any.
+        Their sources are kept in an in-memory LRU cache shared by every store.
+    :type store: Optional[DependencyStore]
+    :param verify_bytecode: If True embedded bytecode is compared with the compiled source code
+        the first time it is used in the process, and a ValueError is raised if they differ.
+    :type verify_bytecode: bool
+    :param code_cache: If specified, the persistent cache compiled code is looked up in before
+        compiling and stored in after compiling.
+    :type code_cache: Optional[DiskCodeCache]
+    :param as_module: If True the code is executed in a module named after its digest, which is
+        kept in sys.modules (so loading the same code again returns the same objects) and whose
+        source is registered with linecache for tracebacks and profilers.
+    :type as_module: bool
+    :param lazy: If True each import and dependency is only executed the first time a name it
+        defines is looked up, so loading scales with what is used rather than with what was
+        extracted. Embedded bytecode and code_cache are not used, and it cannot be combined
+        with as_module.
+    :type lazy: bool
+    :param shared: If True the imports and dependencies are executed once in a namespace shared by
+        every load with the same imports and dependencies, and only the loaded object itself is
+        executed in a lightweight namespace of its own. The shared namespace is released once no
+        loaded object uses it. Embedded bytecode and code_cache are not used, and it cannot be
+        combined with as_module.
+    :type shared: bool
+    :return: The extracted classes or functions, in extraction order.
+    :rtype: List[type(object), Callable[..., object]]
+    """
+    return _OBJECT_CACHE.load(
+        code,
+        ("many", check_requirements, verify_bytecode, as_module, lazy, shared),
+        lambda: _load_extracted_many(
+            _ExtractedCode.from_string(code),
+            check_requirements,
+            store,
+            verify_bytecode,
+            code_cache,
+            as_module,
+            lazy,
+            shared,
+        ),
+    )
+
+
+def _load_extracted_code(
+    extracted_code: _ExtractedCode,
+    check_requirements: bool,
+    store: Optional[DependencyStore] = None,
+    verify_bytecode: bool = False,
+    code_cache: Optional[DiskCodeCache] = None,
+    as_module: bool = False,
+    lazy: bool = False,
+    shared: bool = False,
+) -> Union[Type[object], Callable[..., object]]:
+    global_dict = _execute(
+        extracted_code,
+        check_requirements,
+        store,
+        verify_bytecode,
+        code_cache,
+        as_module,
+        lazy,
+        shared,
+    )
+    return _get_loaded_object(global_dict, extracted_code.name)
+
+
+def _load_extracted_many(
+    extracted_code: _ExtractedCode,
+    check_requirements: bool,
+    store: Optional[DependencyStore] = None,
+    verify_bytecode: bool = False,
+    code_cache: Optional[DiskCodeCache] = None,
+    as_module: bool = False,
+    lazy: bool = False,
+    shared: bool = False,
+) -> List[Union[Type[object], Callable[..., object]]]:
+    global_dict = _execute(
+        extracted_code,
+        check_requirements,
+        store,
+        verify_bytecode,
+        code_cache,
+        as_module,
+        lazy,
+        shared,
+    )
+    names = extracted_code.names
+    if len(names) == 0:
+        names = [extracted_code.name]
+    return [_get_loaded_object(global_dict, name) for name in names]
+
+
+def _execute(
+    extracted_code: _ExtractedCode,
+    check_requirements: bool,
+    store: Optional[DependencyStore],
+    verify_bytecode: bool,
+    code_cache: Optional[DiskCodeCache],
+    as_module: bool,
+    lazy: bool,
+    shared: bool,
+) -> Dict[str, object]:
+    if check_requirements:
+        _warn_requirements(extracted_code)
+    if shared:
+        if as_module:
+            raise ValueError("Shared namespaces cannot be combined with as_module")
+        extracted_code.resolve_dependencies(store)
+        global_dict = _SHARED_NAMESPACES.overlay(extracted_code, lazy)
+        global_dict.prepare(extracted_code.code)
+        exec(compile(extracted_code.code, extracted_code.filename, "exec"), global_dict)
+        return global_dict
+    if lazy:
+        if as_module:
+            raise ValueError("Lazy loading cannot be combined with as_module")
+        extracted_code.resolve_dependencies(store)
+        global_dict = _LazyGlobals(
+            sorted(extracted_code.imports) + sorted(extracted_code.dependencies),
+            extracted_code.filename,
+        )
+        extracted_code.bind_buffers(global_dict)
+        global_dict.prepare(extracted_code.code)
+        exec(compile(extracted_code.code, extracted_code.filename, "exec"), global_dict)
+        return global_dict
+    if as_module:
+
+        def compile_module() -> CodeType:
+            # The source is registered with linecache, so the dependencies are resolved
+            # even when the compiled code is cached.
+            extracted_code.resolve_dependencies(store)
+            return _compile(extracted_code, store, verify_bytecode, code_cache)
+
+        return _PAYLOAD_FINDER.load(extracted_code, compile_module).__dict__
     global_dict = {}
-    exec(extracted_code.to_code(), global_dict)
-    if extracted_code.name not in global_dict.keys():
+    code = _compile(extracted_code, store, verify_bytecode, code_cache)
+    extracted_code.bind_buffers(global_dict)
+    exec(code, global_dict)
+    return global_dict
+
+
+def _compile(
+    extracted_code: _ExtractedCode,
+    store: Optional[DependencyStore],
+    verify_bytecode: bool,
+    code_cache: Optional[DiskCodeCache],
+) -> CodeType:
+    if code_cache is None:
+        extracted_code.resolve_dependencies(store)
+        return extracted_code.compile(verify_bytecode)
+    # Looked up before resolving the dependencies, which a hit does not need.
+    digest = extracted_code.digest
+    code = code_cache.get(digest)
+    if code is None:
+        extracted_code.resolve_dependencies(store)
+        code = extracted_code.compile(verify_bytecode)
+        code_cache.put(digest, code)
+    return code
+
+
+def _warn_requirements(extracted_code: _ExtractedCode) -> None:
+    mismatches = _check_requirements(extracted_code.requirements)
+    if len(mismatches) > 0:
+        warn(
+            f"Requirements of {extracted_code.name or extracted_code.names} do not match "
+            f"the current environment: {mismatches}"
+        )
+
+
+def _get_loaded_object(
+    global_dict: Dict[str, object], name: str
+) -> Union[Type[object], Callable[..., object]]:
+    try:
+        # Subscripting rather than a membership test lets lazy globals materialize name.
+        to_return = global_dict[name]
+    except KeyError:
         raise RuntimeError(
-            f"Sanity check failed. Expected {extracted_code.name} to be in global dict {global_dict}."
+            f"Sanity check failed. Expected {name} to be in global dict {global_dict}."
         )
-    to_return = global_dict[extracted_code.name]
     if to_return is None:
         raise RuntimeError(
-            f"Sanity check failed. Expected global_dict[{extracted_code.name}] to not be None."
+            f"Sanity check failed. Expected global_dict[{name}] to not be None."
         )
     if inspect.isclass(to_return) or isinstance(to_return, Callable):
         return to_return
     raise RuntimeError(
-        f"Sanity check failed. Expected global_dict[{extracted_code.name}] to be either of "
+        f"Sanity check failed. Expected global_dict[{name}] to be either of "
         f"type Type[object] or Callable[..., object], got {type(to_return)}"
     )
@@ -0,0 +1,100 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Module containing code to load extracted code as synthetic modules.
+
+Extracted code is served by a meta path finder as a module named after its digest, so that it
+is cached in sys.modules, its source is available to linecache (and therefore to tracebacks and
+profilers) and loading the same code again is an import cache hit.
+"""
+import importlib
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import linecache
+import sys
+
+from threading import Lock
+from types import CodeType, ModuleType
+from typing import Callable, Dict, Optional, Sequence, Tuple, Union
+
+from ..extracted_code import _ExtractedCode
+
+_MODULE_PREFIX: str = "_code_extractor_"
+
+_Pending = Tuple[_ExtractedCode, Callable[[], CodeType]]
+
+
+class _PayloadFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    def __init__(self) -> None:
+        self._lock: Lock = Lock()
+        self._pending: Dict[str, _Pending] = {}
+        self._installed: bool = False
+
+    def find_spec(
+        self,
+        fullname: str,
+        path: Optional[Sequence[Union[bytes, str]]],
+        target: Optional[ModuleType] = None,
+    ) -> Optional[importlib.machinery.ModuleSpec]:
+        with self._lock:
+            pending = self._pending.get(fullname, None)
+        if pending is None:
+            return None
+        return importlib.util.spec_from_loader(
+            fullname, self, origin=pending[0].filename
+        )
+
+    def create_module(
+        self, spec: importlib.machinery.ModuleSpec
+    ) -> Optional[ModuleType]:
+        return None
+
+    def exec_module(self, module: ModuleType) -> None:
+        with self._lock:
+            extracted_code, compile_code = self._pending[module.__name__]
+        code = compile_code()
+        source = extracted_code.to_code()
+        linecache.cache[extracted_code.filename] = (
+            len(source),
+            None,
+            source.splitlines(keepends=True),
+            extracted_code.filename,
+        )
+        module.__file__ = extracted_code.filename
+        extracted_code.bind_buffers(module.__dict__)
+        exec(code, module.__dict__)
+
+    def load(
+        self, extracted_code: _ExtractedCode, compile_code: Callable[[], CodeType]
+    ) -> ModuleType:
+        name = _MODULE_PREFIX + extracted_code.digest
+        module = sys.modules.get(name, None)
+        if module is not None:
+            return module
+        with self._lock:
+            if not self._installed:
+                sys.meta_path.append(self)
+                self._installed = True
+            self._pending[name] = (extracted_code, compile_code)
+        try:
+            return importlib.import_module(name)
+        finally:
+            with self._lock:
+                self._pending.pop(name, None)
+
+
+_PAYLOAD_FINDER: _PayloadFinder = _PayloadFinder()
@@ -0,0 +1,224 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Module containing code for the opt-in process-wide cache of loaded objects.
+
+Loaded objects are keyed by a hash of the raw payload, so a repeated load is a dictionary
+lookup: the payload is not parsed and its code is not executed again.
+"""
+import hashlib
+import inspect
+import weakref
+
+from collections import OrderedDict
+from threading import Lock
+from typing import (
+    Callable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+    cast,
+)
+
+_T = TypeVar("_T")
+_Key = Tuple[bytes, Tuple[object, ...]]
+
+
+class ObjectCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    currsize: int
+    currbytes: int
+
+
+class _Reference:
+    def __init__(self, obj: object, weak: bool) -> None:
+        self._strong: Optional[object] = None
+        self._weak: Optional[Callable[[], Optional[object]]] = None
+        if weak and inspect.isclass(obj):
+            self._weak = weakref.ref(obj)
+        else:
+            self._strong = obj
+
+    def get(self) -> Optional[object]:
+        if self._weak is not None:
+            return self._weak()
+        return self._strong
+
+
+class _Entry:
+    def __init__(self, value: object, size: int, weak_classes: bool) -> None:
+        self.size: int = size
+        self.many: bool = isinstance(value, list)
+        values = value if isinstance(value, list) else [value]
+        self.references: List[_Reference] = [
+            _Reference(obj, weak_classes) for obj in values
+        ]
+
+    def get(self) -> Optional[object]:
+        values = []
+        for reference in self.references:
+            obj = reference.get()
+            if obj is None:
+                return None
+            values.append(obj)
+        return values if self.many else values[0]
+
+
+class _ObjectCache:
+    def __init__(self) -> None:
+        self.enabled: bool = False
+        self.max_entries: int = 256
+        self.max_bytes: int = 64 * 1024 * 1024
+        self.weak_classes: bool = False
+        self._lock: Lock = Lock()
+        self._entries: "OrderedDict[_Key, _Entry]" = OrderedDict()
+        self._bytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def load(
+        self,
+        payload: Union[str, bytes, bytearray, "memoryview[int]"],
+        variant: Tuple[object, ...],
+        loader: Callable[[], _T],
+    ) -> _T:
+        if not self.enabled or not isinstance(
+            payload, (str, bytes, bytearray, memoryview)
+        ):
+            return loader()
+        data = payload.encode("utf-8") if isinstance(payload, str) else payload
+        key = (hashlib.blake2b(data, digest_size=16).digest(), variant)
+        with self._lock:
+            entry = self._entries.get(key, None)
+            value = None if entry is None else entry.get()
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cast(_T, value)
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+        value = loader()
+        size = len(data)
+        if size <= self.max_bytes:
+            with self._lock:
+                if key in self._entries:
+                    self._remove(key)
+                self._entries[key] = _Entry(value, size, self.weak_classes)
+                self._bytes += size
+                self._evict()
+        return value
+
+    def configure(
+        self, enabled: bool, max_entries: int, max_bytes: int, weak_classes: bool
+    ) -> None:
+        with self._lock:
+            self.enabled = enabled
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self.weak_classes = weak_classes
+            self._evict()
+
+    def info(self) -> ObjectCacheInfo:
+        with self._lock:
+            return ObjectCacheInfo(
+                self.hits,
+                self.misses,
+                self.evictions,
+                len(self._entries),
+                self._bytes,
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def _remove(self, key: _Key) -> None:
+        self._bytes -= self._entries.pop(key).size
+
+    def _evict(self) -> None:
+        while len(self._entries) > 0 and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+
+
+_OBJECT_CACHE: _ObjectCache = _ObjectCache()
+
+
+def enable_object_cache(
+    max_entries: int = 256,
+    max_bytes: int = 64 * 1024 * 1024,
+    weak_classes: bool = False,
+) -> None:
+    """
+    Enable the process-wide cache of loaded objects used by load_code, load_many and the pickle
+    loaders. Loading a payload that was already loaded returns the same objects without
+    executing their code again, so changes made to them are visible to every caller.
+
+    :param max_entries: The maximum number of cached payloads.
+    :type max_entries: int
+    :param max_bytes: The maximum total size of the cached payloads.
+        Least recently used entries are evicted when either limit is exceeded.
+    :type max_bytes: int
+    :param weak_classes: If True loaded classes are only weakly referenced by the cache,
+        so they are dropped once no one else references them.
+    :type weak_classes: bool
+    """
+    _OBJECT_CACHE.configure(True, max_entries, max_bytes, weak_classes)
+
+
+def disable_object_cache() -> None:
+    """
+    Disable the process-wide cache of loaded objects and clear it.
+    """
+    _OBJECT_CACHE.configure(
+        False,
+        _OBJECT_CACHE.max_entries,
+        _OBJECT_CACHE.max_bytes,
+        _OBJECT_CACHE.weak_classes,
+    )
+    _OBJECT_CACHE.clear()
+
+
+def object_cache_info() -> ObjectCacheInfo:
+    """
+    Return the statistics of the process-wide cache of loaded objects.
+
+    :return: The number of hits, misses and evictions, and the number and total size of the
+        cached payloads.
+    :rtype: ObjectCacheInfo
+    """
+    return _OBJECT_CACHE.info()
+
+
+def object_cache_clear() -> None:
+    """
+    Clear the process-wide cache of loaded objects and reset its statistics.
+    """
+    _OBJECT_CACHE.clear()
@@ -0,0 +1,157 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Module containing code to share the imports and dependencies of extracted code between loads.
+
+Loads with identical imports and dependencies execute them once in a shared base namespace.
+Each loaded object gets an overlay namespace of its own which falls back to the base one,
+and the base namespace is dropped once no overlay references it anymore.
+Streams instead grow a single base namespace as new imports and dependencies arrive.
+"""
+import weakref
+
+from threading import Lock
+from typing import Dict, Optional, Set, Tuple
+
+from ..extracted_code import _ExtractedCode
+from ..ordering import _analyze_dependency, _is_plain_import, _order_dependencies
+from .lazy import _LazyGlobals
+
+_FILENAME: str = "<code_extractor shared>"
+
+_Key = Tuple[bool, Tuple[str, ...], Tuple[str, ...]]
+
+
+# Names are copied from the base namespace on first lookup, so that later lookups do not go
+# through __missing__; assignments stay local to the overlay.
+class _OverlayGlobals(Dict[str, object]):
+    def __init__(self, base: Dict[str, object]) -> None:
+        super().__init__()
+        self._base: Dict[str, object] = base
+
+    def __missing__(self, key: str) -> object:
+        value = self._base[key]
+        dict.__setitem__(self, key, value)
+        return value
+
+    def prepare(self, source: str) -> None:
+        # Class bodies look names up in the globals without going through __missing__, so
+        # the names a source needs when it is executed are copied beforehand.
+        for name in _analyze_dependency(source)[1]:
+            root = name.split(".")[0]
+            if not dict.__contains__(self, root):
+                try:
+                    self.__missing__(root)
+                except KeyError:
+                    pass
+
+
+class _Entry:
+    def __init__(self, namespace: Dict[str, object]) -> None:
+        self.namespace: Dict[str, object] = namespace
+        self.references: int = 0
+
+
+class _SharedNamespaces:
+    def __init__(self) -> None:
+        self._lock: Lock = Lock()
+        self._entries: Dict[_Key, _Entry] = {}
+
+    def overlay(self, extracted_code: _ExtractedCode, lazy: bool) -> _OverlayGlobals:
+        key = (
+            lazy,
+            tuple(sorted(extracted_code.imports)),
+            tuple(sorted(extracted_code.dependencies)),
+        )
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is not None:
+                entry.references += 1
+        if entry is None:
+            # Built outside the lock since executing the dependencies may take a while.
+            built = _Entry(self._build(key, extracted_code))
+            with self._lock:
+                entry = self._entries.setdefault(key, built)
+                entry.references += 1
+        overlay = _OverlayGlobals(entry.namespace)
+        weakref.finalize(overlay, self._release, key)
+        return overlay
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _build(self, key: _Key, extracted_code: _ExtractedCode) -> Dict[str, object]:
+        # Buffers are referenced by content digest, so any load with this key can bind them.
+        lazy, imports, dependencies = key
+        if lazy:
+            namespace = _LazyGlobals(imports + dependencies, _FILENAME)
+            extracted_code.bind_buffers(namespace)
+            return namespace
+        namespace = {}
+        extracted_code.bind_buffers(namespace)
+        code = "\n".join(list(imports) + _order_dependencies(dependencies))
+        exec(compile(code, _FILENAME, "exec"), namespace)
+        return namespace
+
+    def _release(self, key: _Key) -> None:
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                return
+            entry.references -= 1
+            if entry.references <= 0:
+                del self._entries[key]
+
+
+_SHARED_NAMESPACES: _SharedNamespaces = _SharedNamespaces()
+
+
+# Sources are executed in the stream namespace the first time an object needs them. An object
+# whose sources would rebind a name already defined by another source gets no overlay, so that
+# objects extracted from different modules never see each other's definitions.
+class _StreamNamespace:
+    def __init__(self) -> None:
+        self._lock: Lock = Lock()
+        self.namespace: Dict[str, object] = {}
+        self._executed: Set[str] = set()
+        self._definers: Dict[str, str] = {}
+
+    def overlay(self, extracted_code: _ExtractedCode) -> Optional[_OverlayGlobals]:
+        sources = sorted(extracted_code.imports) + _order_dependencies(
+            extracted_code.dependencies
+        )
+        with self._lock:
+            new_sources = [source for source in sources if source not in self._executed]
+            if any(self._conflicts(source) for source in new_sources):
+                return None
+            extracted_code.bind_buffers(self.namespace)
+            for source in new_sources:
+                exec(compile(source, _FILENAME, "exec"), self.namespace)
+                self._executed.add(source)
+                for name in _analyze_dependency(source)[0]:
+                    self._definers.setdefault(name, source)
+        return _OverlayGlobals(self.namespace)
+
+    def _conflicts(self, source: str) -> bool:
+        for name in _analyze_dependency(source)[0]:
+            definer = self._definers.get(name, None)
+            if definer is None or definer == source:
+                continue
+            # Plain imports of submodules bind the same top-level package.
+            if not (_is_plain_import(source) and _is_plain_import(definer)):
+                return True
+        return False
@@ -0,0 +1,230 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Module containing code to order extracted dependencies without executing them.
+"""
+import ast
+import heapq
+
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple, Union
+
+_Analysis = Tuple[FrozenSet[str], FrozenSet[str]]
+
+
+class _DefinitionVisitor(ast.NodeVisitor):
+    def __init__(self) -> None:
+        self.defines: Set[str] = set()
+        self.needs: Set[str] = set()
+        self._local_scopes: List[Set[str]] = []
+
+    def visit_Module(self, node: ast.Module) -> None:
+        for statement in node.body:
+            self.visit(statement)
+
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
+        self._visit_function(node)
+
+    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef) -> None:
+        self._visit_function(node)
+
+    def visit_Lambda(self, node: ast.Lambda) -> None:
+        self._visit_arguments(node.args, annotations=False)
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> None:
+        for expression in node.decorator_list + node.bases:
+            self.visit(expression)
+        for keyword in node.keywords:
+            self.visit(keyword.value)
+        self._define(node.name)
+        self._local_scopes.append(set())
+        for statement in node.body:
+            self.visit(statement)
+        self._local_scopes.pop()
+
+    def visit_ListComp(self, node: ast.ListComp) -> None:
+        self._visit_comprehension([node.elt], node.generators)
+
+    def visit_SetComp(self, node: ast.SetComp) -> None:
+        self._visit_comprehension([node.elt], node.generators)
+
+    def visit_GeneratorExp(self, node: ast.GeneratorExp) -> None:
+        self._visit_comprehension([node.elt], node.generators)
+
+    def visit_DictComp(self, node: ast.DictComp) -> None:
+        self._visit_comprehension([node.key, node.value], node.generators)
+
+    def visit_Import(self, node: ast.Import) -> None:
+        for alias in node.names:
+            self._define(alias.asname or alias.name.split(".")[0])
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        for alias in node.names:
+            self._define(alias.asname or alias.name)
+
+    def visit_Name(self, node: ast.Name) -> None:
+        if isinstance(node.ctx, ast.Load):
+            self._need(node.id)
+        else:
+            self._define(node.id)
+
+    def visit_Attribute(self, node: ast.Attribute) -> None:
+        dotted_name = _dotted_name(node)
+        if dotted_name is None:
+            self.generic_visit(node)
+        elif isinstance(node.ctx, ast.Load):
+            self._need(dotted_name)
+        else:
+            self._need(dotted_name.split(".")[0])
+            self._define(dotted_name)
+
+    def _visit_function(
+        self, node: Union[ast.FunctionDef, ast.AsyncFunctionDef]
+    ) -> None:
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        self._visit_arguments(node.args, annotations=True)
+        returns = node.returns
+        if returns is not None:
+            self.visit(returns)
+        self._define(node.name)
+
+    def _visit_arguments(self, arguments: ast.arguments, annotations: bool) -> None:
+        for default in arguments.defaults:
+            self.visit(default)
+        for default in arguments.kw_defaults:
+            if default is not None:
+                self.visit(default)
+        if annotations:
+            all_arguments = getattr(arguments, "posonlyargs", []) + arguments.args
+            all_arguments += arguments.kwonlyargs
+            if arguments.vararg is not None:
+                all_arguments.append(arguments.vararg)
+            if arguments.kwarg is not None:
+                all_arguments.append(arguments.kwarg)
+            for argument in all_arguments:
+                if argument.annotation is not None:
+                    self.visit(argument.annotation)
+
+    def _visit_comprehension(
+        self, elements: List[ast.expr], generators: List[ast.comprehension]
+    ) -> None:
+        self._local_scopes.append(set())
+        for generator in generators:
+            self.visit(generator.iter)
+            self.visit(generator.target)
+            for condition in generator.ifs:
+                self.visit(condition)
+        for element in elements:
+            self.visit(element)
+        self._local_scopes.pop()
+
+    def _define(self, name: str) -> None:
+        if len(self._local_scopes) > 0:
+            self._local_scopes[-1].add(name)
+        else:
+            self.defines.add(name)
+
+    def _need(self, name: str) -> None:
+        root = name.split(".")[0]
+        for scope in self._local_scopes:
+            if root in scope:
+                return
+        self.needs.add(name)
+
+
+def _dotted_name(node: ast.AST) -> Optional[str]:
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    parts.append(node.id)
+    return ".".join(reversed(parts))
+
+
+@lru_cache(maxsize=4096)
+def _analyze_dependency(source: str) -> _Analysis:
+    visitor = _DefinitionVisitor()
+    visitor.visit(ast.parse(source))
+    return frozenset(visitor.defines), frozenset(visitor.needs - visitor.defines)
+
+
+def _prefixes(name: str) -> Iterable[str]:
+    parts = name.split(".")
+    for index in range(1, len(parts) + 1):
+        yield ".".join(parts[:index])
+
+
+def _order_dependencies(dependencies: Iterable[str]) -> List[str]:
+    sources = sorted(set(dependencies))
+    analyses = [_analyze_dependency(source) for source in sources]
+    definers: Dict[str, List[int]] = {}
+    for index, (defines, _) in enumerate(analyses):
+        for name in defines:
+            definers.setdefault(name, []).append(index)
+    successors: List[Set[int]] = [set() for _ in sources]
+    in_degree = [0] * len(sources)
+    for index, (_, needs) in enumerate(analyses):
+        predecessors = set()
+        for name in needs:
+            for prefix in _prefixes(name):
+                predecessors.update(definers.get(prefix, []))
+        predecessors.discard(index)
+        for predecessor in predecessors:
+            successors[predecessor].add(index)
+        in_degree[index] = len(predecessors)
+    ready = [index for index, degree in enumerate(in_degree) if degree == 0]
+    heapq.heapify(ready)
+    ordered = []
+    while len(ready) > 0:
+        index = heapq.heappop(ready)
+        ordered.append(sources[index])
+        for successor in successors[index]:
+            in_degree[successor] -= 1
+            if in_degree[successor] == 0:
+                heapq.heappush(ready, successor)
+    if len(ordered) != len(sources):
+        cycle = sorted(
+            name
+            for index, degree in enumerate(in_degree)
+            if degree > 0
+            for name in analyses[index][0]
+        )
+        raise RuntimeError(
+            f"Cannot find dependency order: circular definition-time dependencies "
+            f"among {cycle}"
+        )
+    return ordered
+
+
+def _conflicting_names(sources: Iterable[str]) -> List[str]:
+    definers: Dict[str, str] = {}
+    conflicts = set()
+    for source in sorted(set(sources)):
+        for name in _analyze_dependency(source)[0]:
+            definer = definers.setdefault(name, source)
+            if definer == source:
+                continue
+            # Plain imports of submodules bind the same top-level package.
+            if not (_is_plain_import(source) and _is_plain_import(definer)):
+                conflicts.add(name)
+    return sorted(conflicts)
+
+
+def _is_plain_import(source: str) -> bool:
+    return source.startswith("import ") and " as " not in source
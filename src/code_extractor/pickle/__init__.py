@@ -16,4 +16,9 @@
 """
 Wraps the package to expose the pickle API
 """
-from .pickle_code import load, loads, dumps, dump
+from .pickle_code import load, loads, loads_many, dumps, dumps_many, dump
+from .pickler import Pickler, StreamPickler, StreamUnpickler, Unpickler
+from .reduction import (
+    disable_multiprocessing_reduction,
+    enable_multiprocessing_reduction,
+)
@@ -16,13 +16,29 @@
 """
 Module containing code to expose pickle-like API
 """
-import json
 import pickle
 
-from typing import Callable, Type, Union
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Type, TypeVar, Union
 
-from ..extractor.extract import extract_code
-from ..loader.load import load_code
+from ..extracted_code import _Buffer, _ExtractedCode
+from ..extractor.extract import (
+    _ExtractionContext,
+    _extract_bundle,
+    _extract_code,
+    _get_extractable,
+    _serialize,
+    extract_code,
+    extract_many,
+)
+from ..loader.code_cache import DiskCodeCache
+from ..loader.load import _load_extracted_code, _load_extracted_many
+from ..loader.object_cache import _OBJECT_CACHE
+from ..store import DependencyStore
+
+
+_BUFFER_THRESHOLD: int = 64 * 1024
+
+_T = TypeVar("_T")
 
 
 class _ReadableFileobj:
@@ -42,6 +58,13 @@ def dumps(
     obj: Union[object, Type[object], Callable[..., object]],
     protocol: int = pickle.DEFAULT_PROTOCOL,
     fix_imports: bool = True,
+    binary: bool = False,
+    compression: Optional[str] = None,
+    compression_level: Optional[int] = None,
+    store: Optional[DependencyStore] = None,
+    embed_bytecode: bool = False,
+    buffer_callback: Optional[Callable[["pickle.PickleBuffer"], object]] = None,
+    buffer_threshold: int = _BUFFER_THRESHOLD,
 ) -> bytes:
     """
     Return the pickled representation of the object obj as a bytes object, instead of writing it to a file.
@@ -57,11 +80,138 @@ def dumps(
         pickle will try to map the new Python 3 names to the old module names
         used in Python 2, so that the pickle data stream is readable with Python 2.
     :type fix_imports: bool
+    :param binary: If True the object is stored in the compact binary format instead of JSON.
+    :type binary: bool
+    :param compression: If specified, the compression method ("zlib" or "lzma") the extracted
+        code is compressed with.
+    :type compression: Optional[str]
+    :param compression_level: The compression level, the method default if not specified.
+    :type compression_level: Optional[int]
+    :param store: If specified, the sources of the dependencies are put in the store and only
+        their digests are pickled.
+    :type store: Optional[DependencyStore]
+    :param embed_bytecode: If True the compiled code is pickled as well, so that unpickling it
+        with the same Python implementation and version skips compilation.
+    :type embed_bytecode: bool
+    :param buffer_callback: If specified with protocol 5 or higher, it is called with the
+        pickle buffers of the bytes-like globals, which are then not serialized in the pickle.
+    :type buffer_callback: Optional[Callable[[pickle.PickleBuffer], object]]
+    :param buffer_threshold: With protocol 5 or higher, bytes, bytearray and memoryview globals
+        of at least this many bytes are pickled as pickle buffers instead of source code.
+    :type buffer_threshold: int
+    :return: The written bytes
+    :rtype: bytes
+    """
+    if _resolve_protocol(protocol) < 5:
+        return pickle.dumps(
+            obj=extract_code(
+                obj,
+                binary=binary,
+                compression=compression,
+                compression_level=compression_level,
+                store=store,
+                embed_bytecode=embed_bytecode,
+            ),
+            protocol=protocol,
+            fix_imports=fix_imports,
+            **_given(buffer_callback=buffer_callback),
+        )
+    return pickle.dumps(
+        obj=_extract_with_buffers(
+            [obj],
+            False,
+            buffer_threshold,
+            binary,
+            compression,
+            compression_level,
+            store,
+            embed_bytecode,
+        ),
+        protocol=protocol,
+        fix_imports=fix_imports,
+        buffer_callback=buffer_callback,
+    )
+
+
+def dumps_many(
+    objs: Iterable[Union[object, Type[object], Callable[..., object]]],
+    protocol: int = pickle.DEFAULT_PROTOCOL,
+    fix_imports: bool = True,
+    binary: bool = False,
+    compression: Optional[str] = None,
+    compression_level: Optional[int] = None,
+    store: Optional[DependencyStore] = None,
+    embed_bytecode: bool = False,
+    buffer_callback: Optional[Callable[["pickle.PickleBuffer"], object]] = None,
+    buffer_threshold: int = _BUFFER_THRESHOLD,
+) -> bytes:
+    """
+    Return the pickled representation of the objects objs as a bytes object.
+    The objects are extracted as a single bundle sharing their dependencies, so objects whose
+    code defines different values for the same names raise ValueError.
+
+    :param objs: The objects to pickle
+    :type objs: Iterable[object, type(object), Callable[..., object]]
+    :param protocol: Tells the pickler to use the given protocol;
+        supported protocols are 0 to HIGHEST_PROTOCOL.
+        If not specified, the default is DEFAULT_PROTOCOL.
+        If a negative number is specified, HIGHEST_PROTOCOL is selected.
+    :type protocol: int
+    :param fix_imports: If fix_imports is True and protocol is less than 3,
+        pickle will try to map the new Python 3 names to the old module names
+        used in Python 2, so that the pickle data stream is readable with Python 2.
+    :type fix_imports: bool
+    :param binary: If True the object is stored in the compact binary format instead of JSON.
+    :type binary: bool
+    :param compression: If specified, the compression method ("zlib" or "lzma") the extracted
+        code is compressed with.
+    :type compression: Optional[str]
+    :param compression_level: The compression level, the method default if not specified.
+    :type compression_level: Optional[int]
+    :param store: If specified, the sources of the dependencies are put in the store and only
+        their digests are pickled.
+    :type store: Optional[DependencyStore]
+    :param embed_bytecode: If True the compiled code is pickled as well, so that unpickling it
+        with the same Python implementation and version skips compilation.
+    :type embed_bytecode: bool
+    :param buffer_callback: If specified with protocol 5 or higher, it is called with the
+        pickle buffers of the bytes-like globals, which are then not serialized in the pickle.
+    :type buffer_callback: Optional[Callable[[pickle.PickleBuffer], object]]
+    :param buffer_threshold: With protocol 5 or higher, bytes, bytearray and memoryview globals
+        of at least this many bytes are pickled as pickle buffers instead of source code.
+    :type buffer_threshold: int
     :return: The written bytes
     :rtype: bytes
     """
+    if _resolve_protocol(protocol) < 5:
+        return pickle.dumps(
+            obj=extract_many(
+                objs,
+                bundle=True,
+                binary=binary,
+                compression=compression,
+                compression_level=compression_level,
+                store=store,
+                embed_bytecode=embed_bytecode,
+            ),
+            protocol=protocol,
+            fix_imports=fix_imports,
+            **_given(buffer_callback=buffer_callback),
+        )
     return pickle.dumps(
-        obj=extract_code(obj), protocol=protocol, fix_imports=fix_imports
+        obj=_extract_with_buffers(
+            list(objs),
+            True,
+            buffer_threshold,
+            binary,
+            compression,
+            compression_level,
+            store,
+            embed_bytecode,
+        ),
+        protocol=protocol,
+        fix_imports=fix_imports,
+        buffer_callback=buffer_callback,
     )
 
 
@@ -70,6 +220,13 @@ def dump(
     file: _WritableFileobj,
     protocol: int = pickle.DEFAULT_PROTOCOL,
     fix_imports: bool = True,
+    binary: bool = False,
+    compression: Optional[str] = None,
+    compression_level: Optional[int] = None,
+    store: Optional[DependencyStore] = None,
+    embed_bytecode: bool = False,
+    buffer_callback: Optional[Callable[["pickle.PickleBuffer"], object]] = None,
+    buffer_threshold: int = _BUFFER_THRESHOLD,
 ) -> None:
     """
     Write the pickled representation of the object obj to the open file object file.
@@ -89,9 +246,57 @@ def dump(
         pickle will try to map the new Python 3 names to the old module names
         used in Python 2, so that the pickle data stream is readable with Python 2.
     :type fix_imports: bool
+    :param binary: If True the object is stored in the compact binary format instead of JSON.
+    :type binary: bool
+    :param compression: If specified, the compression method ("zlib" or "lzma") the extracted
+        code is compressed with.
+    :type compression: Optional[str]
+    :param compression_level: The compression level, the method default if not specified.
+    :type compression_level: Optional[int]
+    :param store: If specified, the sources of the dependencies are put in the store and only
+        their digests are pickled.
+    :type store: Optional[DependencyStore]
+    :param embed_bytecode: If True the compiled code is pickled as well, so that unpickling it
+        with the same Python implementation and version skips compilation.
+    :type embed_bytecode: bool
+    :param buffer_callback: If specified with protocol 5 or higher, it is called with the
+        pickle buffers of the bytes-like globals, which are then not serialized in the pickle.
+    :type buffer_callback: Optional[Callable[[pickle.PickleBuffer], object]]
+    :param buffer_threshold: With protocol 5 or higher, bytes, bytearray and memoryview globals
+        of at least this many bytes are pickled as pickle buffers instead of source code.
+    :type buffer_threshold: int
     """
+    if _resolve_protocol(protocol) < 5:
+        pickle.dump(
+            obj=extract_code(
+                obj,
+                binary=binary,
+                compression=compression,
+                compression_level=compression_level,
+                store=store,
+                embed_bytecode=embed_bytecode,
+            ),
+            file=file,
+            protocol=protocol,
+            fix_imports=fix_imports,
+            **_given(buffer_callback=buffer_callback),
+        )
+        return
     pickle.dump(
-        obj=extract_code(obj), file=file, protocol=protocol, fix_imports=fix_imports
+        obj=_extract_with_buffers(
+            [obj],
+            False,
+            buffer_threshold,
+            binary,
+            compression,
+            compression_level,
+            store,
+            embed_bytecode,
+        ),
+        file=file,
+        protocol=protocol,
+        fix_imports=fix_imports,
+        buffer_callback=buffer_callback,
     )
 
 
@@ -100,6 +305,9 @@ def loads(
     fix_imports: bool = True,
     encoding: str = "ASCII",
     errors: str = "strict",
+    store: Optional[DependencyStore] = None,
+    code_cache: Optional[DiskCodeCache] = None,
+    buffers: Optional[Iterable[_Buffer]] = None,
 ) -> Union[Type[object], Callable[..., object]]:
     """
     Return the reconstituted object hierarchy of the pickled representation string of an object.
@@ -119,17 +327,102 @@ def loads(
     :type encoding: str
     :param errors: Specify error handling.
     :type errors: str
+    :param store: The store the dependencies were put in when pickling, if any.
+    :type store: Optional[DependencyStore]
+    :param code_cache: If specified, the persistent cache compiled code is looked up in before
+        compiling and stored in after compiling.
+    :type code_cache: Optional[DiskCodeCache]
+    :param buffers: The buffers passed to the buffer_callback when pickling, in order, if any.
+        Globals keep their type, memoryview globals are bound to them without copying.
+    :type buffers: Optional[Iterable[Union[bytes, bytearray, memoryview, pickle.PickleBuffer]]]
     :return: The unpickled object
     :rtype: type(object), Callable[..., object]
     """
-    json_string = pickle.loads(
-        string, fix_imports=fix_imports, encoding=encoding, errors=errors
+    payload, unpickled_buffers = _split_buffers(
+        pickle.loads(
+            string,
+            fix_imports=fix_imports,
+            encoding=encoding,
+            errors=errors,
+            **_given(buffers=buffers),
+        ),
+        "Passed bytes were not pickled by code_extractor",
+    )
+    return _OBJECT_CACHE.load(
+        payload,
+        ("code", False),
+        lambda: _load_extracted_code(
+            _parse(
+                payload,
+                "Passed bytes were not pickled by code_extractor",
+                unpickled_buffers,
+            ),
+            check_requirements=False,
+            store=store,
+            code_cache=code_cache,
+        ),
+    )
+
+
+def loads_many(
+    string: bytes,
+    fix_imports: bool = True,
+    encoding: str = "ASCII",
+    errors: str = "strict",
+    store: Optional[DependencyStore] = None,
+    code_cache: Optional[DiskCodeCache] = None,
+    buffers: Optional[Iterable[_Buffer]] = None,
+) -> List[Union[Type[object], Callable[..., object]]]:
+    """
+    Return the reconstituted objects of the pickled representation string of a bundle.
+    string must be a bytes-like object.
+
+    Note only strings generated with this package's dumps or dumps_many methods can be unpickled.
+
+    :param string: The data to unpickle.
+    :type string: bytes
+    :param fix_imports: If true, pickle will try to map the old Python 2 names
+        to the new names used in Python 3.
+    :type fix_imports: bool
+    :param encoding: Specify bytes encoding for Python 2 compatibility.
+    :type encoding: str
+    :param errors: Specify error handling.
+    :type errors: str
+    :param store: The store the dependencies were put in when pickling, if any.
+    :type store: Optional[DependencyStore]
+    :param code_cache: If specified, the persistent cache compiled code is looked up in before
+        compiling and stored in after compiling.
+    :type code_cache: Optional[DiskCodeCache]
+    :param buffers: The buffers passed to the buffer_callback when pickling, in order, if any.
+        Globals keep their type, memoryview globals are bound to them without copying.
+    :type buffers: Optional[Iterable[Union[bytes, bytearray, memoryview, pickle.PickleBuffer]]]
+    :return: The unpickled objects
+    :rtype: List[type(object), Callable[..., object]]
+    """
+    payload, unpickled_buffers = _split_buffers(
+        pickle.loads(
+            string,
+            fix_imports=fix_imports,
+            encoding=encoding,
+            errors=errors,
+            **_given(buffers=buffers),
+        ),
+        "Passed bytes were not pickled by code_extractor",
+    )
+    return _OBJECT_CACHE.load(
+        payload,
+        ("many", False),
+        lambda: _load_extracted_many(
+            _parse(
+                payload,
+                "Passed bytes were not pickled by code_extractor",
+                unpickled_buffers,
+            ),
+            check_requirements=False,
+            store=store,
+            code_cache=code_cache,
+        ),
     )
-    try:
-        json.loads(json_string)
-    except ValueError:
-        raise ValueError("Passed bytes were not pickled by code_extractor")
-    return load_code(json_string)
 
 
 def load(
@@ -137,6 +430,9 @@ def load(
     fix_imports: bool = True,
     encoding: str = "ASCII",
     errors: str = "strict",
+    store: Optional[DependencyStore] = None,
+    code_cache: Optional[DiskCodeCache] = None,
+    buffers: Optional[Iterable[_Buffer]] = None,
 ) -> Union[Type[object], Callable[..., object]]:
     """
     Read the pickled representation of an object from the open file object
@@ -161,14 +457,113 @@ def load(
     :type encoding: str
     :param errors: Specify error handling.
     :type errors: str
+    :param store: The store the dependencies were put in when pickling, if any.
+    :type store: Optional[DependencyStore]
+    :param code_cache: If specified, the persistent cache compiled code is looked up in before
+        compiling and stored in after compiling.
+    :type code_cache: Optional[DiskCodeCache]
+    :param buffers: The buffers passed to the buffer_callback when pickling, in order, if any.
+        Globals keep their type, memoryview globals are bound to them without copying.
+    :type buffers: Optional[Iterable[Union[bytes, bytearray, memoryview, pickle.PickleBuffer]]]
     :return: The unpickled object
     :rtype: type(object), Callable[..., object]
     """
-    json_string = pickle.load(
-        file=file, fix_imports=fix_imports, encoding=encoding, errors=errors
+    payload, unpickled_buffers = _split_buffers(
+        pickle.load(
+            file=file,
+            fix_imports=fix_imports,
+            encoding=encoding,
+            errors=errors,
+            **_given(buffers=buffers),
+        ),
+        "Specified file was not pickled by code_extractor",
+    )
+    return _OBJECT_CACHE.load(
+        payload,
+        ("code", False),
+        lambda: _load_extracted_code(
+            _parse(
+                payload,
+                "Specified file was not pickled by code_extractor",
+                unpickled_buffers,
+            ),
+            check_requirements=False,
+            store=store,
+            code_cache=code_cache,
+        ),
     )
+
+
+def _parse(
+    payload: object, message: str, buffers: Optional[Dict[str, _Buffer]] = None
+) -> _ExtractedCode:
+    if not isinstance(payload, (str, bytes, bytearray, memoryview)):
+        raise ValueError(message)
     try:
-        json.loads(json_string)
+        extracted_code = _ExtractedCode.from_string(payload)
     except ValueError:
-        raise ValueError("Specified file was not pickled by code_extractor")
-    return load_code(json_string)
+        raise ValueError(message)
+    if buffers is not None:
+        extracted_code.buffers = buffers
+    return extracted_code
+
+
+def _resolve_protocol(protocol: int) -> int:
+    return pickle.HIGHEST_PROTOCOL if protocol < 0 else protocol
+
+
+# Only the keyword arguments that were given are passed on, so that pickle keeps working
+# on Python versions predating out-of-band buffers.
+def _given(**arguments: Optional[_T]) -> Dict[str, _T]:
+    return {key: value for key, value in arguments.items() if value is not None}
+
+
+def _extract_with_buffers(
+    objs: List[Union[object, Type[object], Callable[..., object]]],
+    bundle: bool,
+    buffer_threshold: int,
+    binary: bool,
+    compression: Optional[str],
+    compression_level: Optional[int],
+    store: Optional[DependencyStore],
+    embed_bytecode: bool,
+) -> object:
+    context = _ExtractionContext(buffer_threshold)
+    extractable = [_get_extractable(obj) for obj in objs]
+    if bundle:
+        extracted_code = _extract_bundle(extractable, context)
+    else:
+        extracted_code = _extract_code(extractable[0], context)
+    payload = _serialize(
+        extracted_code,
+        True,
+        binary,
+        compression,
+        compression_level,
+        store,
+        embed_bytecode,
+    )
+    if len(extracted_code.buffers) == 0:
+        return payload
+    return payload, _pickle_buffers(extracted_code.buffers)
+
+
+def _pickle_buffers(buffers: Dict[str, _Buffer]) -> Dict[str, "pickle.PickleBuffer"]:
+    return {digest: pickle.PickleBuffer(buffer) for digest, buffer in buffers.items()}
+
+
+def _split_buffers(
+    unpickled: object, message: str
+) -> Tuple[
+    Union[str, bytes, bytearray, "memoryview[int]"], Optional[Dict[str, _Buffer]]
+]:
+    payload, buffers = unpickled, None
+    if (
+        isinstance(unpickled, tuple)
+        and len(unpickled) == 2
+        and isinstance(unpickled[1], dict)
+    ):
+        payload, buffers = unpickled
+    if not isinstance(payload, (str, bytes, bytearray, memoryview)):
+        raise ValueError(message)
+    return payload, buffers
@@ -0,0 +1,431 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Module containing picklers extracting the code of the functions and classes in an object graph
+"""
+import inspect
+import pickle
+import sys
+
+from functools import partial
+from types import FunctionType
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Type, Union
+
+from ..extracted_code import _Buffer, _ExtractedCode
+from ..extractor.extract import (
+    _ExtractionContext,
+    _extract_code,
+    _has_source,
+    _is_user_defined_object,
+    _serialize,
+)
+from ..loader.code_cache import DiskCodeCache
+from ..loader.load import _get_loaded_object, _load_extracted_code
+from ..loader.object_cache import _OBJECT_CACHE
+from ..loader.shared import _StreamNamespace
+from ..store import DependencyStore
+from .pickle_code import (
+    _BUFFER_THRESHOLD,
+    _ReadableFileobj,
+    _WritableFileobj,
+    _given,
+    _parse,
+    _resolve_protocol,
+)
+
+
+_PACKAGE: str = __name__.split(".")[0]
+
+_Reduction = Tuple[Callable[..., object], Tuple[object, ...]]
+
+
+# Out-of-band pickle buffers are not memoized by picklers, unlike the objects they are
+# reduced from, so a buffer shared by several objects is only handed to buffer_callback once.
+class _SharedBuffer:
+    def __init__(self, buffer: _Buffer) -> None:
+        self._buffer: _Buffer = buffer
+
+    def __reduce__(self) -> _Reduction:
+        return memoryview, (pickle.PickleBuffer(self._buffer),)
+
+
+class Pickler(pickle.Pickler):
+    """
+    Pickler extracting the code of every user-defined function and class found in the pickled
+    object graph, wherever it is, while every other object is pickled natively.
+    Each function and class is extracted once per pickler, the dependency analysis is shared
+    between the extractions and objects pickled with it must be unpickled with Unpickler.
+
+    Requires Python 3.8 or newer.
+
+    :param file: It must have a write() method that accepts a single bytes argument.
+    :type file: _WritableFileobj
+    :param protocol: The pickle protocol, DEFAULT_PROTOCOL if not specified.
+    :type protocol: Optional[int]
+    :param fix_imports: If fix_imports is True and protocol is less than 3,
+        pickle will try to map the new Python 3 names to the old module names
+        used in Python 2.
+    :type fix_imports: bool
+    :param binary: If True the code is stored in the compact binary format instead of JSON.
+    :type binary: bool
+    :param compression: If specified, the compression method ("zlib" or "lzma") the extracted
+        code is compressed with.
+    :type compression: Optional[str]
+    :param compression_level: The compression level, the method default if not specified.
+    :type compression_level: Optional[int]
+    :param store: If specified, the sources of the dependencies are put in the store and only
+        their digests are pickled.
+    :type store: Optional[DependencyStore]
+    :param embed_bytecode: If True the compiled code is pickled as well, so that unpickling it
+        with the same Python implementation and version skips compilation.
+    :type embed_bytecode: bool
+    :param buffer_callback: If specified with protocol 5 or higher, it is called with the
+        pickle buffers of the bytes-like globals, which are then not serialized in the stream.
+    :type buffer_callback: Optional[Callable[[pickle.PickleBuffer], object]]
+    :param buffer_threshold: With protocol 5 or higher, bytes, bytearray and memoryview globals
+        of at least this many bytes are pickled as pickle buffers instead of source code.
+    :type buffer_threshold: int
+    """
+
+    def __init__(
+        self,
+        file: _WritableFileobj,
+        protocol: Optional[int] = None,
+        fix_imports: bool = True,
+        binary: bool = False,
+        compression: Optional[str] = None,
+        compression_level: Optional[int] = None,
+        store: Optional[DependencyStore] = None,
+        embed_bytecode: bool = False,
+        buffer_callback: Optional[Callable[["pickle.PickleBuffer"], object]] = None,
+        buffer_threshold: int = _BUFFER_THRESHOLD,
+    ) -> None:
+        if sys.version_info < (3, 8):
+            raise RuntimeError("Pickler requires Python 3.8 or newer")
+        super().__init__(
+            file, protocol, fix_imports=fix_imports, buffer_callback=buffer_callback
+        )
+        protocol = _resolve_protocol(
+            pickle.DEFAULT_PROTOCOL if protocol is None else protocol
+        )
+        self._binary: bool = binary
+        self._compression: Optional[str] = compression
+        self._compression_level: Optional[int] = compression_level
+        self._store: Optional[DependencyStore] = store
+        self._embed_bytecode: bool = embed_bytecode
+        self._context: _ExtractionContext = _ExtractionContext(
+            buffer_threshold if protocol >= 5 else None
+        )
+        # Reused so that a buffer referenced by several objects is pickled once.
+        self._pickle_buffers: Dict[str, _SharedBuffer] = {}
+        # Keyed by id, the object is kept alive alongside its reduction so ids are not reused.
+        self._payloads: Dict[int, Tuple[object, _Reduction]] = {}
+
+    def reducer_override(self, obj: object) -> _Reduction:
+        # Every other object, including the instances of extracted classes, is reduced natively.
+        if not isinstance(obj, (FunctionType, type)):
+            return NotImplemented
+        if not _is_extractable(obj):
+            return NotImplemented
+        memo = self._payloads.get(id(obj), None)
+        if memo is None:
+            memo = self._payloads[id(obj)] = (obj, self._reduce(obj))
+        return memo[1]
+
+    def _reduce(self, obj: Union[Type[object], Callable[..., object]]) -> _Reduction:
+        extracted_code = _extract_code(obj, self._context)
+        payload = _serialize(
+            extracted_code,
+            True,
+            self._binary,
+            self._compression,
+            self._compression_level,
+            self._store,
+            self._embed_bytecode,
+        )
+        if len(extracted_code.buffers) == 0:
+            return _load_payload, (payload,)
+        return _load_payload, (payload, self._buffers_of(extracted_code))
+
+    def _buffers_of(self, extracted_code: _ExtractedCode) -> Dict[str, _SharedBuffer]:
+        for digest, buffer in extracted_code.buffers.items():
+            if digest not in self._pickle_buffers:
+                self._pickle_buffers[digest] = _SharedBuffer(buffer)
+        return {
+            digest: self._pickle_buffers[digest] for digest in extracted_code.buffers
+        }
+
+
+class Unpickler(pickle.Unpickler):
+    """
+    Unpickler loading the functions and classes extracted by Pickler, every other object is
+    unpickled natively.
+
+    :param file: It must have a read() method that takes an integer argument, a readinto()
+        method that takes a buffer argument and a readline() method that requires no arguments.
+    :type file: _ReadableFileobj
+    :param fix_imports: If true, pickle will try to map the old Python 2 names
+        to the new names used in Python 3.
+    :type fix_imports: bool
+    :param encoding: Specify bytes encoding for Python 2 compatibility.
+    :type encoding: str
+    :param errors: Specify error handling.
+    :type errors: str
+    :param store: The store the dependencies were put in when pickling, if any.
+    :type store: Optional[DependencyStore]
+    :param code_cache: If specified, the persistent cache compiled code is looked up in before
+        compiling and stored in after compiling.
+    :type code_cache: Optional[DiskCodeCache]
+    :param buffers: The buffers passed to the buffer_callback when pickling, in order, if any.
+    :type buffers: Optional[Iterable[Union[bytes, bytearray, memoryview, pickle.PickleBuffer]]]
+    """
+
+    def __init__(
+        self,
+        file: _ReadableFileobj,
+        fix_imports: bool = True,
+        encoding: str = "ASCII",
+        errors: str = "strict",
+        store: Optional[DependencyStore] = None,
+        code_cache: Optional[DiskCodeCache] = None,
+        buffers: Optional[Iterable[_Buffer]] = None,
+    ) -> None:
+        super().__init__(
+            file,
+            fix_imports=fix_imports,
+            encoding=encoding,
+            errors=errors,
+            **_given(buffers=buffers),
+        )
+        self._store: Optional[DependencyStore] = store
+        self._code_cache: Optional[DiskCodeCache] = code_cache
+
+    def find_class(self, module: str, name: str) -> object:
+        if module == __name__ and name == _load_payload.__name__:
+            return partial(
+                _load_payload, store=self._store, code_cache=self._code_cache
+            )
+        return super().find_class(module, name)
+
+
+class StreamPickler(Pickler):
+    """
+    Pickler meant to write many objects to the same stream with repeated calls to dump.
+    The imports and sources of the dependencies are written the first time an object needs
+    them and referenced by their position in the stream afterwards, so the stream grows with
+    the unique code rather than with the number of objects. Objects pickled with it must be
+    unpickled, in order, with StreamUnpickler.
+
+    Requires Python 3.8 or newer.
+
+    :param file: It must have a write() method that accepts a single bytes argument.
+    :type file: _WritableFileobj
+    :param protocol: The pickle protocol, DEFAULT_PROTOCOL if not specified.
+    :type protocol: Optional[int]
+    :param fix_imports: If fix_imports is True and protocol is less than 3,
+        pickle will try to map the new Python 3 names to the old module names
+        used in Python 2.
+    :type fix_imports: bool
+    :param binary: If True the code is stored in the compact binary format instead of JSON.
+    :type binary: bool
+    :param compression: If specified, the compression method ("zlib" or "lzma") the extracted
+        code is compressed with.
+    :type compression: Optional[str]
+    :param compression_level: The compression level, the method default if not specified.
+    :type compression_level: Optional[int]
+    :param buffer_callback: If specified with protocol 5 or higher, it is called with the
+        pickle buffers of the bytes-like globals, which are then not serialized in the stream.
+    :type buffer_callback: Optional[Callable[[pickle.PickleBuffer], object]]
+    :param buffer_threshold: With protocol 5 or higher, bytes, bytearray and memoryview globals
+        of at least this many bytes are pickled as pickle buffers instead of source code.
+    :type buffer_threshold: int
+    """
+
+    def __init__(
+        self,
+        file: _WritableFileobj,
+        protocol: Optional[int] = None,
+        fix_imports: bool = True,
+        binary: bool = False,
+        compression: Optional[str] = None,
+        compression_level: Optional[int] = None,
+        buffer_callback: Optional[Callable[["pickle.PickleBuffer"], object]] = None,
+        buffer_threshold: int = _BUFFER_THRESHOLD,
+    ) -> None:
+        super().__init__(
+            file,
+            protocol,
+            fix_imports=fix_imports,
+            binary=binary,
+            compression=compression,
+            compression_level=compression_level,
+            buffer_callback=buffer_callback,
+            buffer_threshold=buffer_threshold,
+        )
+        # Position of each source written to the stream, which objects reference it by.
+        self._source_ids: Dict[str, int] = {}
+
+    def _reduce(self, obj: Union[Type[object], Callable[..., object]]) -> _Reduction:
+        extracted_code = _extract_code(obj, self._context)
+        # The reader rebuilds the code from the stream, so it is not frozen in the payload.
+        imports = sorted(extracted_code.imports)
+        dependencies = sorted(extracted_code.dependencies)
+        extracted_code.imports = set()
+        extracted_code.dependencies = set()
+        payload = _serialize(
+            extracted_code,
+            False,
+            self._binary,
+            self._compression,
+            self._compression_level,
+            None,
+            False,
+        )
+        new_sources: List[str] = []
+        import_ids = self._ids_of(imports, new_sources)
+        source_ids = self._ids_of(dependencies, new_sources)
+        arguments = (payload, tuple(new_sources), import_ids, source_ids)
+        if len(extracted_code.buffers) == 0:
+            return _load_streamed, arguments
+        return _load_streamed, arguments + (self._buffers_of(extracted_code),)
+
+    def _ids_of(self, sources: List[str], new_sources: List[str]) -> Tuple[int, ...]:
+        source_ids = []
+        for source in sources:
+            source_id = self._source_ids.get(source, None)
+            if source_id is None:
+                source_id = self._source_ids[source] = len(self._source_ids)
+                new_sources.append(source)
+            source_ids.append(source_id)
+        return tuple(source_ids)
+
+
+class StreamUnpickler(Unpickler):
+    """
+    Unpickler reading the objects written by StreamPickler, in the order they were written.
+    Each import and dependency is executed once, the first time an object needs it, in a
+    namespace shared by the objects of the stream.
+
+    :param file: It must have a read() method that takes an integer argument, a readinto()
+        method that takes a buffer argument and a readline() method that requires no arguments.
+    :type file: _ReadableFileobj
+    :param fix_imports: If true, pickle will try to map the old Python 2 names
+        to the new names used in Python 3.
+    :type fix_imports: bool
+    :param encoding: Specify bytes encoding for Python 2 compatibility.
+    :type encoding: str
+    :param errors: Specify error handling.
+    :type errors: str
+    :param buffers: The buffers passed to the buffer_callback when pickling, in order, if any.
+    :type buffers: Optional[Iterable[Union[bytes, bytearray, memoryview, pickle.PickleBuffer]]]
+    """
+
+    def __init__(
+        self,
+        file: _ReadableFileobj,
+        fix_imports: bool = True,
+        encoding: str = "ASCII",
+        errors: str = "strict",
+        buffers: Optional[Iterable[_Buffer]] = None,
+    ) -> None:
+        super().__init__(
+            file,
+            fix_imports=fix_imports,
+            encoding=encoding,
+            errors=errors,
+            buffers=buffers,
+        )
+        self._sources: List[str] = []
+        self._namespace: _StreamNamespace = _StreamNamespace()
+
+    def find_class(self, module: str, name: str) -> object:
+        if module == __name__ and name == _load_streamed.__name__:
+            return self._load_streamed
+        return super().find_class(module, name)
+
+    def _load_streamed(
+        self,
+        payload: Union[str, bytes],
+        new_sources: Tuple[str, ...],
+        import_ids: Tuple[int, ...],
+        source_ids: Tuple[int, ...],
+        buffers: Optional[Dict[str, _Buffer]] = None,
+    ) -> Union[Type[object], Callable[..., object]]:
+        self._sources.extend(new_sources)
+        extracted_code = _parse(
+            payload, "Pickled code was not extracted by code_extractor", buffers
+        )
+        try:
+            extracted_code.imports = {
+                self._sources[source_id] for source_id in import_ids
+            }
+            extracted_code.dependencies = {
+                self._sources[source_id] for source_id in source_ids
+            }
+        except IndexError:
+            raise ValueError("Stream was not read from its start in order")
+        global_dict = self._namespace.overlay(extracted_code)
+        if global_dict is None:
+            return _load_extracted_code(extracted_code, check_requirements=False)
+        global_dict.prepare(extracted_code.code)
+        exec(compile(extracted_code.code, extracted_code.filename, "exec"), global_dict)
+        return _get_loaded_object(global_dict, extracted_code.name)
+
+
+def _is_extractable(obj: Union[Type[object], Callable[..., object]]) -> bool:
+    module = inspect.getmodule(obj)
+    if module is None or not _is_user_defined_object(module, obj):
+        return False
+    # The loaders the payloads are reduced to are pickled by reference.
+    if module.__name__.split(".")[0] == _PACKAGE:
+        return False
+    # Objects defined in a module but not reachable by name, such as lambdas,
+    # are left to the native pickler which reports them.
+    if getattr(obj, "__name__", "<lambda>") == "<lambda>":
+        return False
+    return _has_source(obj)
+
+
+def _load_payload(
+    payload: Union[str, bytes],
+    buffers: Optional[Dict[str, _Buffer]] = None,
+    store: Optional[DependencyStore] = None,
+    code_cache: Optional[DiskCodeCache] = None,
+) -> Union[Type[object], Callable[..., object]]:
+    return _OBJECT_CACHE.load(
+        payload,
+        ("code", False),
+        lambda: _load_extracted_code(
+            _parse(
+                payload, "Pickled code was not extracted by code_extractor", buffers
+            ),
+            check_requirements=False,
+            store=store,
+            code_cache=code_cache,
+        ),
+    )
+
+
+def _load_streamed(
+    payload: Union[str, bytes],
+    new_sources: Tuple[str, ...],
+    import_ids: Tuple[int, ...],
+    source_ids: Tuple[int, ...],
+    buffers: Optional[Dict[str, _Buffer]] = None,
+) -> Union[Type[object], Callable[..., object]]:
+    raise ValueError(
+        "Objects written by StreamPickler must be read with StreamUnpickler"
+    )
@@ -0,0 +1,155 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Module containing the opt-in reducer extracting the code of functions and classes sent to
+worker processes by multiprocessing and concurrent.futures.
+"""
+import sys
+import weakref
+
+from collections import OrderedDict
+from multiprocessing.reduction import ForkingPickler
+from threading import Lock
+from types import FunctionType
+from typing import Callable, MutableMapping, Optional, Tuple, Type, Union
+
+from ..extractor.extract import _ExtractionContext, _extract_code, _serialize
+from ..loader.load import _load_extracted_code
+from .pickle_code import _parse
+from .pickler import _Reduction, _is_extractable
+
+_LOADED_LIMIT: int = 256
+
+_Payload = Tuple[str, bytes]
+
+
+class _ProcessReduction:
+    def __init__(self) -> None:
+        self._lock: Lock = Lock()
+        self.enabled: bool = False
+        self.previous: Optional[Callable[..., object]] = None
+        # Sender side: the payload of every object already sent, extracted once.
+        self._payloads: MutableMapping[object, _Payload] = weakref.WeakKeyDictionary()
+        # Worker side: the objects already loaded, keyed by the digest of their code.
+        self._loaded: "OrderedDict[str, object]" = OrderedDict()
+
+    def reduce(self, obj: Union[Type[object], Callable[..., object]]) -> _Reduction:
+        with self._lock:
+            memo = self._payloads.get(obj, None)
+        if memo is None:
+            extracted_code = _extract_code(obj, _ExtractionContext())
+            payload = _serialize(extracted_code, True, True, None, None, None, False)
+            assert isinstance(payload, bytes)
+            memo = (extracted_code.digest, payload)
+            with self._lock:
+                self._payloads[obj] = memo
+        return _load_reduced, memo
+
+    def load(self, digest: str, payload: bytes) -> object:
+        with self._lock:
+            obj = self._loaded.get(digest, None)
+            if obj is not None:
+                self._loaded.move_to_end(digest)
+                return obj
+        obj = _load_extracted_code(
+            _parse(payload, "Reduced code was not extracted by code_extractor"),
+            check_requirements=False,
+        )
+        with self._lock:
+            # Another thread may have loaded the same code meanwhile, the first one wins
+            # so that every reference received by this process is to the same object.
+            obj = self._loaded.setdefault(digest, obj)
+            self._loaded.move_to_end(digest)
+            while len(self._loaded) > _LOADED_LIMIT:
+                self._loaded.popitem(last=False)
+        return obj
+
+    def clear(self) -> None:
+        with self._lock:
+            self._payloads.clear()
+            self._loaded.clear()
+
+
+_PROCESS_REDUCTION: _ProcessReduction = _ProcessReduction()
+
+
+def _is_pickled_by_value(obj: Union[Type[object], Callable[..., object]]) -> bool:
+    module = sys.modules.get(getattr(obj, "__module__", None) or "", None)
+    # Worker processes started with spawn or forkserver import modules again: the main
+    # module and modules created at runtime cannot be imported by name there.
+    if module is None or module.__name__ in ("__main__", "__mp_main__"):
+        return True
+    if getattr(module, "__spec__", None) is None:
+        return True
+    target: object = module
+    for name in getattr(obj, "__qualname__", "").split("."):
+        target = getattr(target, name, None)
+    return target is not obj
+
+
+def _reducer_override(pickler: ForkingPickler, obj: object) -> object:
+    if (
+        isinstance(obj, (FunctionType, type))
+        and _is_pickled_by_value(obj)
+        and _is_extractable(obj)
+    ):
+        return _PROCESS_REDUCTION.reduce(obj)
+    previous = _PROCESS_REDUCTION.previous
+    if previous is not None:
+        return previous(pickler, obj)
+    return NotImplemented
+
+
+def _load_reduced(digest: str, payload: bytes) -> object:
+    return _PROCESS_REDUCTION.load(digest, payload)
+
+
+def enable_multiprocessing_reduction() -> None:
+    """
+    Extract the code of the user-defined functions and classes sent to worker processes by
+    multiprocessing and concurrent.futures, when they could not be imported by name there:
+    those defined in the main module, in modules created at runtime or in a local scope.
+    Every other object is pickled as before.
+
+    Each object is extracted the first time it is sent, so later changes to its globals are not
+    seen by the workers, and each worker process loads the code of an object once.
+    Affects the current process and the worker processes forked from it.
+
+    Requires Python 3.8 or newer.
+    """
+    if sys.version_info < (3, 8):
+        raise RuntimeError("Multiprocessing reduction requires Python 3.8 or newer")
+    if _PROCESS_REDUCTION.enabled:
+        return
+    _PROCESS_REDUCTION.previous = vars(ForkingPickler).get("reducer_override", None)
+    setattr(ForkingPickler, "reducer_override", _reducer_override)
+    _PROCESS_REDUCTION.enabled = True
+
+
+def disable_multiprocessing_reduction() -> None:
+    """
+    Restore how multiprocessing and concurrent.futures pickle functions and classes and clear
+    the extracted and loaded objects.
+    """
+    if not _PROCESS_REDUCTION.enabled:
+        return
+    if _PROCESS_REDUCTION.previous is None:
+        delattr(ForkingPickler, "reducer_override")
+    else:
+        setattr(ForkingPickler, "reducer_override", _PROCESS_REDUCTION.previous)
+    _PROCESS_REDUCTION.previous = None
+    _PROCESS_REDUCTION.enabled = False
+    _PROCESS_REDUCTION.clear()
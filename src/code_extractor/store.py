@@ -0,0 +1,280 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Module containing content-addressed stores for the source code of dependencies.
+
+Extracted code can reference its dependencies by the sha256 digest of their source instead of
+embedding it, so that dependencies shared by many payloads are stored once.
+"""
+import hashlib
+import os
+import tempfile
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Iterable, Optional, Set
+
+from .database import AutoClosingConnection
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    digest TEXT PRIMARY KEY,
+    source TEXT NOT NULL
+)
+"""
+
+
+class DependencyStore(ABC):
+    """
+    Base class of the content-addressed stores of dependency sources.
+    Subclasses implement get and put; get_many can be overridden to fetch many sources at once.
+    """
+
+    @abstractmethod
+    def get(self, digest: str) -> Optional[str]:
+        """
+        Return the source stored under digest.
+
+        :param digest: The sha256 hex digest of the source.
+        :type digest: str
+        :return: The source or None if it is not stored.
+        :rtype: Optional[str]
+        """
+
+    @abstractmethod
+    def put(self, digest: str, source: str) -> None:
+        """
+        Store source under digest.
+
+        :param digest: The sha256 hex digest of the source.
+        :type digest: str
+        :param source: The source code.
+        :type source: str
+        """
+
+    def get_many(self, digests: Iterable[str]) -> Dict[str, str]:
+        """
+        Return the stored sources of the given digests, skipping the missing ones.
+
+        :param digests: The sha256 hex digests of the sources.
+        :type digests: Iterable[str]
+        :return: The sources keyed by digest.
+        :rtype: Dict[str, str]
+        """
+        sources = {}
+        for digest in digests:
+            source = self.get(digest)
+            if source is not None:
+                sources[digest] = source
+        return sources
+
+    def add(self, source: str) -> str:
+        """
+        Store source under its digest unless it is already stored.
+
+        :param source: The source code.
+        :type source: str
+        :return: The sha256 hex digest of the source.
+        :rtype: str
+        """
+        digest = _digest(source)
+        if self.get(digest) is None:
+            self.put(digest, source)
+        return digest
+
+
+class DictStore(DependencyStore):
+    """
+    In-memory store, mostly useful for tests and for sharing sources within a process.
+    """
+
+    def __init__(self) -> None:
+        self.sources: Dict[str, str] = {}
+
+    def get(self, digest: str) -> Optional[str]:
+        return self.sources.get(digest, None)
+
+    def put(self, digest: str, source: str) -> None:
+        self.sources[digest] = source
+
+
+class DirectoryStore(DependencyStore):
+    """
+    Store keeping one file per source in a directory, sharded by the first two characters
+    of the digest. Files are written atomically, so the directory can be shared by
+    several processes.
+
+    :param path: The directory the sources are stored in.
+    :type path: str
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path: str = os.path.abspath(path)
+        os.makedirs(self.path, exist_ok=True)
+
+    def get(self, digest: str) -> Optional[str]:
+        try:
+            with open(self._path(digest), "r", encoding="utf-8") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, digest: str, source: str) -> None:
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+                file.write(source)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def add(self, source: str) -> str:
+        digest = _digest(source)
+        if not os.path.exists(self._path(digest)):
+            self.put(digest, source)
+        return digest
+
+    def _path(self, digest: str) -> str:
+        if len(digest) < 3 or not digest.isalnum():
+            raise ValueError(f"Invalid digest {digest}")
+        return os.path.join(self.path, digest[:2], digest[2:])
+
+
+class SQLiteStore(DependencyStore):
+    """
+    Store keeping the sources in a SQLite database, which can be shared by several processes.
+
+    :param path: The path of the SQLite database file.
+    :type path: str
+    :param timeout: How many seconds to wait for another process holding the database lock.
+    :type timeout: float
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0) -> None:
+        self.path: str = os.path.abspath(path)
+        self.timeout: float = timeout
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(_SCHEMA)
+
+    def get(self, digest: str) -> Optional[str]:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT source FROM sources WHERE digest = ?", (digest,)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def get_many(self, digests: Iterable[str]) -> Dict[str, str]:
+        digests = list(digests)
+        sources = {}
+        with self._connect() as connection:
+            # Stay well below the default limit of variables in a statement.
+            for start in range(0, len(digests), 500):
+                chunk = digests[start : start + 500]
+                sources.update(
+                    connection.execute(
+                        "SELECT digest, source FROM sources WHERE digest IN "
+                        f"({', '.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+                )
+        return sources
+
+    def put(self, digest: str, source: str) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO sources VALUES (?, ?)", (digest, source)
+            )
+
+    def add(self, source: str) -> str:
+        digest = _digest(source)
+        self.put(digest, source)
+        return digest
+
+    def _connect(self) -> AutoClosingConnection:
+        return AutoClosingConnection(self.path, self.timeout)
+
+
+class _SourceLRU:
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries: int = max_entries
+        self._lock: Lock = Lock()
+        self._sources: "OrderedDict[str, str]" = OrderedDict()
+
+    def get(self, digest: str) -> Optional[str]:
+        with self._lock:
+            source = self._sources.get(digest, None)
+            if source is not None:
+                self._sources.move_to_end(digest)
+            return source
+
+    def put(self, digest: str, source: str) -> None:
+        with self._lock:
+            self._sources[digest] = source
+            self._sources.move_to_end(digest)
+            while len(self._sources) > self.max_entries:
+                self._sources.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sources.clear()
+
+
+# Sources are addressed by content, so a single cache is valid for every store.
+_SOURCE_LRU: _SourceLRU = _SourceLRU(4096)
+
+
+def _digest(source: str) -> str:
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+def _store_sources(sources: Iterable[str], store: DependencyStore) -> Set[str]:
+    digests = set()
+    for source in sources:
+        digest = store.add(source)
+        _SOURCE_LRU.put(digest, source)
+        digests.add(digest)
+    return digests
+
+
+def _resolve_sources(digests: Iterable[str], store: DependencyStore) -> Set[str]:
+    sources = set()
+    missing = []
+    for digest in digests:
+        source = _SOURCE_LRU.get(digest)
+        if source is None:
+            missing.append(digest)
+        else:
+            sources.add(source)
+    if len(missing) == 0:
+        return sources
+    fetched = store.get_many(missing)
+    for digest in missing:
+        source = fetched.get(digest, None)
+        if source is None:
+            raise KeyError(f"Dependency {digest} not found in {store}")
+        if _digest(source) != digest:
+            raise ValueError(f"Dependency {digest} does not match its digest")
+        _SOURCE_LRU.put(digest, source)
+        sources.add(source)
+    return sources
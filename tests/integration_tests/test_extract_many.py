@@ -0,0 +1,117 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import importlib
+import inspect
+import sys
+
+import pytest
+
+import code_extractor.pickle
+
+from code_extractor import extract_code, extract_many, load_many
+from code_extractor.extracted_code import _ExtractedCode
+from code_extractor.extractor import extract
+
+
+class SharedParent:
+    def value(self):
+        return 40
+
+
+class SharedChild(SharedParent):
+    def value(self):
+        return super().value() + 2
+
+
+def first_function():
+    return SharedChild().value()
+
+
+def second_function():
+    return SharedChild().value() * 2
+
+
+class UsesSharedChild:
+    def method(self):
+        return first_function()
+
+
+def test_extract_many_matches_extract_code():
+    extracted = extract_many([first_function, second_function, UsesSharedChild])
+    assert len(extracted) == 3
+    for obj, code in zip([first_function, second_function, UsesSharedChild], extracted):
+        expected_code = _ExtractedCode.from_string(extract_code(obj))
+        extracted_code = _ExtractedCode.from_string(code)
+        assert extracted_code.name == expected_code.name
+        assert extracted_code.code == expected_code.code
+        assert extracted_code.dependencies == expected_code.dependencies
+        assert extracted_code.imports == expected_code.imports
+
+
+def test_extract_many_resolves_shared_dependencies_once(monkeypatch):
+    resolved = []
+    original = extract._resolve_function_dependencies
+
+    def counting_resolve(obj, *args):
+        resolved.append(obj)
+        return original(obj, *args)
+
+    monkeypatch.setattr(extract, "_resolve_function_dependencies", counting_resolve)
+    extract_many([first_function, second_function, UsesSharedChild])
+    assert len(resolved) == len(set(resolved))
+    assert SharedChild.value in resolved
+
+
+def test_load_bundle():
+    bundle = extract_many([first_function, second_function], bundle=True)
+    extracted_code = _ExtractedCode.from_string(bundle)
+    assert extracted_code.names == ["first_function", "second_function"]
+    first, second = load_many(bundle)
+    assert inspect.isfunction(first)
+    assert inspect.isfunction(second)
+    assert first() == 42
+    assert second() == 84
+
+
+def test_load_many_single_object():
+    (loaded,) = load_many(extract_code(first_function))
+    assert loaded() == 42
+
+
+def test_pickle_many():
+    first, loaded_class = code_extractor.pickle.loads_many(
+        code_extractor.pickle.dumps_many([first_function, UsesSharedChild])
+    )
+    assert first() == 42
+    assert inspect.isclass(loaded_class)
+    assert loaded_class().method() == 42
+
+
+def test_bundle_with_conflicting_names_raises(tmp_path, monkeypatch):
+    for index in (1, 2):
+        (tmp_path / f"bundled_{index}.py").write_text(
+            f"OFFSET = {index}\n\n\ndef run():\n    return OFFSET\n"
+        )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    try:
+        first = importlib.import_module("bundled_1").run
+        second = importlib.import_module("bundled_2").run
+        with pytest.raises(ValueError, match="OFFSET"):
+            extract_many([first, second], bundle=True)
+        loaded = [load_many(code)[0] for code in extract_many([first, second])]
+    finally:
+        del sys.modules["bundled_1"], sys.modules["bundled_2"]
+    assert [function() for function in loaded] == [1, 2]
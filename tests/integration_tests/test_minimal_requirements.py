@@ -0,0 +1,79 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import json
+import warnings
+
+import numpy
+import pytest
+
+from code_extractor import extract_code, extract_many, load_code
+from code_extractor.extracted_code import _ExtractedCode
+
+
+def function_minimal_requirements():
+    return numpy.mean, json.dumps
+
+
+def test_minimal_requirements():
+    extracted_code = _ExtractedCode.from_string(
+        extract_code(
+            function_minimal_requirements,
+            get_requirements=True,
+            minimal_requirements=True,
+        )
+    )
+    assert extracted_code.imports == {"import numpy", "import json"}
+    assert extracted_code.requirements == {f"numpy=={numpy.__version__}"}
+
+
+def test_minimal_requirements_bundle():
+    extracted_code = _ExtractedCode.from_string(
+        extract_many(
+            [function_minimal_requirements],
+            get_requirements=True,
+            minimal_requirements=True,
+            bundle=True,
+        )
+    )
+    assert extracted_code.requirements == {f"numpy=={numpy.__version__}"}
+
+
+def test_minimal_requirements_ignored_without_requirements():
+    extracted_code = _ExtractedCode.from_string(
+        extract_code(function_minimal_requirements, minimal_requirements=True)
+    )
+    assert extracted_code.requirements == set()
+
+
+def test_check_requirements_match():
+    code = extract_code(
+        function_minimal_requirements, get_requirements=True, minimal_requirements=True
+    )
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        loaded = load_code(code, check_requirements=True)
+    assert loaded()[0] is numpy.mean
+
+
+def test_check_requirements_mismatch():
+    extracted_code = _ExtractedCode.from_string(
+        extract_code(function_minimal_requirements)
+    )
+    extracted_code.requirements = {"numpy==0.0.1", "not-a-real-distribution==1.0"}
+    with pytest.warns(
+        UserWarning, match="not-a-real-distribution==1.0 \\(not installed\\)"
+    ):
+        load_code(extracted_code.to_string(), check_requirements=True)
@@ -0,0 +1,36 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import pytest
+
+from code_extractor.extracted_code import _ExtractedCode
+
+
+@pytest.fixture
+def make_extracted_code():
+    """
+    Return a factory building extracted code by hand, without reading the environment.
+    """
+
+    def make(name, code, imports=(), dependencies=(), requirements=()):
+        extracted_code = _ExtractedCode(get_requirements=False)
+        extracted_code.name = name
+        extracted_code.code = code
+        extracted_code.imports = set(imports)
+        extracted_code.dependencies = set(dependencies)
+        extracted_code.requirements = set(requirements)
+        return extracted_code
+
+    return make
@@ -0,0 +1,147 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import mmap
+import os
+import threading
+
+import pytest
+
+import code_extractor.archive
+from code_extractor import PayloadArchive, extract_code
+
+
+def square(value):
+    return value * value
+
+
+def cube(value):
+    return value * square(value)
+
+
+def _data_size(archive):
+    return sum(
+        os.path.getsize(os.path.join(archive.path, name))
+        for name in os.listdir(archive.path)
+        if name.startswith("data.")
+    )
+
+
+def test_put_get_and_load(tmp_path):
+    archive = PayloadArchive(str(tmp_path))
+    assert len(archive) == 0
+    assert archive.get("square") is None
+    payload = extract_code(square, binary=True)
+    digest = archive.put(extract_code(cube))
+    assert archive.put(payload, "square") == "square"
+    assert archive.names() == sorted(["square", digest])
+    view = archive.get("square")
+    assert isinstance(view, memoryview)
+    assert isinstance(view.obj, mmap.mmap)
+    assert bytes(view) == payload
+    assert archive.load("square")(3) == 9
+    assert archive.load(digest, lazy=True)(2) == 8
+    assert "square" in archive and "missing" not in archive
+    with pytest.raises(KeyError):
+        archive.load("missing")
+
+
+def test_other_instances_see_updates(tmp_path):
+    writer = PayloadArchive(str(tmp_path))
+    reader = PayloadArchive(str(tmp_path))
+    writer.put_many([("a", extract_code(square)), ("b", extract_code(cube))])
+    assert reader.load("b")(2) == 8
+    writer.put(extract_code(cube), "a")
+    assert reader.load("a")(3) == 27
+
+
+def test_compaction_reclaims_superseded_entries(tmp_path):
+    archive = PayloadArchive(str(tmp_path))
+    for _ in range(10):
+        archive.put(extract_code(square), "square")
+    archive.put(extract_code(cube), "cube")
+    view = archive.get("square")
+    size = _data_size(archive)
+    archive.compact()
+    assert _data_size(archive) < size / 4
+    assert bytes(view) == bytes(archive.get("square"))
+    assert PayloadArchive(str(tmp_path)).load("cube")(2) == 8
+    archive.put(extract_code(square), "other")
+    assert archive.names() == ["cube", "other", "square"]
+
+
+def test_concurrent_readers(tmp_path):
+    archive = PayloadArchive(str(tmp_path))
+    archive.put(extract_code(square), "square")
+    errors = []
+
+    def read():
+        reader = PayloadArchive(str(tmp_path))
+        for _ in range(200):
+            try:
+                assert reader.load("square")(4) == 16
+            except Exception as error:
+                errors.append(error)
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for index in range(20):
+        archive.put(extract_code(cube), f"cube_{index}")
+        if index % 5 == 0:
+            archive.compact()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(archive) == 21
+
+
+def test_puts_append_to_the_journal(tmp_path, monkeypatch):
+    archive = PayloadArchive(str(tmp_path))
+    reader = PayloadArchive(str(tmp_path))
+    payload = extract_code(square)
+    archive.put(payload, "first")
+    assert not os.path.exists(os.path.join(archive.path, "index"))
+    for index in range(20):
+        archive.put(payload, f"square_{index}")
+        assert reader.load(f"square_{index}")(2) == 4
+    assert not os.path.exists(os.path.join(archive.path, "index"))
+    monkeypatch.setattr(code_extractor.archive, "_JOURNAL_SIZE", 0)
+    archive.put(extract_code(cube), "first")
+    index_path = os.path.join(archive.path, "index")
+    index_stat = os.stat(index_path)
+    assert (
+        os.path.getsize(os.path.join(archive.path, "journal"))
+        == code_extractor.archive._JOURNAL_HEADER.size
+    )
+    assert reader.load("first")(2) == 8
+    assert len(reader) == 21
+    archive.put(payload, "last")
+    assert os.stat(index_path).st_mtime_ns == index_stat.st_mtime_ns
+    assert reader.names() == sorted(
+        ["first", "last"] + [f"square_{i}" for i in range(20)]
+    )
+
+
+def test_partial_journal_records_are_dropped(tmp_path):
+    archive = PayloadArchive(str(tmp_path))
+    archive.put(extract_code(square), "square")
+    with open(os.path.join(archive.path, "journal"), "ab") as file:
+        file.write(b"\x05\x00par")
+    reader = PayloadArchive(str(tmp_path))
+    assert reader.names() == ["square"]
+    reader.put(extract_code(cube), "cube")
+    assert PayloadArchive(str(tmp_path)).load("cube")(2) == 8
+    assert archive.names() == ["cube", "square"]
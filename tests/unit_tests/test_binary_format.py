@@ -0,0 +1,110 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import pickle
+import struct
+
+import pytest
+
+import code_extractor.pickle
+
+from code_extractor import extract_code, extract_many, load_code, load_many
+from code_extractor.binary_format import _MAGIC, _decode, _encode, _is_binary
+from code_extractor.extracted_code import _ExtractedCode
+
+
+def _helper(value):
+    return value * 2
+
+
+def binary_function(value):
+    return _helper(value) + 1
+
+
+@pytest.fixture
+def extracted_code(make_extracted_code):
+    return make_extracted_code(
+        "function",
+        "def function():\n    return np.zeros(1)\n",
+        imports=["import numpy as np", "import os"],
+        dependencies=["CONSTANT = 1\n"],
+        requirements=["numpy==1.26.4"],
+    )
+
+
+def test_round_trip(extracted_code):
+    data = extracted_code.to_bytes()
+    assert _is_binary(data)
+    assert _ExtractedCode.from_bytes(data) == extracted_code
+    assert _ExtractedCode.from_string(data) == extracted_code
+    assert _ExtractedCode.from_string(memoryview(data)) == extracted_code
+
+
+def test_strings_are_interned():
+    data = _encode(
+        {
+            "name": "import os",
+            "code": "import os",
+            "imports": ["import os", "import os"],
+            "dependencies": [],
+            "requirements": [],
+        }
+    )
+    assert data.count(b"import os") == 1
+    assert _decode(data)["imports"] == ["import os", "import os"]
+
+
+def test_unknown_sections_are_ignored(extracted_code):
+    data = extracted_code.to_bytes(freeze_code=False)
+    _, _, section_count = struct.unpack_from("<4sBB", data, 0)
+    header = bytearray(struct.pack("<4sBB", _MAGIC, 1, section_count + 1))
+    offset_shift = struct.calcsize("<BII")
+    table = bytearray()
+    for index in range(section_count):
+        section_id, offset, length = struct.unpack_from(
+            "<BII", data, 6 + index * offset_shift
+        )
+        table += struct.pack("<BII", section_id, offset + offset_shift, length)
+    body = data[6 + section_count * offset_shift :]
+    table += struct.pack("<BII", 200, len(header) + len(table) + offset_shift, 0)
+    patched = bytes(header + table + body)
+    assert _ExtractedCode.from_bytes(patched) == _ExtractedCode.from_bytes(data)
+
+
+@pytest.mark.parametrize(
+    "data", [_MAGIC, _MAGIC + b"\x01\x05", _MAGIC + b"\xff\x00", b"\x00\x01"]
+)
+def test_invalid_binary(data):
+    with pytest.raises(ValueError):
+        _ExtractedCode.from_string(data)
+
+
+def test_json_bytes_are_accepted(extracted_code):
+    string = extracted_code.to_string()
+    assert _ExtractedCode.from_string(string.encode("utf-8")) == extracted_code
+
+
+def test_extract_and_load_binary():
+    data = extract_code(binary_function, binary=True)
+    assert isinstance(data, bytes)
+    assert load_code(data)(1) == 3
+    bundle = extract_many([binary_function, _helper], bundle=True, binary=True)
+    assert [obj(2) for obj in load_many(bundle)] == [5, 4]
+
+
+def test_pickle_binary():
+    data = code_extractor.pickle.dumps(binary_function, binary=True)
+    assert isinstance(pickle.loads(data), bytes)
+    assert code_extractor.pickle.loads(data)(2) == 5
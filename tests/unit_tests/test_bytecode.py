@@ -0,0 +1,153 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import functools
+import inspect
+import json
+import os
+import sys
+
+from code_extractor import extract_code, load_code
+from code_extractor.extractor import extract
+from code_extractor.extractor.bytecode import (
+    _get_attribute_chains,
+    _get_class_global_names,
+    _get_nested_global_names,
+)
+from code_extractor.extractor.extract import (
+    _get_nested_globals,
+    _is_submodule,
+    _resolve_function_dependencies,
+)
+
+a = 1
+i = 2
+
+
+def helper():
+    return 3
+
+
+def other_helper():
+    return 4
+
+
+def outer():
+    def nested(value):
+        def deeper():
+            return other_helper()
+
+        return helper() + value + deeper()
+
+    return nested(0)
+
+
+def outer_with_comprehension():
+    def nested():
+        return [helper() for _ in range(3)]
+
+    return nested
+
+
+def test_nested_names_are_exact():
+    names = _get_nested_global_names(outer.__code__)
+    assert "helper" in names
+    assert "other_helper" in names
+    assert "a" not in names
+    assert "i" not in names
+    assert "value" not in names
+
+
+def test_nested_names_include_comprehensions():
+    assert "helper" in _get_nested_global_names(outer_with_comprehension.__code__)
+
+
+def test_nested_globals_resolve_module_values():
+    assert _get_nested_globals(outer) == {
+        "helper": helper,
+        "other_helper": other_helper,
+    }
+
+
+def test_top_level_names_are_not_nested():
+    assert _get_nested_global_names(helper.__code__) == set()
+
+
+def uses_attribute_chains():
+    def nested():
+        return os.path.join("a", "b")
+
+    return os.sep, nested, json.tool.main
+
+
+def uses_unimported_submodule():
+    return json.tool
+
+
+def test_attribute_chains():
+    chains = _get_attribute_chains(uses_attribute_chains.__code__)
+    assert chains["os"] == {("sep",), ("path", "join")}
+    assert chains["json"] == {("tool", "main")}
+
+
+def test_submodules_are_probed_without_importing():
+    sys.modules.pop("json.tool", None)
+    dependencies, imports, _ = _resolve_function_dependencies(uses_unimported_submodule)
+    assert imports == {"import json", "import json.tool"}
+    assert dependencies == set()
+    assert "json.tool" not in sys.modules
+
+
+def test_submodule_probes_are_cached(monkeypatch):
+    assert not _is_submodule("json.not_a_submodule")
+    assert extract._SUBMODULE_CACHE["json.not_a_submodule"] is False
+
+    def fail(*args, **kwargs):
+        raise AssertionError("Negative result was not cached")
+
+    monkeypatch.setattr(extract.importlib.util, "find_spec", fail)
+    assert not _is_submodule("json.not_a_submodule")
+
+
+def increment_result(func):
+    @functools.wraps(func)
+    def wrapper(*args):
+        return func(*args) + 1
+
+    return wrapper
+
+
+DEFAULT_LIMIT = 5
+
+
+class Decorated:
+    limit = DEFAULT_LIMIT
+
+    @increment_result
+    def value(self):
+        return self.limit
+
+
+def uses_decorated():
+    return Decorated().value()
+
+
+def test_class_body_names():
+    code = compile(inspect.getsource(Decorated), "<class>", "exec")
+    assert _get_class_global_names(code) == {"DEFAULT_LIMIT", "increment_result"}
+
+
+def test_decorated_methods_are_extracted():
+    assert load_code(extract_code(uses_decorated))() == 6
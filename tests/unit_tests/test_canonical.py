@@ -0,0 +1,101 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import subprocess
+import sys
+
+from code_extractor import extract_code, load_code
+from code_extractor.extracted_code import _ExtractedCode
+from code_extractor.extractor.literals import _save_literal
+
+SRC_DIRECTORY = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..", "src")
+)
+MODULE = """
+import collections
+import json
+import os
+
+TAGS = {"alpha", "beta", "gamma", "delta", "epsilon"}
+FROZEN = frozenset({"x", "y", "z"})
+
+
+def tagged(value):
+    return json.dumps(sorted(TAGS | FROZEN)), collections.Counter(value), os.sep
+"""
+SCRIPT = """
+import sys
+from code_extractor import extract_code
+from canonical_module import tagged
+payload = extract_code(tagged, binary=sys.argv[1] == "binary")
+if isinstance(payload, str):
+    payload = payload.encode("utf-8")
+sys.stdout.write(payload.hex())
+"""
+
+
+def _extract_in_subprocess(tmp_path, seed, binary):
+    environment = dict(os.environ, PYTHONHASHSEED=str(seed))
+    environment["PYTHONPATH"] = os.pathsep.join([SRC_DIRECTORY, str(tmp_path)])
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT, "binary" if binary else "json"],
+        env=environment,
+        cwd=str(tmp_path),
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout
+    return bytes.fromhex(output.decode("ascii"))
+
+
+def test_payload_is_identical_across_processes(tmp_path):
+    (tmp_path / "canonical_module.py").write_text(MODULE)
+    for binary in [False, True]:
+        payloads = {
+            _extract_in_subprocess(tmp_path, seed, binary) for seed in [1, 2, 3]
+        }
+        assert len(payloads) == 1
+
+
+def digest_helper():
+    return 1
+
+
+def test_digest_is_stored_and_stable():
+    extracted_code = _ExtractedCode.from_string(extract_code(digest_helper))
+    digest = extracted_code.digest
+    assert len(digest) == 64
+    extracted_code._digest = None
+    assert extracted_code.digest == digest
+    extracted_code.requirements.add("numpy==1.26.4")
+    extracted_code._digest = None
+    assert extracted_code.digest == digest
+    extracted_code.imports.add("import os")
+    extracted_code._digest = None
+    assert extracted_code.digest != digest
+
+
+def test_literals_are_normalized():
+    dependencies, _ = _save_literal("value", {"b", "a", ("c",), frozenset()})
+    assert dependencies == {"value = {'a', 'b', ('c',), frozenset()}\n"}
+    dependencies, _ = _save_literal("value", [set(), "it's"])
+    assert dependencies == {'value = [set(), "it\'s"]\n'}
+    namespace = {}
+    exec(next(iter(dependencies)), namespace)
+    assert namespace["value"] == [set(), "it's"]
+
+
+def test_load_canonical_payload():
+    assert load_code(extract_code(digest_helper))() == 1
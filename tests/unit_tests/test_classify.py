@@ -0,0 +1,91 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import json
+import os
+import sys
+import types
+
+import code_extractor
+
+from code_extractor.extractor.classify import (
+    _POSSIBLE_SITE_PATHS,
+    _ModuleClassifier,
+    _is_user_defined_module,
+)
+
+CURRENT_DIRECTORY = os.path.abspath(os.path.dirname(__file__))
+
+
+def make_module(name, path):
+    module = types.ModuleType(name)
+    module.__file__ = path
+    return module
+
+
+def test_stdlib_is_third_party():
+    assert not _is_user_defined_module(json)
+    assert not _is_user_defined_module(sys)
+
+
+def test_test_module_is_user_defined():
+    assert _is_user_defined_module(sys.modules[__name__])
+
+
+def test_prefix_index_matches_directories_only():
+    root = os.path.join(CURRENT_DIRECTORY, "monorepo")
+    classifier = _ModuleClassifier({root})
+    inside = make_module("inside", os.path.join(root, "pkg", "__init__.py"))
+    sibling = make_module("sibling", os.path.join(root + "2", "mod.py"))
+    assert not classifier.is_user_defined(inside)
+    assert classifier.is_user_defined(sibling)
+
+
+def test_nested_roots_are_collapsed():
+    root = os.path.join(CURRENT_DIRECTORY, "a")
+    classifier = _ModuleClassifier({root, os.path.join(root, "b", "c")})
+    module = make_module("module", os.path.join(root, "b", "d", "mod.py"))
+    assert not classifier.is_user_defined(module)
+
+
+def test_verdicts_are_cached_per_module_name():
+    classifier = _ModuleClassifier(set())
+    module = make_module("cached_module", os.path.join(CURRENT_DIRECTORY, "m.py"))
+    assert classifier.is_user_defined(module)
+    module.__file__ = os.path.join(CURRENT_DIRECTORY, "other.py")
+    assert classifier._verdicts == {"cached_module": True}
+
+
+def test_cache_is_invalidated_by_path_changes(monkeypatch):
+    site_paths = set()
+    classifier = _ModuleClassifier(site_paths)
+    module = make_module("late", os.path.join(CURRENT_DIRECTORY, "late.py"))
+    assert classifier.is_user_defined(module)
+    monkeypatch.setattr(sys, "path", sys.path + [os.path.join("somewhere", "else")])
+    site_paths.add(CURRENT_DIRECTORY)
+    assert not classifier.is_user_defined(module)
+
+
+def test_register_third_party_path():
+    root = os.path.join(CURRENT_DIRECTORY, "registered")
+    module = make_module("registered_mod", os.path.join(root, "mod.py"))
+    assert _is_user_defined_module(module)
+    code_extractor.register_third_party_path(root)
+    try:
+        assert root in _POSSIBLE_SITE_PATHS
+        assert not _is_user_defined_module(module)
+    finally:
+        code_extractor.unregister_third_party_path(root)
+    assert _is_user_defined_module(module)
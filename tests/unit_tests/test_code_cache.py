@@ -0,0 +1,101 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+import code_extractor.extracted_code
+import code_extractor.pickle
+
+from code_extractor import DictStore, DiskCodeCache, extract_code, load_code
+from code_extractor.extracted_code import _ExtractedCode
+
+
+def cached_code_function():
+    return 42
+
+
+def other_cached_code_function():
+    return 43
+
+
+def _refuse_compile(*args, **kwargs):
+    raise AssertionError("compile should not be called")
+
+
+def test_restarted_process_skips_compilation(tmp_path, monkeypatch):
+    code = extract_code(cached_code_function)
+    digest = _ExtractedCode.from_string(code).digest
+    assert load_code(code, code_cache=DiskCodeCache(str(tmp_path)))() == 42
+    assert os.listdir(str(tmp_path)) == [
+        f"{digest}.{sys.implementation.cache_tag}.code"
+    ]
+    monkeypatch.setattr(
+        code_extractor.extracted_code, "compile", _refuse_compile, raising=False
+    )
+    code_cache = DiskCodeCache(str(tmp_path))
+    assert load_code(code, code_cache=code_cache)() == 42
+    assert (code_cache.hits, code_cache.misses) == (1, 0)
+
+
+def test_hit_does_not_resolve_stored_dependencies(tmp_path):
+    store = DictStore()
+    code = extract_code(cached_code_function, store=store)
+    code_cache = DiskCodeCache(str(tmp_path))
+    load_code(code, store=store, code_cache=code_cache)
+    assert load_code(code, code_cache=code_cache)() == 42
+
+
+def test_corrupted_file_is_a_miss(tmp_path):
+    code = extract_code(cached_code_function)
+    code_cache = DiskCodeCache(str(tmp_path))
+    load_code(code, code_cache=code_cache)
+    for name in os.listdir(str(tmp_path)):
+        (tmp_path / name).write_bytes(b"corrupted")
+    assert load_code(code, code_cache=code_cache)() == 42
+    assert code_cache.misses == 2
+
+
+def test_eviction(tmp_path):
+    code_cache = DiskCodeCache(str(tmp_path))
+    load_code(extract_code(cached_code_function), code_cache=code_cache)
+    size = sum(entry.stat().st_size for entry in os.scandir(str(tmp_path)))
+    code_cache.max_bytes = size
+    os.utime(next(os.scandir(str(tmp_path))).path, (0, 0))
+    load_code(extract_code(other_cached_code_function), code_cache=code_cache)
+    assert len(os.listdir(str(tmp_path))) == 1
+    code_cache.clear()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_concurrent_writers(tmp_path):
+    code = extract_code(cached_code_function)
+
+    def load(_):
+        return load_code(code, code_cache=DiskCodeCache(str(tmp_path)))()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert set(executor.map(load, range(32))) == {42}
+    assert len(os.listdir(str(tmp_path))) == 1
+
+
+def test_pickle_loads_with_code_cache(tmp_path):
+    data = code_extractor.pickle.dumps(cached_code_function)
+    code_cache = DiskCodeCache(str(tmp_path))
+    code_extractor.pickle.loads(data, code_cache=code_cache)
+    assert code_extractor.pickle.loads(data, code_cache=code_cache)() == 42
+    assert code_cache.hits == 1
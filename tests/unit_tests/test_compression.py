@@ -0,0 +1,158 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import pytest
+
+import code_extractor.pickle
+
+from code_extractor import (
+    extract_code,
+    load_code,
+    register_dictionary,
+    train_dictionary,
+)
+from code_extractor.compression import (
+    _DICTIONARIES,
+    _JSON_FRAGMENTS,
+    _compress,
+    _decompress,
+    _is_compressed,
+)
+from code_extractor.extracted_code import _ExtractedCode
+
+
+def compressed_function(value):
+    return value + 1
+
+
+def other_function(value):
+    return compressed_function(value) * 2
+
+
+def third_function(value):
+    return other_function(value) - 1
+
+
+@pytest.fixture
+def make_payload(make_extracted_code):
+    def make(index):
+        return make_extracted_code(
+            f"function_{index}",
+            f"def function_{index}():\n    return np.zeros({index})\n",
+            imports=["import numpy as np", "import collections"],
+            requirements=["numpy==1.26.4", "pandas==2.2.2"],
+        )
+
+    return make
+
+
+@pytest.mark.parametrize("method", ["zlib", "lzma"])
+@pytest.mark.parametrize("binary", [False, True])
+def test_extract_and_load_compressed(method, binary):
+    data = extract_code(compressed_function, binary=binary, compression=method)
+    assert _is_compressed(data)
+    assert load_code(data)(1) == 2
+
+
+def test_compression_level():
+    data = b"import os\n" * 100
+    assert _decompress(_compress(data, "zlib", 1)) == data
+    assert _decompress(_compress(data, "lzma", 0)) == data
+
+
+def _compress_without_dictionary(data):
+    previous = _DICTIONARIES.default
+    try:
+        _DICTIONARIES.default = register_dictionary(b"", make_default=False)
+        return _compress(data, "zlib")
+    finally:
+        _DICTIONARIES.default = previous
+
+
+def test_preset_dictionary_shrinks_small_payloads(make_payload):
+    data = make_payload(0).to_string().encode("utf-8")
+    assert len(_compress(data, "zlib")) < len(_compress_without_dictionary(data))
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_preset_dictionary_shrinks_extracted_payloads(binary):
+    data = extract_code(compressed_function, binary=binary)
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    with_dictionary = len(_compress(data, "zlib"))
+    without_dictionary = len(_compress_without_dictionary(data))
+    assert with_dictionary < without_dictionary
+    if not binary:
+        assert with_dictionary < 0.9 * without_dictionary
+
+
+def test_preset_json_fragments_match_payloads(make_payload):
+    payload = make_payload(0)
+    strings = [payload.to_string()]
+    payload.imports = set()
+    payload.requirements = set()
+    payload.dependencies = {"CONSTANT = 1\n"}
+    strings.append(payload.to_string())
+    payload.dependencies = set()
+    strings.append(payload.to_string())
+    for fragment in _JSON_FRAGMENTS:
+        assert any(fragment in string for string in strings), fragment
+
+
+def test_trained_dictionary(make_payload):
+    payloads = [make_payload(index).to_bytes() for index in range(10)]
+    dictionary = train_dictionary(payloads)
+    assert b"import numpy as np" in dictionary
+    assert b"numpy==1.26.4" in dictionary
+    previous = _DICTIONARIES.default
+    try:
+        register_dictionary(dictionary)
+        data = _compress(payloads[0], "zlib")
+    finally:
+        _DICTIONARIES.default = previous
+    assert _ExtractedCode.from_string(data) == _ExtractedCode.from_string(payloads[0])
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_train_on_payloads_with_bytecode(binary):
+    payloads = [
+        extract_code(function, binary=binary, embed_bytecode=True)
+        for function in [compressed_function, other_function, third_function]
+    ]
+    dictionary = train_dictionary(payloads)
+    assert len(dictionary) > 0
+    for payload in payloads:
+        extracted_code = _ExtractedCode.from_string(payload)
+        assert extracted_code.digest.encode("ascii") not in dictionary
+        assert extracted_code.bytecode not in dictionary
+
+
+def test_unknown_dictionary():
+    data = bytearray(_compress(b"import os\n", "zlib"))
+    data[5:9] = b"\xff\xff\xff\xff"
+    with pytest.raises(ValueError, match="unknown dictionary"):
+        _decompress(data)
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        _compress(b"", "snappy")
+
+
+def test_pickle_compressed():
+    data = code_extractor.pickle.dumps(
+        compressed_function, compression="zlib", compression_level=9
+    )
+    assert code_extractor.pickle.loads(data)(2) == 3
@@ -0,0 +1,138 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import pytest
+
+import code_extractor.pickle
+
+from code_extractor import (
+    DependencyStore,
+    DictStore,
+    DirectoryStore,
+    ExtractionCache,
+    SQLiteStore,
+    extract_code,
+    extract_many,
+    load_code,
+    load_many,
+)
+from code_extractor.extracted_code import _ExtractedCode
+from code_extractor.store import _SOURCE_LRU, _digest
+
+
+class StoredParent:
+    def value(self):
+        return 40
+
+
+class StoredChild(StoredParent):
+    def value(self):
+        return super().value() + 2
+
+
+def stored_function():
+    return StoredChild().value()
+
+
+def other_stored_function():
+    return StoredChild().value() * 2
+
+
+@pytest.fixture(params=["dict", "directory", "sqlite"])
+def store(request, tmp_path):
+    _SOURCE_LRU.clear()
+    if request.param == "dict":
+        return DictStore()
+    if request.param == "directory":
+        return DirectoryStore(str(tmp_path / "store"))
+    return SQLiteStore(str(tmp_path / "store.sqlite"))
+
+
+def test_store_round_trip(store):
+    source = "CONSTANT = 1\n"
+    digest = store.add(source)
+    assert digest == _digest(source)
+    assert store.get(digest) == source
+    assert store.get_many([digest, "0" * 64]) == {digest: source}
+    assert store.get("0" * 64) is None
+
+
+def test_extract_with_store(store):
+    code = extract_code(stored_function, store=store)
+    extracted_code = _ExtractedCode.from_string(code)
+    assert extracted_code.dependencies == set()
+    assert extracted_code.frozen_code is None
+    assert len(extracted_code.dependency_hashes) == 2
+    _SOURCE_LRU.clear()
+    assert load_code(code, store=store)() == 42
+
+
+def test_shared_dependencies_are_stored_once(store):
+    functions = [stored_function, other_stored_function]
+    codes = extract_many(functions, store=store, binary=True)
+    hashes = [_ExtractedCode.from_string(code).dependency_hashes for code in codes]
+    assert hashes[0] == hashes[1]
+    bundle = extract_many(functions, bundle=True, store=store)
+    function, other_function = load_many(bundle, store=store)
+    assert function() == 42
+    assert other_function() == 84
+
+
+def test_load_without_store():
+    code = extract_code(stored_function, store=DictStore())
+    with pytest.raises(ValueError, match="dependency store"):
+        load_code(code)
+
+
+def test_missing_dependency():
+    code = extract_code(stored_function, store=DictStore())
+    _SOURCE_LRU.clear()
+    with pytest.raises(KeyError):
+        load_code(code, store=DictStore())
+
+
+def test_tampered_dependency():
+    store = DictStore()
+    code = extract_code(stored_function, store=store)
+    _SOURCE_LRU.clear()
+    for digest in store.sources:
+        store.sources[digest] = "raise SystemExit\n"
+    with pytest.raises(ValueError):
+        load_code(code, store=store)
+
+
+def test_cache_requires_stored_dependencies(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache.sqlite"))
+    extract_code(stored_function, cache=cache, store=DictStore())
+    store = DictStore()
+    code = extract_code(stored_function, cache=cache, store=store)
+    assert len(store.sources) == 2
+    _SOURCE_LRU.clear()
+    assert load_code(code, store=store)() == 42
+
+
+def test_pickle_with_store():
+    store = DictStore()
+    data = code_extractor.pickle.dumps(stored_function, store=store)
+    assert code_extractor.pickle.loads(data, store=store)() == 42
+
+
+def test_store_must_implement_get_and_put():
+    class PartialStore(DependencyStore):
+        def get(self, digest):
+            return None
+
+    with pytest.raises(TypeError):
+        PartialStore()
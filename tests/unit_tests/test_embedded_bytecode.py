@@ -0,0 +1,82 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import marshal
+import sys
+
+import pytest
+
+import code_extractor.extracted_code
+
+from code_extractor import extract_code, load_code
+from code_extractor.extracted_code import _ExtractedCode
+
+
+class BytecodeParent:
+    def value(self):
+        return 40
+
+
+def bytecode_function():
+    return BytecodeParent().value() + 2
+
+
+def _refuse_compile(*args, **kwargs):
+    raise AssertionError("compile should not be called")
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_embedded_bytecode_skips_compile(binary, monkeypatch):
+    code = extract_code(bytecode_function, binary=binary, embed_bytecode=True)
+    extracted_code = _ExtractedCode.from_string(code)
+    assert extracted_code.bytecode_tag == sys.implementation.cache_tag
+    assert extracted_code.bytecode is not None
+    monkeypatch.setattr(
+        code_extractor.extracted_code, "compile", _refuse_compile, raising=False
+    )
+    assert load_code(code)() == 42
+
+
+def test_other_tag_falls_back_to_source():
+    extracted_code = _ExtractedCode.from_string(
+        extract_code(bytecode_function, embed_bytecode=True)
+    )
+    extracted_code.bytecode_tag = "other-interpreter"
+    assert load_code(extracted_code.to_bytes())() == 42
+    extracted_code.bytecode_tag = sys.implementation.cache_tag
+    extracted_code.bytecode = b"corrupted"
+    assert load_code(extracted_code.to_bytes())() == 42
+
+
+def test_verify_bytecode():
+    extracted_code = _ExtractedCode.from_string(
+        extract_code(bytecode_function, embed_bytecode=True)
+    )
+    assert load_code(extracted_code.to_string(), verify_bytecode=True)() == 42
+    extracted_code.bytecode = marshal.dumps(
+        compile("def bytecode_function():\n    return 0\n", "<string>", "exec")
+    )
+    code = extracted_code.to_string()
+    assert load_code(code)() == 0
+    with pytest.raises(ValueError, match="does not match"):
+        load_code(code, verify_bytecode=True)
+
+
+def test_bytecode_is_not_part_of_the_digest():
+    with_bytecode = _ExtractedCode.from_string(
+        extract_code(bytecode_function, embed_bytecode=True)
+    )
+    without_bytecode = _ExtractedCode.from_string(extract_code(bytecode_function))
+    assert with_bytecode.digest == without_bytecode.digest
@@ -0,0 +1,86 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import sys
+import time
+
+import pytest
+
+from code_extractor import environment, warm_requirements
+from code_extractor.environment import _EnvironmentSnapshot
+from code_extractor.extracted_code import _ExtractedCode
+
+
+def counting_freeze(monkeypatch):
+    calls = []
+
+    def freeze():
+        calls.append(None)
+        return frozenset({f"package=={len(calls)}"})
+
+    monkeypatch.setattr(environment, "_freeze", freeze)
+    return calls
+
+
+def test_requirements_are_computed_once(monkeypatch):
+    calls = counting_freeze(monkeypatch)
+    snapshot = _EnvironmentSnapshot()
+    assert snapshot.requirements() == {"package==1"}
+    assert snapshot.requirements() == {"package==1"}
+    assert len(calls) == 1
+
+
+def test_requirements_refresh_on_sys_path_change(monkeypatch):
+    calls = counting_freeze(monkeypatch)
+    snapshot = _EnvironmentSnapshot()
+    snapshot.requirements()
+    monkeypatch.setattr(sys, "path", sys.path + ["new_path_entry"])
+    assert snapshot.requirements() == {"package==2"}
+    assert len(calls) == 2
+
+
+def test_requirements_are_pinned():
+    requirements = environment._freeze()
+    assert len(requirements) > 0
+    for requirement in requirements:
+        assert "==" in requirement
+        assert not requirement.startswith("pip==")
+
+
+def test_extracted_code_uses_snapshot(monkeypatch):
+    counting_freeze(monkeypatch)
+    monkeypatch.setattr(environment, "_SNAPSHOT", _EnvironmentSnapshot())
+    assert _ExtractedCode(get_requirements=True).requirements == {"package==1"}
+    assert _ExtractedCode(get_requirements=True).requirements == {"package==1"}
+
+
+def test_warm_in_background(monkeypatch):
+    calls = counting_freeze(monkeypatch)
+    monkeypatch.setattr(environment, "_SNAPSHOT", _EnvironmentSnapshot())
+    warm_requirements(background=True)
+    deadline = time.time() + 10
+    while len(calls) == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert environment._get_requirements() == {"package==1"}
+    assert len(calls) == 1
+
+
+def test_minimal_requirements_without_metadata_warn(monkeypatch):
+    counting_freeze(monkeypatch)
+    monkeypatch.setattr(environment, "_metadata", None)
+    monkeypatch.setattr(environment, "_SNAPSHOT", _EnvironmentSnapshot())
+    with pytest.warns(UserWarning, match="importlib_metadata"):
+        requirements = environment._get_minimal_requirements(["import json"])
+    assert requirements == {"package==1"}
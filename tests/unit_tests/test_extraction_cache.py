@@ -0,0 +1,141 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import importlib.util
+import os
+import sqlite3
+import sys
+
+import pytest
+
+from code_extractor import ExtractionCache, extract_code, load_code
+from code_extractor.extractor import cache as cache_module
+from code_extractor.extractor import extract
+
+MODULE_SOURCE = """
+class Helper:
+    def value(self):
+        return {value}
+
+
+def cached_function():
+    return Helper().value()
+"""
+
+
+def write_module(directory, value):
+    path = os.path.join(directory, "cached_module.py")
+    with open(path, "w") as module_file:
+        module_file.write(MODULE_SOURCE.format(value=value))
+    return path
+
+
+def import_module(path):
+    spec = importlib.util.spec_from_file_location("cached_module", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["cached_module"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def module_path(tmp_path):
+    path = write_module(str(tmp_path), 1)
+    yield path
+    sys.modules.pop("cached_module", None)
+
+
+def test_hit_skips_extraction(tmp_path, module_path, monkeypatch):
+    module = import_module(module_path)
+    cache = ExtractionCache(os.path.join(str(tmp_path), "cache.sqlite"))
+    first = extract_code(module.cached_function, cache=cache)
+    assert cache.misses == 1
+    assert len(cache) == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError("Extraction was not served from the cache")
+
+    monkeypatch.setattr(extract, "_extract_code", fail)
+    second = extract_code(module.cached_function, cache=cache)
+    assert second == first
+    assert cache.hits == 1
+    assert load_code(second)() == 1
+
+
+def test_changed_source_invalidates_entry(tmp_path, module_path):
+    module = import_module(module_path)
+    cache = ExtractionCache(os.path.join(str(tmp_path), "cache.sqlite"))
+    extract_code(module.cached_function, cache=cache)
+    write_module(str(tmp_path), 123456)
+    module = import_module(module_path)
+    extracted = extract_code(module.cached_function, cache=cache)
+    assert cache.hits == 0
+    assert cache.misses == 2
+    assert load_code(extracted)() == 123456
+
+
+def test_cache_is_shared_between_instances(tmp_path, module_path):
+    module = import_module(module_path)
+    path = os.path.join(str(tmp_path), "cache.sqlite")
+    first = extract_code(module.cached_function, cache=ExtractionCache(path))
+    other_cache = ExtractionCache(path)
+    assert extract_code(module.cached_function, cache=other_cache) == first
+    assert other_cache.hits == 1
+
+
+def test_lru_eviction(tmp_path, module_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "_TOUCH_INTERVAL", 0.0)
+    cache = ExtractionCache(os.path.join(str(tmp_path), "cache.sqlite"), max_entries=2)
+    cache.put("first", "1", [module_path])
+    cache.put("second", "2", [module_path])
+    assert cache.get("first") == "1"
+    cache.put("third", "3", [module_path])
+    assert len(cache) == 2
+    assert cache.get("second") is None
+    assert cache.get("first") == "1"
+    assert cache.get("third") == "3"
+
+
+def test_size_bound(tmp_path, module_path):
+    cache = ExtractionCache(os.path.join(str(tmp_path), "cache.sqlite"), max_bytes=10)
+    cache.put("first", "123456", [module_path])
+    cache.put("second", "123456", [module_path])
+    assert cache.get("first") is None
+    assert cache.get("second") == "123456"
+    cache.put("too_big", "12345678901", [module_path])
+    assert cache.get("too_big") is None
+
+
+def test_recent_hits_do_not_write(tmp_path, module_path):
+    path = os.path.join(str(tmp_path), "cache.sqlite")
+    cache = ExtractionCache(path)
+    cache.put("key", "payload", [module_path])
+    connection = sqlite3.connect(path)
+    stored = connection.execute("SELECT last_used FROM entries").fetchone()
+    assert cache.get("key") == "payload"
+    assert connection.execute("SELECT last_used FROM entries").fetchone() == stored
+    connection.close()
+
+
+def test_requirements_are_keyed_by_environment(tmp_path, module_path, monkeypatch):
+    module = import_module(module_path)
+    cache = ExtractionCache(os.path.join(str(tmp_path), "cache.sqlite"))
+    extract_code(module.cached_function, get_requirements=True, cache=cache)
+    extract_code(module.cached_function, get_requirements=True, cache=cache)
+    assert cache.hits == 1
+    monkeypatch.setattr(extract, "_environment_fingerprint", lambda: "upgraded")
+    extract_code(module.cached_function, get_requirements=True, cache=cache)
+    assert cache.hits == 1
+    assert cache.misses == 2
@@ -0,0 +1,53 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+from concurrent.futures import ThreadPoolExecutor
+
+from code_extractor import extract_code
+from code_extractor.extracted_code import _ExtractedCode
+from code_extractor.extractor import extract
+from code_extractor.extractor.extract import _ExtractionContext, _extract_code
+
+
+class Dependency:
+    def method(self):
+        return 42
+
+
+def function_with_dependency():
+    return Dependency().method()
+
+
+def test_no_module_level_state():
+    assert not hasattr(extract, "_MODULE_LOCK")
+    assert not hasattr(extract, "_SAVED_CODE")
+
+
+def test_context_memoizes_visited_functions():
+    context = _ExtractionContext()
+    _extract_code(function_with_dependency, context)
+    assert function_with_dependency in context.function_nodes
+    assert Dependency.method in context.function_nodes
+    assert function_with_dependency in context.dependencies
+
+
+def test_concurrent_extractions_are_independent():
+    expected = _ExtractedCode.from_string(extract_code(function_with_dependency))
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            executor.map(lambda _: extract_code(function_with_dependency), range(64))
+        )
+    for result in results:
+        assert _ExtractedCode.from_string(result) == expected
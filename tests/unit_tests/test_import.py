@@ -24,6 +24,8 @@ def test_import_module():
     assert getattr(code_extractor, "load_code", None) is not None
     assert inspect.isfunction(code_extractor.extract_code)
     assert inspect.isfunction(code_extractor.load_code)
+    assert inspect.isfunction(code_extractor.extract_many)
+    assert inspect.isfunction(code_extractor.load_many)
 
 
 def test_import_pickle():
@@ -35,3 +37,5 @@ def test_import_pickle():
     assert inspect.isfunction(code_pickler.loads)
     assert inspect.isfunction(code_pickler.dump)
     assert inspect.isfunction(code_pickler.dumps)
+    assert inspect.isfunction(code_pickler.dumps_many)
+    assert inspect.isfunction(code_pickler.loads_many)
@@ -0,0 +1,119 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import enum
+
+import pytest
+
+from code_extractor import extract_code, extract_many, load_code, load_many
+
+
+class Color(enum.Enum):
+    RED = 1
+    GREEN = 2
+
+
+PALETTE = {"red": Color.RED, "green": Color.GREEN}
+
+
+class LazyParent:
+    def value(self):
+        return len(PALETTE)
+
+
+def lazy_function():
+    return LazyParent().value()
+
+
+SCALE = 3
+
+
+def scaled(method):
+    def wrapper(self):
+        return method(self) * 10
+
+    return wrapper
+
+
+class Model:
+    factor = SCALE
+
+    @scaled
+    def value(self):
+        return self.factor
+
+
+@pytest.fixture
+def payload(make_extracted_code):
+    extracted_code = make_extracted_code(
+        "target",
+        "def target(flag):\n    return fast() + Holder.value if flag else slow()\n",
+        imports=["import json"],
+        dependencies=[
+            "def fast():\n    return len(json.dumps([]))\n",
+            "def slow():\n    return SLOW_VALUE\n",
+            "SLOW_VALUE = [].pop()\n",
+            "class Holder:\n    pass\n",
+            "Holder.value = 3\n",
+        ],
+    )
+    return extracted_code.to_string(freeze_code=False)
+
+
+def test_unused_dependencies_are_not_executed(payload):
+    code = payload
+    with pytest.raises(IndexError):
+        load_code(code)
+    target = load_code(code, lazy=True)
+    assert target(True) == 5
+    with pytest.raises(IndexError):
+        target(False)
+
+
+def test_only_used_names_are_materialized(payload):
+    target = load_code(payload, lazy=True)
+    namespace = target.__globals__
+    assert "fast" not in namespace.keys()
+    assert "json" not in namespace.keys()
+    target(True)
+    assert {"fast", "json", "Holder"} <= set(namespace.keys())
+    assert "slow" not in namespace.keys()
+
+
+def test_lazy_load_of_extracted_code():
+    assert load_code(extract_code(lazy_function), lazy=True)() == 2
+    bundle = extract_many([lazy_function, LazyParent], bundle=True)
+    function, parent = load_many(bundle, lazy=True)
+    assert function() == parent().value() == 2
+
+
+def test_lazy_cannot_be_loaded_as_module():
+    with pytest.raises(ValueError):
+        load_code(extract_code(lazy_function), lazy=True, as_module=True)
+
+
+def test_failed_materialization_is_retried(payload):
+    target = load_code(payload, lazy=True)
+    for _ in range(2):
+        with pytest.raises(IndexError):
+            target(False)
+
+
+def test_class_bodies_see_lazy_names():
+    code = extract_code(Model)
+    assert load_code(code)().value() == 30
+    assert load_code(code, lazy=True)().value() == 30
+    (model,) = load_many(extract_many([Model], bundle=True), lazy=True)
+    assert model().value() == 30
@@ -0,0 +1,79 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import linecache
+import sys
+import traceback
+
+from code_extractor import DictStore, extract_code, extract_many, load_code, load_many
+from code_extractor.extracted_code import _ExtractedCode
+from code_extractor.loader.module_loader import _MODULE_PREFIX
+
+
+class ModuleClass:
+    def value(self):
+        return 42
+
+
+def module_function():
+    return ModuleClass().value()
+
+
+def failing_function():
+    raise RuntimeError("failure")
+
+
+def test_load_as_module():
+    code = extract_code(module_function)
+    digest = _ExtractedCode.from_string(code).digest
+    function = load_code(code, as_module=True)
+    assert function() == 42
+    module = sys.modules[_MODULE_PREFIX + digest]
+    assert function.__module__ == module.__name__
+    assert module.ModuleClass().value() == 42
+    assert load_code(code, as_module=True) is function
+
+
+def test_source_is_registered_with_linecache():
+    code = extract_code(failing_function, binary=True)
+    function = load_code(code, as_module=True)
+    filename = function.__code__.co_filename
+    assert linecache.getline(filename, function.__code__.co_firstlineno).startswith(
+        "def failing_function"
+    )
+    try:
+        function()
+    except RuntimeError:
+        formatted = traceback.format_exc()
+    assert 'raise RuntimeError("failure")' in formatted
+
+
+def test_load_many_as_module():
+    bundle = extract_many([module_function, ModuleClass], bundle=True)
+    function, cls = load_many(bundle, as_module=True)
+    assert function.__module__ == cls.__module__
+    assert function() == cls().value()
+
+
+def test_load_as_module_with_store():
+    store = DictStore()
+    code = extract_code(module_function, store=store, embed_bytecode=True)
+    assert load_code(code, store=store, as_module=True)() == 42
+
+
+def test_anonymous_load_is_unchanged():
+    function = load_code(extract_code(module_function))
+    assert function.__module__ is None
+    assert function.__code__.co_filename.startswith("<code_extractor ")
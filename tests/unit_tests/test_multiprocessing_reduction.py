@@ -0,0 +1,139 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import linecache
+import multiprocessing
+import pickle
+import sys
+import types
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.reduction import ForkingPickler
+
+import pytest
+
+from code_extractor import (
+    disable_multiprocessing_reduction,
+    enable_multiprocessing_reduction,
+)
+
+MODULE = """
+CALLS = []
+
+
+def tick(value):
+    CALLS.append(value)
+    return value * 2, len(CALLS)
+
+
+class Counter:
+    def __init__(self, start):
+        self.start = start
+
+    def next(self):
+        return self.start + 1
+"""
+
+NOTEBOOK_CELL = """
+def double(value):
+    return value * 2
+
+
+def tick(value):
+    return double(value) + 1
+"""
+
+
+@pytest.fixture
+def reduction():
+    enable_multiprocessing_reduction()
+    yield
+    disable_multiprocessing_reduction()
+
+
+@pytest.fixture
+def runtime_module(tmp_path):
+    path = tmp_path / "runtime_module.py"
+    path.write_text(MODULE)
+    module = types.ModuleType("runtime_module")
+    module.__file__ = str(path)
+    sys.modules[module.__name__] = module
+    exec(compile(MODULE, str(path), "exec"), module.__dict__)
+    yield module
+    del sys.modules[module.__name__]
+
+
+@pytest.fixture
+def notebook_module():
+    # Registered in linecache without a file, as IPython does with the cells it runs.
+    filename = "<notebook-cell-1>"
+    linecache.cache[filename] = (
+        len(NOTEBOOK_CELL),
+        None,
+        NOTEBOOK_CELL.splitlines(True),
+        filename,
+    )
+    module = types.ModuleType("notebook_module")
+    sys.modules[module.__name__] = module
+    exec(compile(NOTEBOOK_CELL, filename, "exec"), module.__dict__)
+    yield module
+    del sys.modules[module.__name__]
+    del linecache.cache[filename]
+
+
+def by_reference(value):
+    return value
+
+
+def test_runtime_functions_and_classes_are_extracted(reduction, runtime_module):
+    tick = pickle.loads(ForkingPickler.dumps(runtime_module.tick))
+    assert tick is not runtime_module.tick
+    assert tick(2) == (4, 1)
+    counter = pickle.loads(ForkingPickler.dumps(runtime_module.Counter(1)))
+    assert counter.next() == 2
+    assert type(counter) is not runtime_module.Counter
+
+
+def test_modules_without_file_are_extracted(reduction, notebook_module):
+    tick = pickle.loads(ForkingPickler.dumps(notebook_module.tick))
+    assert tick is not notebook_module.tick
+    assert tick.__globals__["double"] is not notebook_module.double
+    assert tick(2) == 5
+
+
+def test_loaded_objects_are_cached(reduction, runtime_module):
+    first = pickle.loads(ForkingPickler.dumps(runtime_module.tick))
+    second = pickle.loads(ForkingPickler.dumps(runtime_module.tick))
+    assert first is second
+
+
+def test_importable_objects_are_pickled_by_reference(reduction):
+    assert pickle.loads(ForkingPickler.dumps(by_reference)) is by_reference
+
+
+def test_disable_restores_forking_pickler(runtime_module):
+    enable_multiprocessing_reduction()
+    assert "reducer_override" in vars(ForkingPickler)
+    disable_multiprocessing_reduction()
+    assert "reducer_override" not in vars(ForkingPickler)
+    tick = pickle.loads(ForkingPickler.dumps(runtime_module.tick))
+    assert tick is runtime_module.tick
+
+
+def test_spawned_workers_load_each_function_once(reduction, runtime_module):
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=context) as executor:
+        results = [executor.submit(runtime_module.tick, i).result() for i in range(3)]
+    assert results == [(0, 1), (2, 2), (4, 3)]
@@ -0,0 +1,130 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import gc
+import pickle
+
+import pytest
+
+import code_extractor.pickle
+
+from code_extractor import (
+    disable_object_cache,
+    enable_object_cache,
+    extract_code,
+    extract_many,
+    load_code,
+    load_many,
+    object_cache_info,
+)
+from code_extractor.extracted_code import _ExtractedCode
+from code_extractor.loader import load
+
+
+class CachedClass:
+    def value(self):
+        return 42
+
+
+def cached_function():
+    return CachedClass().value()
+
+
+def other_cached_function():
+    return 0
+
+
+@pytest.fixture
+def object_cache():
+    enable_object_cache()
+    yield
+    disable_object_cache()
+
+
+def test_disabled_by_default():
+    code = extract_code(cached_function)
+    assert load_code(code) is not load_code(code)
+    assert object_cache_info().currsize == 0
+
+
+def test_repeated_load_is_cached(object_cache, monkeypatch):
+    code = extract_code(cached_function)
+    loaded = load_code(code)
+    monkeypatch.setattr(load, "_load_extracted_code", None)
+    assert load_code(code) is loaded
+    assert load_code(code.encode("utf-8")) is loaded
+    info = object_cache_info()
+    assert (info.hits, info.misses, info.currsize) == (2, 1, 1)
+    assert info.currbytes == len(code)
+
+
+def test_load_many_and_load_code_are_cached_apart(object_cache):
+    code = extract_code(cached_function)
+    function = load_code(code)
+    functions = load_many(code)
+    assert isinstance(functions, list)
+    assert load_many(code)[0] is functions[0] is not function
+
+
+def test_lru_eviction():
+    enable_object_cache(max_entries=1)
+    try:
+        first, second = extract_many([cached_function, other_cached_function])
+        loaded = load_code(first)
+        load_code(second)
+        assert load_code(first) is not loaded
+        assert object_cache_info().evictions == 2
+    finally:
+        disable_object_cache()
+
+
+def test_max_bytes():
+    code = extract_code(cached_function)
+    enable_object_cache(max_bytes=len(code) - 1)
+    try:
+        assert load_code(code) is not load_code(code)
+        assert object_cache_info().currsize == 0
+    finally:
+        disable_object_cache()
+
+
+def test_weak_classes():
+    enable_object_cache(weak_classes=True)
+    try:
+        code = extract_code(CachedClass)
+        loaded = load_code(code)
+        assert load_code(code) is loaded
+        del loaded
+        gc.collect()
+        load_code(code)
+        assert object_cache_info().misses == 2
+    finally:
+        disable_object_cache()
+
+
+def test_pickle_loads_is_cached(object_cache):
+    data = code_extractor.pickle.dumps(cached_function)
+    assert code_extractor.pickle.loads(data) is code_extractor.pickle.loads(data)
+    with pytest.raises(ValueError):
+        code_extractor.pickle.loads(pickle.dumps("invalid"))
+
+
+def test_requirement_check_is_not_skipped_by_cache(object_cache):
+    extracted_code = _ExtractedCode.from_string(extract_code(other_cached_function))
+    extracted_code.requirements = {"not-an-installed-package==1.0"}
+    code = extracted_code.to_string()
+    load_code(code)
+    with pytest.warns(UserWarning, match="not-an-installed-package"):
+        load_code(code, check_requirements=True)
@@ -0,0 +1,100 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import pytest
+
+from code_extractor.extracted_code import _ExtractedCode
+from code_extractor.ordering import _analyze_dependency, _order_dependencies
+
+PARENT = "class Parent:\n    pass\n"
+CHILD = "class Child(Parent):\n    value = CONSTANT\n"
+CONSTANT = "CONSTANT = 1 / 0\n"
+DECORATED = (
+    "@decorator\ndef decorated(value=Child):\n    return undefined_at_definition\n"
+)
+DECORATOR = "def decorator(function):\n    return function\n"
+
+
+def test_analysis_skips_function_bodies():
+    defines, needs = _analyze_dependency(DECORATED)
+    assert defines == {"decorated"}
+    assert needs == {"decorator", "Child"}
+
+
+def test_analysis_of_attribute_targets():
+    defines, needs = _analyze_dependency(
+        "module.Enum = enum.Enum(value='Enum', names=[])\n"
+    )
+    assert defines == {"module.Enum"}
+    assert needs == {"module", "enum.Enum"}
+
+
+def test_analysis_ignores_comprehension_and_class_locals():
+    defines, needs = _analyze_dependency(
+        "class Class:\n    a = 1\n    b = [a * x for x in values]\n"
+    )
+    assert defines == {"Class"}
+    assert needs == {"values"}
+
+
+def test_order_without_execution():
+    ordered = _order_dependencies([DECORATED, CHILD, DECORATOR, PARENT, CONSTANT])
+    assert ordered.index(PARENT) < ordered.index(CHILD)
+    assert ordered.index(CONSTANT) < ordered.index(CHILD)
+    assert ordered.index(CHILD) < ordered.index(DECORATED)
+    assert ordered.index(DECORATOR) < ordered.index(DECORATED)
+
+
+def test_order_is_deterministic():
+    dependencies = [DECORATED, CHILD, DECORATOR, PARENT, CONSTANT]
+    assert _order_dependencies(dependencies) == _order_dependencies(
+        list(reversed(dependencies))
+    )
+
+
+def test_module_attribute_dependencies():
+    enum_dependency = "module.Enum = enum.Enum(value='Enum', names=[('A', 1)])\n"
+    dict_dependency = "module.mapping = {module.Enum.A: 1}\n"
+    assert _order_dependencies([dict_dependency, enum_dependency]) == [
+        enum_dependency,
+        dict_dependency,
+    ]
+
+
+def test_mutually_recursive_functions():
+    first = "def first():\n    return second()\n"
+    second = "def second():\n    return first()\n"
+    assert set(_order_dependencies([first, second])) == {first, second}
+
+
+def test_cycle_diagnostic():
+    with pytest.raises(RuntimeError, match="circular") as error:
+        _order_dependencies(["class A(B):\n    pass\n", "class B(A):\n    pass\n"])
+    assert "'A'" in str(error.value)
+    assert "'B'" in str(error.value)
+
+
+def test_to_code_loads_in_order():
+    extracted_code = _ExtractedCode(get_requirements=False)
+    extracted_code.name = "function"
+    extracted_code.code = "def function():\n    return Child.value\n"
+    extracted_code.dependencies = {
+        "class Child(Parent):\n    value = CONSTANT\n",
+        PARENT,
+        "CONSTANT = 42\n",
+    }
+    global_dict = {}
+    exec(extracted_code.to_code(), global_dict)
+    assert global_dict["function"]() == 42
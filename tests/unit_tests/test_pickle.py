@@ -29,7 +29,14 @@ def test_dumps():
 
         code_extractor.pickle.dumps(mock_object, 2, False)
 
-        mock_extract.assert_called_once_with(mock_object)
+        mock_extract.assert_called_once_with(
+            mock_object,
+            binary=False,
+            compression=None,
+            compression_level=None,
+            store=None,
+            embed_bytecode=False,
+        )
         mock_pickle.assert_called_once_with(
             obj="Test string", protocol=2, fix_imports=False
         )
@@ -45,7 +52,14 @@ def test_dump():
 
         code_extractor.pickle.dump(mock_object, mock_file, 2, False)
 
-        mock_extract.assert_called_once_with(mock_object)
+        mock_extract.assert_called_once_with(
+            mock_object,
+            binary=False,
+            compression=None,
+            compression_level=None,
+            store=None,
+            embed_bytecode=False,
+        )
         mock_pickle.assert_called_once_with(
             obj="Test string", protocol=2, fix_imports=False, file=mock_file
         )
@@ -53,10 +67,13 @@ def test_dump():
 
 def test_loads_success():
     with patch("pickle.loads") as mock_pickle, patch(
-        "code_extractor.pickle.pickle_code.load_code"
-    ) as mock_load, patch("json.loads") as mock_json:
+        "code_extractor.pickle.pickle_code._load_extracted_code"
+    ) as mock_load, patch(
+        "code_extractor.pickle.pickle_code._ExtractedCode.from_string"
+    ) as mock_parse:
         mock_pickle.return_value = "Test string"
-        mock_json.return_value = "Extracted json"
+        mock_extracted = MagicMock()
+        mock_parse.return_value = mock_extracted
         mock_loaded = MagicMock()
         mock_load.return_value = mock_loaded
         mock_object = b"Test input"
@@ -67,16 +84,20 @@ def test_loads_success():
         mock_pickle.assert_called_once_with(
             mock_object, fix_imports=False, encoding="utf-8", errors="strict"
         )
-        mock_json.assert_called_once_with("Test string")
-        mock_load.assert_called_once_with("Test string")
+        mock_parse.assert_called_once_with("Test string")
+        mock_load.assert_called_once_with(
+            mock_extracted, check_requirements=False, store=None, code_cache=None
+        )
 
 
 def test_loads_failure():
     with patch("pickle.loads") as mock_pickle, patch(
-        "code_extractor.pickle.pickle_code.load_code"
-    ) as mock_load, patch("json.loads") as mock_json:
+        "code_extractor.pickle.pickle_code._load_extracted_code"
+    ) as mock_load, patch(
+        "code_extractor.pickle.pickle_code._ExtractedCode.from_string"
+    ) as mock_parse:
         mock_pickle.return_value = "Test string"
-        mock_json.side_effect = ValueError()
+        mock_parse.side_effect = ValueError()
         mock_loaded = MagicMock()
         mock_load.return_value = mock_loaded
         mock_object = b"Test input"
@@ -89,16 +110,19 @@ def test_loads_failure():
         mock_pickle.assert_called_once_with(
             mock_object, fix_imports=False, encoding="utf-8", errors="strict"
         )
-        mock_json.assert_called_once_with("Test string")
+        mock_parse.assert_called_once_with("Test string")
         mock_load.assert_not_called()
 
 
 def test_load_success():
     with patch("pickle.load") as mock_pickle, patch(
-        "code_extractor.pickle.pickle_code.load_code"
-    ) as mock_load, patch("json.loads") as mock_json:
+        "code_extractor.pickle.pickle_code._load_extracted_code"
+    ) as mock_load, patch(
+        "code_extractor.pickle.pickle_code._ExtractedCode.from_string"
+    ) as mock_parse:
         mock_pickle.return_value = "Test string"
-        mock_json.return_value = "Extracted json"
+        mock_extracted = MagicMock()
+        mock_parse.return_value = mock_extracted
         mock_loaded = MagicMock()
         mock_load.return_value = mock_loaded
         mock_file = MagicMock()
@@ -109,16 +133,20 @@ def test_load_success():
         mock_pickle.assert_called_once_with(
             file=mock_file, fix_imports=False, encoding="utf-8", errors="strict"
         )
-        mock_json.assert_called_once_with("Test string")
-        mock_load.assert_called_once_with("Test string")
+        mock_parse.assert_called_once_with("Test string")
+        mock_load.assert_called_once_with(
+            mock_extracted, check_requirements=False, store=None, code_cache=None
+        )
 
 
 def test_load_failure():
     with patch("pickle.load") as mock_pickle, patch(
-        "code_extractor.pickle.pickle_code.load_code"
-    ) as mock_load, patch("json.loads") as mock_json:
+        "code_extractor.pickle.pickle_code._load_extracted_code"
+    ) as mock_load, patch(
+        "code_extractor.pickle.pickle_code._ExtractedCode.from_string"
+    ) as mock_parse:
         mock_pickle.return_value = "Test string"
-        mock_json.side_effect = ValueError()
+        mock_parse.side_effect = ValueError()
         mock_loaded = MagicMock()
         mock_load.return_value = mock_loaded
         mock_file = MagicMock()
@@ -131,5 +159,5 @@ def test_load_failure():
         mock_pickle.assert_called_once_with(
             file=mock_file, fix_imports=False, encoding="utf-8", errors="strict"
         )
-        mock_json.assert_called_once_with("Test string")
+        mock_parse.assert_called_once_with("Test string")
         mock_load.assert_not_called()
@@ -0,0 +1,162 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import array
+import io
+import pickle
+
+import pytest
+
+import code_extractor.pickle
+from code_extractor.extracted_code import _BUFFERS
+from code_extractor.pickle import Pickler, StreamPickler, StreamUnpickler, Unpickler
+
+TABLE = bytes(range(256)) * 1024
+MUTABLE_TABLE = bytearray(TABLE)
+SMALL = b"small"
+VIEW = memoryview(bytearray(range(128)) * 1024)
+OTHER_MUTABLE_TABLE = bytearray(TABLE)
+MATRIX = memoryview(array.array("d", range(1 << 14))).cast("B").cast("d", (128, 128))
+
+
+def lookup(index):
+    return TABLE[index] + MUTABLE_TABLE[index] + len(SMALL)
+
+
+def other_lookup(index):
+    return TABLE[index]
+
+
+def view_lookup(index):
+    return VIEW[index]
+
+
+def mutate(index):
+    MUTABLE_TABLE[index] = 0
+    return OTHER_MUTABLE_TABLE[index]
+
+
+def matrix_lookup(row, column):
+    return MATRIX[row, column]
+
+
+def test_buffers_are_carried_out_of_band():
+    buffers = []
+    string = code_extractor.pickle.dumps(
+        lookup, protocol=5, buffer_callback=buffers.append
+    )
+    assert len(buffers) == 2
+    assert len(string) < len(TABLE)
+    assert b"small" in string
+    loaded = code_extractor.pickle.loads(string, buffers=buffers)
+    assert loaded(300) == 2 * TABLE[300] + 5
+    namespace = loaded.__globals__
+    assert type(namespace["TABLE"]) is bytes
+    assert namespace["TABLE"] == TABLE
+    assert type(namespace["MUTABLE_TABLE"]) is bytearray
+    assert namespace["MUTABLE_TABLE"] is not MUTABLE_TABLE
+    assert set(namespace[_BUFFERS].keys()) == set(
+        code_extractor.pickle.pickle_code._split_buffers(
+            pickle.loads(string, buffers=buffers), ""
+        )[1].keys()
+    )
+
+
+def test_memoryview_buffers_are_not_copied():
+    buffers = []
+    string = code_extractor.pickle.dumps(
+        view_lookup, protocol=5, buffer_callback=buffers.append
+    )
+    assert len(buffers) == 1
+    loaded = code_extractor.pickle.loads(string, buffers=buffers)
+    assert loaded(130) == 2
+    assert isinstance(loaded.__globals__["VIEW"], memoryview)
+    VIEW[130] = 7
+    try:
+        assert loaded(130) == 7
+    finally:
+        VIEW[130] = 2
+
+
+def test_buffers_in_band_and_below_protocol_5():
+    string = code_extractor.pickle.dumps(lookup, protocol=5)
+    assert code_extractor.pickle.loads(string)(1) == 7
+    file = io.BytesIO()
+    code_extractor.pickle.dump(lookup, file, protocol=4)
+    file.seek(0)
+    assert code_extractor.pickle.load(file)(1) == 7
+    string = code_extractor.pickle.dumps(lookup, protocol=5, buffer_threshold=1 << 30)
+    assert len(string) > len(TABLE)
+
+
+def test_missing_buffers_raise():
+    buffers = []
+    string = code_extractor.pickle.dumps_many(
+        [lookup, other_lookup], protocol=5, buffer_callback=buffers.append
+    )
+    first, second = code_extractor.pickle.loads_many(string, buffers=buffers)
+    assert first(2) - second(2) == 7
+    unpickled = pickle.loads(string, buffers=buffers)
+    payload, _ = unpickled
+    with pytest.raises(ValueError):
+        code_extractor.load_many(payload)
+
+
+def test_picklers_share_buffers():
+    for pickler_class, unpickler_class in [
+        (Pickler, Unpickler),
+        (StreamPickler, StreamUnpickler),
+    ]:
+        buffers = []
+        file = io.BytesIO()
+        pickler = pickler_class(file, protocol=5, buffer_callback=buffers.append)
+        pickler.dump([lookup, other_lookup])
+        assert len(buffers) == 2
+        file.seek(0)
+        first, second = unpickler_class(file, buffers=buffers).load()
+        assert first(3) - second(3) == 8
+
+
+@pytest.mark.parametrize("out_of_band", [False, True])
+def test_equal_bytearrays_stay_distinct(out_of_band):
+    buffers = []
+    string = code_extractor.pickle.dumps_many(
+        [mutate, lookup],
+        protocol=5,
+        buffer_callback=buffers.append if out_of_band else None,
+    )
+    loaded_mutate, loaded_lookup = code_extractor.pickle.loads_many(
+        string, buffers=buffers
+    )
+    namespace = loaded_mutate.__globals__
+    assert namespace["MUTABLE_TABLE"] is not namespace["OTHER_MUTABLE_TABLE"]
+    assert loaded_mutate(1) == 1
+    assert loaded_lookup(1) == TABLE[1] + len(SMALL)
+    assert MUTABLE_TABLE[1] == OTHER_MUTABLE_TABLE[1] == 1
+
+
+@pytest.mark.parametrize("out_of_band", [False, True])
+def test_typed_memoryviews_keep_their_format(out_of_band):
+    buffers = []
+    string = code_extractor.pickle.dumps(
+        matrix_lookup,
+        protocol=5,
+        buffer_callback=buffers.append if out_of_band else None,
+    )
+    assert len(buffers) == int(out_of_band)
+    loaded = code_extractor.pickle.loads(string, buffers=buffers)
+    assert loaded(2, 3) == 259.0
+    matrix = loaded.__globals__["MATRIX"]
+    assert (matrix.format, matrix.shape) == ("d", (128, 128))
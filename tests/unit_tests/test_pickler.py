@@ -0,0 +1,94 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import io
+import pickle
+
+import pytest
+
+from code_extractor.pickle import Pickler, Unpickler
+from code_extractor.store import DictStore
+
+
+class Task:
+    def __init__(self, callback):
+        self.callback = callback
+
+    def run(self, value):
+        return self.callback(value)
+
+
+def double(value):
+    return value * 2
+
+
+def increment(value):
+    return value + 1
+
+
+def quadruple(value):
+    return double(double(value))
+
+
+def _dump(obj, **kwargs):
+    file = io.BytesIO()
+    pickler = Pickler(file, **kwargs)
+    pickler.dump(obj)
+    file.seek(0)
+    return pickler, file
+
+
+def test_nested_functions_and_classes_are_extracted():
+    graph = {
+        "tasks": [Task(double), Task(increment)],
+        "callbacks": (double, len),
+        "value": 3,
+    }
+    _, file = _dump(graph)
+    assert b"def double" in file.getvalue()
+    loaded = Unpickler(file).load()
+    assert [task.run(loaded["value"]) for task in loaded["tasks"]] == [6, 4]
+    assert loaded["callbacks"][0] is not double
+    assert loaded["callbacks"][0](5) == 10
+    assert loaded["callbacks"][1] is len
+
+
+def test_each_callable_is_extracted_once():
+    file = io.BytesIO()
+    pickler = Pickler(file)
+    pickler.dump([double, double, Task(double), Task(double)])
+    pickler.dump([double, Task])
+    assert len(pickler._payloads) == 2
+    assert file.getvalue().count(b'"name": "double"') == 1
+    file.seek(0)
+    unpickler = Unpickler(file)
+    first = unpickler.load()
+    assert first[0] is first[1] is first[2].callback
+    second = unpickler.load()
+    assert second[0] is first[0]
+    assert second[1] is type(first[3])
+
+
+def test_unpickler_uses_store():
+    store = DictStore()
+    _, file = _dump(Task(quadruple), store=store, binary=True)
+    assert len(store.sources) == 1
+    loaded = Unpickler(file, store=store).load()
+    assert loaded.run(2) == 8
+
+
+def test_lambdas_are_left_to_native_pickler():
+    with pytest.raises((pickle.PicklingError, AttributeError)):
+        _dump(lambda value: value)
@@ -0,0 +1,118 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import gc
+
+import pytest
+
+from code_extractor import extract_code, extract_many, load_code, load_many
+from code_extractor.loader.shared import _SHARED_NAMESPACES
+
+
+@pytest.fixture
+def make_payload(make_extracted_code):
+    def make(name, body):
+        extracted_code = make_extracted_code(
+            name,
+            f"def {name}():\n{body}",
+            imports=["import json"],
+            dependencies=[
+                "COUNTER = []\n",
+                "def count():\n    COUNTER.append(1)\n    return len(COUNTER)\n",
+            ],
+        )
+        return extracted_code.to_string(freeze_code=False)
+
+    return make
+
+
+def shared_helper():
+    return 1
+
+
+SCALE = 3
+
+
+def scaled(method):
+    def wrapper(self):
+        return method(self) * 10
+
+    return wrapper
+
+
+class Model:
+    factor = SCALE
+
+    @scaled
+    def value(self):
+        return self.factor
+
+
+def test_dependencies_are_shared_between_loads(make_payload):
+    first = load_code(make_payload("first", "    return count()\n"), shared=True)
+    second = load_code(
+        make_payload("second", "    return count() + len(json.dumps([]))\n"),
+        shared=True,
+    )
+    assert first() == 1
+    assert second() == 4
+    assert first.__globals__["COUNTER"] is second.__globals__["COUNTER"]
+    assert first.__globals__ is not second.__globals__
+    unshared = load_code(make_payload("first", "    return count()\n"))
+    assert unshared() == 1
+
+
+def test_assignments_stay_in_overlay(make_payload):
+    setter = load_code(
+        make_payload("setter", "    global COUNTER\n    COUNTER = None\n"), shared=True
+    )
+    reader = load_code(make_payload("reader", "    return COUNTER\n"), shared=True)
+    setter()
+    assert isinstance(reader(), list)
+    assert setter.__globals__["COUNTER"] is None
+
+
+def test_base_namespace_is_released(make_payload):
+    gc.collect()
+    entries = len(_SHARED_NAMESPACES)
+    loaded = load_code(make_payload("released", "    return count()\n"), shared=True)
+    assert len(_SHARED_NAMESPACES) == entries + 1
+    del loaded
+    gc.collect()
+    assert len(_SHARED_NAMESPACES) == entries
+
+
+def test_shared_lazy_and_many(make_payload):
+    loaded = load_code(
+        make_payload("lazy", "    return count()\n"), shared=True, lazy=True
+    )
+    assert loaded() == 1
+    assert "json" not in loaded.__globals__._base.keys()
+    first, second = load_many(
+        extract_many([shared_helper, shared_helper], bundle=True), shared=True
+    )
+    assert first() == second() == 1
+
+
+def test_shared_cannot_be_loaded_as_module():
+    with pytest.raises(ValueError):
+        load_code(extract_code(shared_helper), shared=True, as_module=True)
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_class_bodies_see_shared_names(lazy):
+    model = load_code(extract_code(Model), shared=True, lazy=lazy)
+    assert model().value() == 30
+    assert "SCALE" in model.value.__globals__.keys()
@@ -0,0 +1,183 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import functools
+import gc
+import hashlib
+import importlib
+import inspect
+import sys
+import textwrap
+
+import pytest
+
+from code_extractor import extract_code, load_code
+from code_extractor.extracted_code import _ExtractedCode
+from code_extractor.extractor.source import (
+    _SourceCache,
+    source_cache_clear,
+    source_cache_info,
+)
+
+
+class Parent:
+    def parent_method(self):
+        return 1
+
+
+class Child(Parent):
+    def child_method(self):
+        return 2
+
+
+def function_with_dependencies():
+    return Child().child_method()
+
+
+def wrap(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+@wrap
+def first_wrapped(value):
+    return value
+
+
+@wrap
+def second_wrapped(value):
+    return value + 1
+
+
+DECORATED_MODULE = """
+import functools
+
+
+def deco(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return func(*args, **kwargs) * 10
+
+    return wrapper
+
+
+class Base:
+    def base(self):
+        return 1
+
+
+class Mid(Base):
+    @deco
+    def value(self):
+        return self.base() + 1
+
+
+class Leaf(Mid):
+    pass
+
+
+def target():
+    return Leaf().value()
+"""
+
+
+def test_source_is_dedented_and_hashed():
+    cache = _SourceCache()
+    source, digest = cache.get(Child)
+    assert source == textwrap.dedent(inspect.getsource(Child))
+    assert digest == hashlib.sha256(source.encode("utf-8")).hexdigest()
+    assert cache.info() == (0, 1, 1)
+
+
+def test_functions_wrapped_by_the_same_decorator_are_not_confused():
+    cache = _SourceCache()
+    assert first_wrapped.__code__ is second_wrapped.__code__
+    assert cache.get(first_wrapped)[0].endswith(
+        "def first_wrapped(value):\n    return value\n"
+    )
+    assert cache.get(second_wrapped)[0].endswith(
+        "def second_wrapped(value):\n    return value + 1\n"
+    )
+    source_cache_clear()
+    extract_code(first_wrapped)
+    extracted_code = _ExtractedCode.from_string(extract_code(second_wrapped))
+    assert extracted_code.name == "second_wrapped"
+    assert "def second_wrapped(value)" in extracted_code.code
+    assert "first_wrapped" not in extracted_code.code
+
+
+def test_code_entries_are_evicted_with_their_functions():
+    cache = _SourceCache()
+    namespace = {}
+    exec("def temporary():\n    return 1\n", namespace)
+    with pytest.raises(OSError):
+        cache.get(namespace["temporary"])
+    assert cache.info().currsize == 1
+    namespace.clear()
+    gc.collect()
+    assert cache.info().currsize == 0
+
+
+def test_repeated_lookups_hit_cache():
+    cache = _SourceCache()
+    first = cache.get(function_with_dependencies)
+    second = cache.get(function_with_dependencies)
+    assert first == second
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_missing_source_is_cached():
+    cache = _SourceCache()
+    namespace = {}
+    exec("def no_source():\n    return 1\n", namespace)
+    with pytest.raises(OSError):
+        cache.get(namespace["no_source"])
+    with pytest.raises(OSError):
+        cache.get(namespace["no_source"])
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_extraction_reuses_cached_sources():
+    source_cache_clear()
+    extract_code(function_with_dependencies)
+    first_run = source_cache_info()
+    extract_code(function_with_dependencies)
+    second_run = source_cache_info()
+    assert second_run.misses == first_run.misses
+    assert second_run.hits > first_run.hits
+
+
+def test_cached_sources_keep_decorators_of_dependency_methods(tmp_path, monkeypatch):
+    (tmp_path / "decorated_module.py").write_text(DECORATED_MODULE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    module = importlib.import_module("decorated_module")
+    try:
+        source_cache_clear()
+        cold = extract_code(module.target)
+        warm = extract_code(module.target)
+    finally:
+        del sys.modules["decorated_module"]
+    assert cold == warm
+    extracted_code = _ExtractedCode.from_string(warm)
+    assert "import functools" in extracted_code.imports
+    assert any(
+        dependency.startswith("def deco(") for dependency in extracted_code.dependencies
+    )
+    assert load_code(warm)() == 20
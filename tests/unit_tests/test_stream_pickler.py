@@ -0,0 +1,118 @@
+# Python package to extract source code from live object.
+# Copyright (C) 2022 Matteo Dell'Acqua
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import io
+import json
+import pickle
+
+import pytest
+
+from code_extractor.loader.shared import _StreamNamespace
+from code_extractor.pickle import StreamPickler, StreamUnpickler
+
+SCALE = 3
+
+
+def scale(value):
+    return json.loads(json.dumps(value * SCALE))
+
+
+def first(value):
+    return scale(value) + 1
+
+
+def second(value):
+    return scale(value) + 2
+
+
+def third(value):
+    return first(value) + second(value)
+
+
+def scaled(method):
+    def wrapper(self):
+        return method(self) * 10
+
+    return wrapper
+
+
+class Model:
+    factor = SCALE
+
+    @scaled
+    def value(self):
+        return self.factor
+
+
+def test_dependencies_are_written_once():
+    file = io.BytesIO()
+    pickler = StreamPickler(file)
+    pickler.dump(first)
+    size = len(file.getvalue())
+    pickler.dump(second)
+    pickler.dump([first, second])
+    assert file.getvalue().count(b"def scale") == 1
+    assert len(file.getvalue()) < 2 * size
+    pickler.dump(third)
+    file.seek(0)
+    unpickler = StreamUnpickler(file)
+    loaded_first = unpickler.load()
+    loaded_second = unpickler.load()
+    assert unpickler.load() == [loaded_first, loaded_second]
+    loaded_third = unpickler.load()
+    assert (loaded_first(1), loaded_second(1), loaded_third(1)) == (4, 5, 9)
+    assert loaded_first.__globals__["scale"] is loaded_second.__globals__["scale"]
+    assert loaded_third.__globals__["first"] is not loaded_first
+
+
+def test_conflicting_definitions_are_not_shared(make_extracted_code):
+    def extracted(name, dependencies, imports=()):
+        code = f"def {name}():\n    return helper()\n"
+        return make_extracted_code(name, code, imports, dependencies)
+
+    namespace = _StreamNamespace()
+    one = namespace.overlay(
+        extracted("one", ["def helper():\n    return 1\n", "import os.path"])
+    )
+    assert one is not None
+    assert (
+        namespace.overlay(extracted("two", ["def helper():\n    return 2\n"])) is None
+    )
+    three = namespace.overlay(
+        extracted("three", ["def helper():\n    return 1\n"], ["import os"])
+    )
+    assert three is not None
+    assert three["helper"] is one["helper"]
+
+
+def test_stream_requires_stream_unpickler():
+    file = io.BytesIO()
+    StreamPickler(file).dump(first)
+    file.seek(0)
+    with pytest.raises(ValueError):
+        pickle.load(file)
+
+
+def test_class_bodies_see_stream_names():
+    file = io.BytesIO()
+    pickler = StreamPickler(file)
+    pickler.dump(first)
+    pickler.dump(Model)
+    file.seek(0)
+    unpickler = StreamUnpickler(file)
+    loaded_first = unpickler.load()
+    model = unpickler.load()
+    assert model().value() == 30
+    assert model.value.__globals__["SCALE"] is loaded_first.__globals__["SCALE"]